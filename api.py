@@ -0,0 +1,239 @@
+"""Versioned JSON API for integrations, mounted at ``/api/v1``.
+
+Clients authenticate with ``Authorization: Bearer <API_TOKEN>`` (the
+``API_TOKEN`` environment variable) or a logged-in session.
+
+The professor list takes the same filters as the HTML list and pages with
+the keyset cursors of queries.py: pass ``next_cursor`` back as ``after``.
+``fields=`` limits the columns that are loaded and returned (``id`` is
+always included). ``include=sales_info,custom_fields`` adds related data
+with one extra query per page, not per row. GET responses carry an ETag
+and answer a matching ``If-None-Match`` with 304.
+"""
+import hmac
+import os
+from collections import defaultdict
+from datetime import date, datetime
+
+from flask import Blueprint, abort, jsonify, request, session
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import contains_eager, load_only
+
+from models import db, University, Department, Professor, SalesInfo, CustomField, CustomFieldValue, SALES_STATUSES
+import queries
+import tracking
+
+bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+MAX_BULK = 1000
+
+PROFESSOR_FIELDS = ('id', 'university_id', 'dept_id', 'name', 'title', 'email', 'phone',
+                    'photo_url', 'specialty', 'source_url', 'updated_at')
+INCLUDES = ('sales_info', 'custom_fields')
+SALES_PATCH_FIELDS = ('status', 'last_contact', 'next_contact')
+
+
+# ─── helpers ───
+
+def _fail(status, message, **extra):
+    response = jsonify({'error': message, **extra})
+    response.status_code = status
+    abort(response)
+
+
+def _json(payload):
+    response = jsonify(payload)
+    if request.method == 'GET':
+        response.add_etag()
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.make_conditional(request)
+    return response
+
+
+def _csv_arg(name, allowed):
+    values = [v.strip() for v in request.args.get(name, '').split(',') if v.strip()]
+    unknown = [v for v in values if v not in allowed]
+    if unknown:
+        _fail(400, f'unknown {name}: {", ".join(unknown)}', allowed=list(allowed))
+    return values
+
+
+def _fields():
+    fields = _csv_arg('fields', PROFESSOR_FIELDS)
+    return ['id'] + [f for f in fields if f != 'id'] if fields else None
+
+
+def _limit(default=DEFAULT_LIMIT, maximum=MAX_LIMIT):
+    limit = request.args.get('limit', default, type=int)
+    return max(1, min(limit, maximum))
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _professor_query(fields, includes):
+    # The outer join is needed by the status filter even without include=sales_info
+    query = Professor.query.outerjoin(SalesInfo, SalesInfo.professor_id == Professor.id)
+    if fields:
+        query = query.options(load_only(*(getattr(Professor, f) for f in fields)))
+    if 'sales_info' in includes:
+        query = query.options(contains_eager(Professor.sales_info).selectinload(SalesInfo.tag_links))
+    return query
+
+
+def _professor_items(professors, fields, includes):
+    values = defaultdict(dict)
+    if 'custom_fields' in includes and professors:
+        for professor_id, field_id, value in db.session.execute(
+            select(CustomFieldValue.professor_id, CustomFieldValue.custom_field_id, CustomFieldValue.value)
+            .where(CustomFieldValue.professor_id.in_([p.id for p in professors]))
+        ):
+            values[professor_id][str(field_id)] = value
+
+    items = []
+    for prof in professors:
+        item = {f: _value(getattr(prof, f)) for f in fields} if fields else prof.to_dict()
+        if 'sales_info' in includes:
+            item['sales_info'] = prof.sales_info.to_dict() if prof.sales_info else None
+        if 'custom_fields' in includes:
+            item['custom_fields'] = values.get(prof.id, {})
+        items.append(item)
+    return items
+
+
+@bp.before_request
+def _authenticate():
+    if session.get('logged_in'):
+        return None
+    token = os.environ.get('API_TOKEN', '')
+    header = request.headers.get('Authorization', '')
+    if token and header.startswith('Bearer ') and hmac.compare_digest(header[7:].strip(), token):
+        return None
+    response = jsonify({'error': 'authentication required'})
+    response.status_code = 401
+    response.headers['WWW-Authenticate'] = 'Bearer'
+    return response
+
+
+# ─── read ───
+
+@bp.route('/professors')
+def list_professors():
+    fields, includes = _fields(), _csv_arg('include', INCLUDES)
+    after = request.args.get('after')
+    query, keys = queries.apply_filters(_professor_query(fields, includes),
+                                        queries.filters_from_args(request.args))
+    # Checked against this request's ordering: a cursor of another sort or search is invalid too
+    if after and queries.decode_cursor(after, keys) is None:
+        _fail(400, 'invalid cursor')
+    professors, next_cursor = queries.keyset_page(query, after=after, size=_limit(), keys=keys)
+    return _json({'data': _professor_items(professors, fields, includes), 'next_cursor': next_cursor})
+
+
+@bp.route('/professors/<int:pid>')
+def get_professor(pid):
+    fields, includes = _fields(), _csv_arg('include', INCLUDES)
+    prof = _professor_query(fields, includes).filter(Professor.id == pid).first()
+    if prof is None:
+        _fail(404, 'professor not found')
+    return _json({'data': _professor_items([prof], fields, includes)[0]})
+
+
+@bp.route('/universities')
+def list_universities():
+    return _json({'data': [u.to_dict() for u in University.query.order_by(University.id)]})
+
+
+@bp.route('/departments')
+def list_departments():
+    query = Department.query.order_by(Department.id)
+    university_id = request.args.get('university_id', type=int)
+    if university_id:
+        query = query.filter(Department.university_id == university_id)
+    return _json({'data': [d.to_dict() for d in query]})
+
+
+@bp.route('/custom_fields')
+def list_custom_fields():
+    fields = CustomField.query.order_by(CustomField.order, CustomField.id)
+    return _json({'data': [f.to_dict() for f in fields]})
+
+
+@bp.route('/changes')
+def list_changes():
+    """Delta sync feed: rows changed or deleted since ``since`` (a token from
+    the previous response; omit it for a full sync). See tracking.py."""
+    page = tracking.changes_since(request.args.get('since', ''),
+                                  limit=_limit(tracking.DEFAULT_LIMIT, tracking.MAX_LIMIT))
+    if page is None:
+        _fail(400, 'invalid since token')
+    return _json(page)
+
+
+# ─── bulk sales update ───
+
+def _sales_values(item):
+    values = {}
+    for key in SALES_PATCH_FIELDS:
+        if key not in item:
+            continue
+        value = item[key]
+        if key == 'status':
+            if value not in SALES_STATUSES:
+                raise ValueError(f'status must be one of {", ".join(SALES_STATUSES)}')
+        elif value is not None:
+            try:
+                value = date.fromisoformat(value)
+            except (TypeError, ValueError):
+                raise ValueError(f'{key} must be YYYY-MM-DD or null') from None
+        values[key] = value
+    if not values:
+        raise ValueError(f'nothing to update (expected {", ".join(SALES_PATCH_FIELDS)})')
+    return values
+
+
+@bp.route('/professors/sales', methods=['PATCH'])
+def patch_sales():
+    """Update the sales status / contact dates of many professors at once.
+
+    The body is a JSON array of ``{"professor_id": 1, "status": "商談中",
+    "next_contact": "2025-04-01"}`` objects. Either every item is applied
+    or, if any is invalid, none is.
+    """
+    items = request.get_json(silent=True)
+    if not isinstance(items, list) or not items:
+        _fail(400, 'body must be a non-empty JSON array')
+    if len(items) > MAX_BULK:
+        _fail(400, f'at most {MAX_BULK} items per request')
+
+    changes, errors = {}, []
+    for index, item in enumerate(items):
+        try:
+            professor_id = item.get('professor_id') if isinstance(item, dict) else None
+            # bool is an int subclass: true would update professor 1
+            if not isinstance(professor_id, int) or isinstance(professor_id, bool):
+                raise ValueError('professor_id (integer) is required')
+            changes.setdefault(professor_id, {}).update(_sales_values(item))
+        except ValueError as e:
+            errors.append({'index': index, 'error': str(e)})
+    if not errors:
+        known = set(db.session.scalars(select(Professor.id).where(Professor.id.in_(changes))))
+        errors = [{'professor_id': pid, 'error': 'professor not found'} for pid in changes if pid not in known]
+    if errors:
+        _fail(400, 'invalid items; nothing was updated', errors=errors)
+
+    existing = dict(db.session.execute(
+        select(SalesInfo.professor_id, SalesInfo.id).where(SalesInfo.professor_id.in_(changes))
+    ).all())
+    updates = [dict(values, id=existing[pid]) for pid, values in changes.items() if pid in existing]
+    inserts = [dict({'status': queries.DEFAULT_STATUS}, **values, professor_id=pid)
+               for pid, values in changes.items() if pid not in existing]
+    if updates:
+        db.session.execute(update(SalesInfo), updates)
+    if inserts:
+        db.session.execute(insert(SalesInfo), inserts)
+    db.session.commit()
+    return jsonify({'updated': len(updates), 'created': len(inserts)})
@@ -1,32 +1,61 @@
 import os
 from functools import wraps
 from datetime import datetime, date
-from flask import (Flask, render_template, request, redirect, url_for,
-                   flash, jsonify, session)
-from models import db, University, Department, Professor, SalesInfo, CustomField, CustomFieldValue, SALES_STATUSES
-import scraper
+from flask import (Flask, Response, abort, render_template, stream_template, stream_with_context,
+                   request, redirect, url_for, flash, jsonify, session)
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, selectinload
+from models import (db, University, Department, Professor, SalesInfo, SalesInfoTag, Tag, CustomField,
+                    CustomFieldValue, Job, ProfessorChange, SALES_STATUSES, CHANGE_KINDS)
+from cache import SnapshotCache
+import api
+import custom_values
+import db_config
+import dedup
+import export
+import importer
+import instrumentation
+import jobs
+import migrations
+import photos
+import queries
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
 
-# DB設定
-database_url = os.environ.get('DATABASE_URL', 'sqlite:///sales.db')
-# postgres:// → postgresql+pg8000:// に変換（Supabase/Render対応）
-if database_url.startswith('postgres://'):
-    database_url = database_url.replace('postgres://', 'postgresql+pg8000://', 1)
-elif database_url.startswith('postgresql://'):
-    database_url = database_url.replace('postgresql://', 'postgresql+pg8000://', 1)
-# pg8000非対応のSupabaseパラメータを除去
-import re
-database_url = re.sub(r'[?&]pgbouncer=\w+', '', database_url)
-
-app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+# DB設定（接続URL・プール・タイムアウトは環境変数から。詳細は db_config.py）
+db_config.configure(app)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# スクレイピング時に辿る学内リンクの深さ（0 = 指定URLのみ）
+app.config['SCRAPE_CRAWL_DEPTH'] = int(os.environ.get('SCRAPE_CRAWL_DEPTH', 1))
+# 計測: この時間を超えたリクエスト / クエリをログに出す（ミリ秒）、同一SQLがこの回数を超えたらN+1として警告
+app.config['SLOW_REQUEST_MS'] = int(os.environ.get('SLOW_REQUEST_MS', instrumentation.SLOW_REQUEST_MS))
+app.config['SLOW_QUERY_MS'] = int(os.environ.get('SLOW_QUERY_MS', instrumentation.SLOW_QUERY_MS))
+app.config['N_PLUS_ONE_THRESHOLD'] = int(os.environ.get('N_PLUS_ONE_THRESHOLD', instrumentation.N_PLUS_ONE_THRESHOLD))
 
 db.init_app(app)
-
-with app.app_context():
-    db.create_all()
+instrumentation.init_app(app)
+# 連携用 JSON API（/api/v1、API_TOKEN またはログインセッションで認証）
+app.register_blueprint(api.bp)
+app.cli.add_command(importer.import_command)
+# スキーマの作成・更新は import 時には行わない（デプロイ時に `flask --app app db upgrade`）
+app.cli.add_command(migrations.db_command)
+# 未取得の教授写真のサムネイル作成（通常はスクレイピング後にジョブで自動実行）
+app.cli.add_command(photos.photos_command)
+
+
+def create_app():
+    """WSGIエントリポイント（gunicorn 'app:create_app()'）。
+
+    DBエンジンのリスナー（statement_timeout・プール計測）の登録とワーカースレッドの起動はここで行い、
+    import 時には行わない（`flask db upgrade` などのCLIに適用しないため）。同じプロセスで何度呼んでもよい。
+    """
+    if 'sales_app' not in app.extensions:
+        db_config.init_engine(app, db)
+        # JOB_WORKER_THREAD=1 ならワーカーをWebプロセス内のスレッドで動かす（単一プロセス構成向け）
+        worker_thread = os.environ.get('JOB_WORKER_THREAD', '') not in ('', '0', 'false')
+        app.extensions['sales_app'] = {'worker_thread': jobs.start_worker_thread(app) if worker_thread else None}
+    return app
 
 
 # ─────────────────────────────────────────────
@@ -84,52 +113,77 @@ def parse_date(s):
         return None
 
 
+DUPLICATE_PROFESSOR_MESSAGE = '同じ大学に同じ氏名の教授が既に登録されています'
+
+
 def ensure_sales_info(professor):
+    """営業情報が無ければ作成する（保存時のみ呼ぶ。コミットは呼び出し側）"""
     if professor.sales_info is None:
-        si = SalesInfo(professor_id=professor.id, status='未接触', tags=[])
-        db.session.add(si)
-        db.session.commit()
+        professor.sales_info = SalesInfo(status='未接触')
     return professor.sales_info
 
 
+# タグ入力の候補。タグ付けへの書き込みがあれば破棄する
+tag_names_cache = SnapshotCache(ttl=300)
+tag_names_cache.invalidate_on_write(SalesInfo, SalesInfoTag, Tag)
+
+
+def all_tag_names():
+    return tag_names_cache.get_or_compute('all', queries.all_tag_names)
+
+
 # ─────────────────────────────────────────────
 # ダッシュボード
 # ─────────────────────────────────────────────
 
+# 集計結果を短時間キャッシュし、教授・営業情報・大学への書き込みで破棄する
+dashboard_cache = SnapshotCache(ttl=int(os.environ.get('DASHBOARD_CACHE_TTL', 30)))
+dashboard_cache.invalidate_on_write(Professor, SalesInfo, University)
+
+
+def dashboard_snapshot(today):
+    status_rows = db.session.query(queries.status_expr(), db.func.count(Professor.id)).outerjoin(
+        SalesInfo, SalesInfo.professor_id == Professor.id
+    ).group_by(queries.status_expr()).all()
+    status_counts = {status: count for status, count in status_rows}
+
+    univ_counts = [
+        {'id': uid, 'name': name, 'count': count}
+        for uid, name, count in db.session.query(
+            University.id, University.name, db.func.count(Professor.id)
+        ).outerjoin(Professor, Professor.university_id == University.id)
+        .group_by(University.id, University.name).order_by(University.id)
+    ]
+
+    upcoming = [
+        {
+            'professor_id': si.professor_id,
+            'name': name,
+            'university_name': university_name,
+            'status': si.status,
+            'next_contact': si.next_contact,
+        }
+        for si, name, university_name in db.session.query(SalesInfo, Professor.name, University.name)
+        .join(Professor, Professor.id == SalesInfo.professor_id)
+        .join(University, University.id == Professor.university_id)
+        .filter(SalesInfo.next_contact >= today)
+        .order_by(SalesInfo.next_contact).limit(10)
+    ]
+
+    return {
+        'total_professors': sum(status_counts.values()),
+        'status_counts': status_counts,
+        'univ_counts': univ_counts,
+        'upcoming': upcoming,
+    }
+
+
 @app.route('/')
 @login_required
 def dashboard():
-    universities = University.query.all()
-    total_professors = Professor.query.count()
-
-    status_counts = {}
-    for status in SALES_STATUSES:
-        count = SalesInfo.query.filter_by(status=status).count()
-        status_counts[status] = count
-    no_info_count = Professor.query.filter(
-        ~Professor.id.in_(db.session.query(SalesInfo.professor_id))
-    ).count()
-    if no_info_count > 0:
-        status_counts['未接触'] = status_counts.get('未接触', 0) + no_info_count
-
-    univ_counts = []
-    for u in universities:
-        univ_counts.append({'name': u.name, 'count': len(u.professors)})
-
     today = date.today()
-    upcoming = SalesInfo.query.filter(
-        SalesInfo.next_contact >= today
-    ).order_by(SalesInfo.next_contact).limit(10).all()
-
-    return render_template(
-        'dashboard.html',
-        universities=universities,
-        total_professors=total_professors,
-        status_counts=status_counts,
-        univ_counts=univ_counts,
-        upcoming=upcoming,
-        statuses=SALES_STATUSES,
-    )
+    snapshot = dashboard_cache.get_or_compute(('dashboard', today), lambda: dashboard_snapshot(today))
+    return render_template('dashboard.html', statuses=SALES_STATUSES, **snapshot)
 
 
 # ─────────────────────────────────────────────
@@ -140,7 +194,10 @@ def dashboard():
 @login_required
 def universities():
     univs = University.query.order_by(University.name).all()
-    return render_template('universities.html', universities=univs)
+    latest_ids = db.session.query(db.func.max(Job.id)).filter(
+        Job.kind == 'scrape').group_by(Job.university_id)
+    latest_jobs = {job.university_id: job for job in Job.query.filter(Job.id.in_(latest_ids))}
+    return render_template('universities.html', universities=univs, latest_jobs=latest_jobs)
 
 
 @app.route('/universities/new', methods=['GET', 'POST'])
@@ -195,33 +252,125 @@ def scrape_university(uid):
         flash('大学のURLが登録されていません', 'danger')
         return redirect(url_for('universities'))
 
-    professors, error = scraper.scrape_university(u.url)
-    if error:
-        flash(f'スクレイピングエラー: {error}', 'danger')
-        return redirect(url_for('universities'))
+    job = Job.query.filter(Job.university_id == u.id, Job.kind == 'scrape',
+                           Job.status.in_(['queued', 'running'])).first()
+    if job is None:
+        job = jobs.enqueue('scrape', university_id=u.id)
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(job.to_dict()), 202
+    flash(f'スクレイピングを開始しました（ジョブ #{job.id}）', 'info')
+    return redirect(url_for('universities'))
 
-    added = 0
-    for p_data in professors:
-        existing = Professor.query.filter_by(
-            university_id=u.id, name=p_data['name']
-        ).first()
-        if not existing:
-            prof = Professor(
-                university_id=u.id,
-                name=p_data['name'],
-                title=p_data.get('title', ''),
-                email=p_data.get('email', ''),
-                phone=p_data.get('phone', ''),
-                photo_url=p_data.get('photo_url', ''),
-                specialty=p_data.get('specialty', ''),
-                source_url=p_data.get('source_url', ''),
-            )
-            db.session.add(prof)
-            added += 1
 
+# ─────────────────────────────────────────────
+# ジョブ
+# ─────────────────────────────────────────────
+
+@app.route('/jobs')
+@login_required
+def job_list():
+    recent = Job.query.order_by(Job.id.desc()).limit(50).all()
+    return jsonify([job.to_dict() for job in recent])
+
+
+@app.route('/jobs/<int:job_id>')
+@login_required
+def job_status(job_id):
+    job = Job.query.get_or_404(job_id)
+    return jsonify(job.to_dict())
+
+
+# ─────────────────────────────────────────────
+# 変更履歴（再スクレイピングで検出した追加・変更・掲載終了）
+# ─────────────────────────────────────────────
+
+CHANGES_PER_PAGE = 100
+CHANGE_LABELS = {'added': '追加', 'changed': '変更', 'disappeared': '掲載終了', 'returned': '再掲載', 'merged': '統合'}
+FIELD_LABELS = {'name': '氏名', 'title': '職位', 'email': 'メール', 'phone': '電話', 'photo_url': '写真', 'specialty': '専門'}
+
+
+@app.route('/changes')
+@login_required
+def change_log():
+    university_id = request.args.get('university_id', type=int)
+    kind = request.args.get('kind', '')
+    before = request.args.get('before', type=int)
+
+    query = ProfessorChange.query.options(
+        selectinload(ProfessorChange.professor).selectinload(Professor.university))
+    if university_id:
+        query = query.filter(ProfessorChange.university_id == university_id)
+    if kind in CHANGE_KINDS:
+        query = query.filter(ProfessorChange.kind == kind)
+    if before:
+        query = query.filter(ProfessorChange.id < before)
+    changes = query.order_by(ProfessorChange.id.desc()).limit(CHANGES_PER_PAGE + 1).all()
+    next_before = changes[CHANGES_PER_PAGE - 1].id if len(changes) > CHANGES_PER_PAGE else None
+
+    return render_template(
+        'changes.html',
+        changes=changes[:CHANGES_PER_PAGE],
+        next_before=next_before,
+        universities=University.query.order_by(University.name).all(),
+        kinds=CHANGE_KINDS,
+        change_labels=CHANGE_LABELS,
+        field_labels=FIELD_LABELS,
+        current_university_id=university_id,
+        current_kind=kind,
+    )
+
+
+# ─────────────────────────────────────────────
+# 重複候補（表記ゆれ・複数学科への重複掲載。判定は dedup.py）
+# ─────────────────────────────────────────────
+
+DUPLICATE_GROUPS_PER_PAGE = 50
+DUPLICATE_REASONS = {'name': '氏名', 'email': 'メール'}
+
+
+@app.route('/duplicates')
+@login_required
+def duplicates():
+    university_id = request.args.get('university_id', type=int)
+    groups = dedup.find_duplicates(university_id)
+    shown = groups[:DUPLICATE_GROUPS_PER_PAGE]
+    ids = [pid for group in shown for pid in group['ids']]
+    professors = {p.id: p for p in Professor.query.options(
+        joinedload(Professor.university),
+        joinedload(Professor.department),
+        joinedload(Professor.sales_info).selectinload(SalesInfo.tag_links),
+    ).filter(Professor.id.in_(ids))} if ids else {}
+    return render_template(
+        'duplicates.html',
+        groups=[dict(group, professors=[professors[pid] for pid in group['ids']]) for group in shown],
+        total=len(groups),
+        reasons=DUPLICATE_REASONS,
+        universities=University.query.order_by(University.name).all(),
+        current_university_id=university_id,
+    )
+
+
+@app.route('/duplicates/merge', methods=['POST'])
+@login_required
+def merge_duplicates():
+    keep_id = request.form.get('keep_id', type=int)
+    ids = request.form.getlist('ids', type=int)
+    kept = dedup.merge(keep_id, ids) if keep_id in ids else None
+    if kept is None:
+        flash('統合する教授が見つかりません（既に統合・削除された可能性があります）', 'danger')
+    else:
+        db.session.commit()
+        flash(f'{len(ids) - 1}件を「{kept.name}」に統合しました', 'success')
+    return redirect(url_for('duplicates', university_id=request.form.get('university_id', type=int)))
+
+
+@app.route('/duplicates/dismiss', methods=['POST'])
+@login_required
+def dismiss_duplicates():
+    dedup.dismiss(request.form.getlist('ids', type=int))
     db.session.commit()
-    flash(f'スクレイピング完了: {added}件追加（重複スキップ含む）', 'success')
-    return redirect(url_for('universities'))
+    flash('重複ではないとして候補から外しました', 'info')
+    return redirect(url_for('duplicates', university_id=request.form.get('university_id', type=int)))
 
 
 # ─────────────────────────────────────────────
@@ -253,59 +402,53 @@ def new_department(uid):
 # 教授一覧
 # ─────────────────────────────────────────────
 
+# 一覧の件数（フィルター条件ごと）。ページ送りのたびに全件を数えないよう短時間キャッシュする
+professor_count_cache = SnapshotCache(ttl=int(os.environ.get('PROFESSOR_COUNT_CACHE_TTL', 60)))
+professor_count_cache.invalidate_on_write(Professor, SalesInfo, SalesInfoTag, CustomFieldValue)
+
+
 @app.route('/professors')
 @login_required
 def professors():
-    query = Professor.query
-
-    univ_id = request.args.get('university_id', type=int)
-    dept_id = request.args.get('dept_id', type=int)
-    status = request.args.get('status', '')
-    tag = request.args.get('tag', '')
-    search = request.args.get('q', '').strip()
-
-    if univ_id:
-        query = query.filter_by(university_id=univ_id)
-    if dept_id:
-        query = query.filter_by(dept_id=dept_id)
-    if search:
-        query = query.filter(
-            db.or_(
-                Professor.name.contains(search),
-                Professor.specialty.contains(search),
-                Professor.email.contains(search),
-            )
-        )
-
-    profs = query.order_by(Professor.university_id, Professor.name).all()
-
-    if status:
-        profs = [p for p in profs if p.sales_info and p.sales_info.status == status
-                 or (not p.sales_info and status == '未接触')]
-    if tag:
-        profs = [p for p in profs if p.sales_info and tag in p.sales_info.tags]
+    filters = queries.filters_from_args(request.args)
+    query, sort_keys = queries.professor_query(filters)
+    count_key = tuple(sorted((key, value) for key, value in filters.items() if value and key != 'sort'))
+    total = professor_count_cache.get_or_compute(count_key, lambda: query.order_by(None).count())
+    profs, next_cursor = queries.keyset_page(query, after=request.args.get('after'), keys=sort_keys)
 
     universities = University.query.order_by(University.name).all()
     departments = Department.query.all()
-
-    all_tags = set()
-    for si in SalesInfo.query.all():
-        all_tags.update(si.tags)
+    custom_fields = CustomField.query.order_by(CustomField.order, CustomField.id).all()
 
     return render_template(
         'professors.html',
         professors=profs,
+        total=total,
+        next_cursor=next_cursor,
         universities=universities,
         departments=departments,
         statuses=SALES_STATUSES,
-        all_tags=sorted(all_tags),
-        current_filters={
-            'university_id': univ_id,
-            'dept_id': dept_id,
-            'status': status,
-            'tag': tag,
-            'q': search,
-        },
+        all_tags=all_tag_names(),
+        custom_fields=custom_fields,
+        custom_filter_count=sum(1 for key in filters if queries.CUSTOM_FILTER_RE.match(key)),
+        current_filters=filters,
+    )
+
+
+@app.route('/professors/export')
+@login_required
+def export_professors():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in export.FORMATS:
+        abort(400)
+    _writer, mimetype, extension = export.FORMATS[fmt]
+    filters = queries.filters_from_args(request.args)
+    filename = f'professors_{date.today():%Y%m%d}.{extension}'
+    # 一覧と同じ条件で、バッチごとに生成しながらチャンク送信する
+    return Response(
+        stream_with_context(export.generate(fmt, filters)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
     )
 
 
@@ -332,7 +475,14 @@ def new_professor():
             source_url=request.form.get('source_url', '').strip(),
         )
         db.session.add(prof)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            flash(DUPLICATE_PROFESSOR_MESSAGE, 'danger')
+            return redirect(url_for('new_professor'))
+        if prof.photo_url:
+            jobs.enqueue_photos(prof.university_id)
         flash(f'「{prof.name}」を登録しました', 'success')
         return redirect(url_for('professor_detail', pid=prof.id))
     universities = University.query.order_by(University.name).all()
@@ -340,23 +490,53 @@ def new_professor():
     return render_template('professor_form.html', professor=None, universities=universities, departments=departments)
 
 
+# ─────────────────────────────────────────────
+# 教授写真（ローカルのサムネイル。ファイル名が内容のハッシュなので長期キャッシュ可）
+# ─────────────────────────────────────────────
+
+@app.route('/photos/<digest>.jpg')
+@login_required
+def photo(digest):
+    response = photos.send_thumbnail(digest)
+    if response is None:
+        # 画像が失われていても元サイトには取りに行かず、ジョブで作り直す
+        for university_id in photos.forget(digest):
+            jobs.enqueue_photos(university_id)
+        db.session.commit()
+        response = photos.placeholder()
+    return response
+
+
 # ─────────────────────────────────────────────
 # 教授詳細
 # ─────────────────────────────────────────────
 
+# 詳細ページに表示する変更履歴の件数（全件は変更履歴ページ）
+RECENT_CHANGES = 10
+
+
 @app.route('/professors/<int:pid>')
 @login_required
 def professor_detail(pid):
-    prof = Professor.query.get_or_404(pid)
-    ensure_sales_info(prof)
-    db.session.refresh(prof)
-
-    custom_fields = CustomField.query.order_by(CustomField.order, CustomField.id).all()
-    cf_values = {cfv.custom_field_id: cfv.value for cfv in prof.custom_field_values}
-
-    all_tags = set()
-    for si in SalesInfo.query.all():
-        all_tags.update(si.tags)
+    # 表示だけでは書き込まない。営業情報が無ければテンプレート側で既定値（未接触）を表示し、保存時に作成する
+    # 教授（大学・学科・営業情報・タグを JOIN）、カスタム項目と値、直近の変更履歴の3クエリ
+    prof = Professor.query.options(
+        joinedload(Professor.university),
+        joinedload(Professor.department),
+        joinedload(Professor.sales_info).joinedload(SalesInfo.tag_links),
+    ).filter(Professor.id == pid).first_or_404()
+
+    rows = db.session.execute(
+        db.select(CustomField, CustomFieldValue.value)
+        .outerjoin(CustomFieldValue, db.and_(CustomFieldValue.custom_field_id == CustomField.id,
+                                             CustomFieldValue.professor_id == pid))
+        .order_by(CustomField.order, CustomField.id)
+    ).all()
+    custom_fields = [cf for cf, _value in rows]
+    cf_values = {cf.id: value for cf, value in rows if value is not None}
+
+    recent_changes = (ProfessorChange.query.filter(ProfessorChange.professor_id == pid)
+                      .order_by(ProfessorChange.id.desc()).limit(RECENT_CHANGES).all())
 
     return render_template(
         'professor_detail.html',
@@ -364,7 +544,10 @@ def professor_detail(pid):
         statuses=SALES_STATUSES,
         custom_fields=custom_fields,
         cf_values=cf_values,
-        all_tags=sorted(all_tags),
+        recent_changes=recent_changes,
+        all_tags=all_tag_names(),
+        change_labels=CHANGE_LABELS,
+        field_labels=FIELD_LABELS,
     )
 
 
@@ -382,7 +565,14 @@ def edit_professor(pid):
         prof.photo_url = request.form.get('photo_url', '').strip()
         prof.specialty = request.form.get('specialty', '').strip()
         prof.source_url = request.form.get('source_url', '').strip()
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            flash(DUPLICATE_PROFESSOR_MESSAGE, 'danger')
+            return redirect(url_for('edit_professor', pid=pid))
+        if prof.photo_url and prof.photo_url != prof.photo_source:
+            jobs.enqueue_photos(prof.university_id)
         flash('教授情報を更新しました', 'success')
         return redirect(url_for('professor_detail', pid=pid))
     universities = University.query.order_by(University.name).all()
@@ -422,20 +612,8 @@ def update_sales(pid):
 @app.route('/professors/<int:pid>/custom_fields', methods=['POST'])
 @login_required
 def update_custom_fields(pid):
-    prof = Professor.query.get_or_404(pid)
-    custom_fields = CustomField.query.all()
-
-    for cf in custom_fields:
-        value = request.form.get(f'cf_{cf.id}', '').strip()
-        existing = CustomFieldValue.query.filter_by(
-            professor_id=pid, custom_field_id=cf.id
-        ).first()
-        if existing:
-            existing.value = value
-        else:
-            cfv = CustomFieldValue(professor_id=pid, custom_field_id=cf.id, value=value)
-            db.session.add(cfv)
-
+    Professor.query.get_or_404(pid)
+    custom_values.save_values(pid, custom_values.values_from_form(request.form))
     db.session.commit()
     flash('カスタムフィールドを更新しました', 'success')
     return redirect(url_for('professor_detail', pid=pid))
@@ -478,9 +656,13 @@ def new_custom_field():
 def edit_custom_field(cfid):
     cf = CustomField.query.get_or_404(cfid)
     cf.name = request.form.get('name', cf.name).strip()
+    old_type = cf.field_type
     cf.field_type = request.form.get('field_type', cf.field_type)
     options_raw = request.form.get('options', '')
     cf.options = [o.strip() for o in options_raw.split(',') if o.strip()]
+    if cf.field_type != old_type:
+        # 絞り込み・並び替え用の型付き列を新しい型で作り直す
+        custom_values.refresh_typed(cf)
     db.session.commit()
     flash('フィールドを更新しました', 'success')
     return redirect(url_for('custom_fields'))
@@ -499,11 +681,12 @@ def delete_custom_field(cfid):
 @app.route('/custom_fields/reorder', methods=['POST'])
 @login_required
 def reorder_custom_fields():
-    order_data = request.json
-    for item in order_data:
-        cf = CustomField.query.get(item['id'])
-        if cf:
-            cf.order = item['order']
+    order_data = request.get_json(silent=True)
+    try:
+        positions = {int(item['id']): int(item['order']) for item in order_data}
+    except (TypeError, KeyError, ValueError):
+        return jsonify({'status': 'error', 'message': '不正な並び順データです'}), 400
+    custom_values.reorder(positions)
     db.session.commit()
     return jsonify({'status': 'ok'})
 
@@ -515,31 +698,33 @@ def reorder_custom_fields():
 @app.route('/print')
 @login_required
 def print_view():
-    univ_id = request.args.get('university_id', type=int)
-    status = request.args.get('status', '')
-
-    query = Professor.query
-    if univ_id:
-        query = query.filter_by(university_id=univ_id)
-
-    profs = query.order_by(Professor.university_id, Professor.name).all()
-    if status:
-        profs = [p for p in profs if p.sales_info and p.sales_info.status == status
-                 or (not p.sales_info and status == '未接触')]
+    filters = {
+        'professor_id': request.args.get('professor_id', type=int),
+        'university_id': request.args.get('university_id', type=int),
+        'status': request.args.get('status', ''),
+    }
+    query, sort_keys = queries.professor_query(filters)
+    total = query.order_by(None).count()
+    query = query.options(selectinload(Professor.custom_field_values))
 
     custom_fields = CustomField.query.order_by(CustomField.order, CustomField.id).all()
     universities = University.query.order_by(University.name).all()
 
-    return render_template(
+    # 全件をメモリに載せず、バッチ単位で読み込みながら逐次描画して送る
+    return stream_template(
         'print.html',
-        professors=profs,
+        professors=queries.iter_batched(query, keys=sort_keys),
+        total=total,
         custom_fields=custom_fields,
         universities=universities,
         statuses=SALES_STATUSES,
-        current_filters={'university_id': univ_id, 'status': status},
+        current_filters=filters,
     )
 
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=False)
+    # ローカル起動ではその場でスキーマを作成・更新する
+    with app.app_context():
+        migrations.upgrade()
+    create_app().run(host='0.0.0.0', port=port, debug=False)
@@ -0,0 +1,199 @@
+"""Time the hot Flask endpoints against generated databases.
+
+For each size (1k, 10k and 100k professors by default) a worker process
+builds or reuses benchmarks/.data/bench-<size>.db, logs in through the
+test client and requests each endpoint a number of times. Every response
+body is read in full inside the timing, so streamed pages (print,
+export) are measured end to end. The report shows the p50 / p95 / p99 /
+max latency, the SQL statements per request, and the tracemalloc peak
+from one extra, separately measured request.
+
+    python -m benchmarks.bench_endpoints [--sizes 1000,10000] [--json out.json]
+    python -m benchmarks.bench_endpoints --compare baseline.json
+"""
+import argparse
+import html
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.data')
+PASSWORD = 'bench'
+
+NEXT_PAGE_RE = re.compile(r'href="(/professors\?after=[^"]+)"')
+
+
+def _list_page(number):
+    """Path of the ``number``-th page of the professor list. The list is
+    keyset paged, so it follows the pager's ``after=`` cursor links."""
+    def resolve(client):
+        path = '/professors'
+        for _ in range(number - 1):
+            match = NEXT_PAGE_RE.search(client.get(path).get_data(as_text=True))
+            if match is None:
+                raise RuntimeError(f'the professor list has fewer than {number} pages')
+            path = html.unescape(match.group(1))
+        return path
+    return resolve
+
+
+# (label, path, repeat); the whole-table pages run fewer times. A path may
+# be a function of the test client, resolved once before timing.
+ENDPOINTS = [
+    ('dashboard', '/', 30),
+    ('professors', '/professors', 30),
+    ('professors_page3', _list_page(3), 30),
+    ('professors_filtered', '/professors?status=商談中&tag=重要', 30),
+    ('professors_search', '/professors?q=情報工学', 30),
+    ('professors_custom', '/professors?cf_1_min=1000000&sort=-cf_1', 30),
+    ('professor_detail', '/professors/1', 30),
+    ('print_university', '/print?university_id=1', 10),
+    ('print_all', '/print', 3),
+    ('export_csv', '/professors/export?format=csv', 3),
+]
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+# ─── worker (one process per database size) ───
+
+def run_worker(size):
+    from benchmarks import datagen
+
+    path = os.path.join(DATA_DIR, f'bench-{size}.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    os.environ['ADMIN_USERNAME'] = 'admin'
+    os.environ['ADMIN_PASSWORD'] = PASSWORD
+    os.environ['DASHBOARD_CACHE_TTL'] = '0'  # measure the queries, not the cache
+    os.environ.setdefault('SLOW_QUERY_MS', '100000')
+    os.environ.setdefault('SLOW_REQUEST_MS', '100000')
+    os.environ.setdefault('N_PLUS_ONE_THRESHOLD', '100000')
+    if not os.path.exists(path):
+        os.makedirs(DATA_DIR, exist_ok=True)
+        start = time.perf_counter()
+        datagen.create(path + '.tmp', size)
+        os.replace(path + '.tmp', path)
+        print(f'generated {path} in {time.perf_counter() - start:.1f}s', file=sys.stderr)
+        # create() pointed the app at the temporary file; start over on the final one
+        os.execv(sys.executable, [sys.executable, '-m', 'benchmarks.bench_endpoints',
+                                  '--worker', str(size)])
+
+    from sqlalchemy import event
+    from app import create_app
+    from models import db
+
+    app = create_app()  # the WSGI app as gunicorn serves it
+
+    queries = [0]
+
+    with app.app_context():
+        @event.listens_for(db.engine, 'after_cursor_execute')
+        def _count(*args):
+            queries[0] += 1
+
+    client = app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': PASSWORD})
+
+    results = {}
+    for label, path, repeat in ENDPOINTS:
+        if callable(path):
+            path = path(client)
+        times, counts, status = [], [], None
+        for i in range(repeat + 1):
+            queries[0] = 0
+            start = time.perf_counter()
+            response = client.get(path)
+            size_bytes = len(response.get_data())
+            elapsed = time.perf_counter() - start
+            response.close()
+            status = response.status_code
+            if i:  # the first request warms caches and is not counted
+                times.append(elapsed * 1000)
+                counts.append(queries[0])
+
+        tracemalloc.start()
+        client.get(path).get_data()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results[label] = {
+            'status': status,
+            'bytes': size_bytes,
+            'p50': statistics.median(times),
+            'p95': _percentile(times, 95),
+            'p99': _percentile(times, 99),
+            'max': max(times),
+            'queries': max(counts),
+            'peak_kb': peak / 1024,
+        }
+    json.dump(results, sys.stdout)
+
+
+# ─── driver ───
+
+def _print_table(size, results, baseline=None):
+    print(f'\n{size} professors')
+    print(f'{"endpoint":22} {"p50":>9} {"p95":>9} {"p99":>9} {"max":>9} {"queries":>7} {"peak":>9} {"size":>9}')
+    for label, r in results.items():
+        line = (f'{label:22} {r["p50"]:7.1f}ms {r["p95"]:7.1f}ms {r["p99"]:7.1f}ms {r["max"]:7.1f}ms '
+                f'{r["queries"]:7} {r["peak_kb"]:7.0f}KB {r["bytes"] / 1024:7.0f}KB')
+        if r['status'] != 200:
+            line += f'  !! HTTP {r["status"]}'
+        old = (baseline or {}).get(label)
+        if old:
+            line += f'  p50 {r["p50"] / old["p50"] - 1:+.0%}, queries {r["queries"] - old["queries"]:+d}'
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000,100000')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', help='show the change against a saved --json file')
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        run_worker(args.worker)
+        return 0
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    report, failures = {}, 0
+    for size in [int(s) for s in args.sizes.split(',')]:
+        proc = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_endpoints', '--worker', str(size)],
+            cwd=ROOT, stdout=subprocess.PIPE, text=True,
+        )
+        if proc.returncode:
+            print(f'{size}: worker failed', file=sys.stderr)
+            failures += 1
+            continue
+        results = json.loads(proc.stdout)
+        report[str(size)] = results
+        failures += sum(r['status'] != 200 for r in results.values())
+        _print_table(size, results, baseline.get(str(size)))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=1)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
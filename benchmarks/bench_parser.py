@@ -0,0 +1,87 @@
+"""Time scraper.parse_professors over the saved corpus.
+
+Each page is decoded the way fetch_page does it (charset detection on a
+requests Response) and then parsed with both engines. The script reports
+the median time per page, checks that the engines agree, and compares
+the result against manifest.json. A changed result exits non-zero.
+
+    python -m benchmarks.bench_parser [--repeat 20]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import scraper  # noqa: E402
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+ENGINES = ('lxml', 'html.parser')
+
+
+def decode(content, declared_charset=None):
+    """Decode ``content`` like fetch_page does for an HTTP response."""
+    resp = requests.models.Response()
+    resp._content = content
+    resp.status_code = 200
+    resp.encoding = declared_charset
+    resp.encoding = scraper._detect_encoding(resp)
+    return resp.text
+
+
+def _median_ms(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    with open(os.path.join(CORPUS_DIR, 'manifest.json'), encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    failures = 0
+    totals = dict.fromkeys(('decode',) + ENGINES, 0.0)
+    print(f'{"page":20} {"KB":>5} {"decode":>8} ' + ' '.join(f'{e:>12}' for e in ENGINES) + '  found')
+    for name, expected in sorted(manifest.items()):
+        with open(os.path.join(CORPUS_DIR, name), 'rb') as f:
+            content = f.read()
+        # No charset in the headers: the same path as a server that only declares it in <meta>
+        decode_ms, html = _median_ms(lambda: decode(content), args.repeat)
+        totals['decode'] += decode_ms
+        results = {}
+        for engine in ENGINES:
+            ms, results[engine] = _median_ms(lambda: scraper.parse_professors(html, engine=engine), args.repeat)
+            totals[engine] += ms
+            results[engine + '_ms'] = ms
+
+        names = sorted(p['name'] for p in results['lxml'])
+        notes = []
+        if results['lxml'] != results['html.parser']:
+            notes.append('engines differ')
+        if names != expected['names']:
+            notes.append(f'expected {expected["professors"]}')
+        failures += bool(notes)
+        print(f'{name:20} {len(content) / 1024:5.1f} {decode_ms:7.2f}ms '
+              + ' '.join(f'{results[e + "_ms"]:10.2f}ms' for e in ENGINES)
+              + f'  {len(names):3}' + (f'  !! {", ".join(notes)}' if notes else ''))
+
+    print(f'{"total":20} {"":5} {totals["decode"]:7.2f}ms '
+          + ' '.join(f'{totals[e]:10.2f}ms' for e in ENGINES))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
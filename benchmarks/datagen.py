@@ -0,0 +1,147 @@
+"""Fill a SQLite database with synthetic sales data for benchmarking.
+
+Creates roughly one university per 400 professors, six departments per
+university, sales info for 70% of professors (status, contact dates,
+memo, 0-3 tags) and four custom fields (number / date / select / text)
+with values for about half of the professors. The data is deterministic
+for a given size and seed.
+
+    python -m benchmarks.datagen --professors 10000 --out /tmp/bench.db
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SURNAMES = ['山田', '鈴木', '佐藤', '高橋', '田中', '伊藤', '渡辺', '中村', '小林', '加藤',
+            '吉田', '山本', '松本', '井上', '木村', '清水', '山口', '池田', '橋本', '石川']
+GIVEN_NAMES = ['太郎', '花子', '一郎', '次郎', '美咲', '直樹', '由美', '陽子', '大輔', '真理', '裕子', '健太']
+TITLES = ['教授', '准教授', '講師', '助教']
+SPECIALTIES = ['情報工学', '機械学習', '循環器内科', '有機化学', '分子生物学', '構造力学',
+               '日本近代文学', '計量経済学', '量子光学', '環境工学', '教育心理学', '薬理学']
+DEPARTMENTS = ['工学部', '理学部', '医学部', '文学部', '経済学部', '教育学部']
+TAGS = ['重要', '要フォロー', '展示会', '紹介', '予算あり', '共同研究', '資料送付済', '再訪問',
+        '学会', '新規', '既存顧客', '保留']
+CUSTOM_FIELDS = [('予算', 'number', []), ('訪問予定日', 'date', []),
+                 ('区分', 'select', ['A', 'B', 'C']), ('備考', 'text', [])]
+
+CHUNK = 10000
+
+
+def _insert(table, rows):
+    from models import db
+    for i in range(0, len(rows), CHUNK):
+        db.session.execute(table.insert(), rows[i:i + CHUNK])
+
+
+def generate(professors, seed=0):
+    """Insert the synthetic data set into the app's (empty) database."""
+    from models import (db, University, Department, Professor, SalesInfo, Tag, SalesInfoTag,
+                        CustomField, CustomFieldValue, SALES_STATUSES)
+    import custom_values
+
+    rng = random.Random(seed)
+    today = date.today()
+    n_universities = max(1, professors // 400)
+
+    _insert(University.__table__, [
+        {'id': u, 'name': f'第{u}大学', 'url': f'https://u{u}.example.ac.jp/'}
+        for u in range(1, n_universities + 1)
+    ])
+    _insert(Department.__table__, [
+        {'id': (u - 1) * len(DEPARTMENTS) + i + 1, 'university_id': u, 'name': name}
+        for u in range(1, n_universities + 1) for i, name in enumerate(DEPARTMENTS)
+    ])
+
+    prof_rows, sales_rows = [], []
+    for pid in range(1, professors + 1):
+        u = rng.randint(1, n_universities)
+        prof_rows.append({
+            'id': pid,
+            'university_id': u,
+            'dept_id': (u - 1) * len(DEPARTMENTS) + rng.randint(1, len(DEPARTMENTS)),
+            # the id suffix keeps (university_id, name) unique
+            'name': f'{rng.choice(SURNAMES)} {rng.choice(GIVEN_NAMES)}{pid}',
+            'title': rng.choice(TITLES),
+            'email': f'p{pid}@u{u}.example.ac.jp',
+            'phone': f'03-{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}',
+            'specialty': '・'.join(rng.sample(SPECIALTIES, rng.randint(1, 2))),
+            'source_url': f'https://u{u}.example.ac.jp/staff/',
+        })
+        if rng.random() < 0.7:
+            sales_rows.append({
+                'id': len(sales_rows) + 1,
+                'professor_id': pid,
+                'status': rng.choice(SALES_STATUSES),
+                'last_contact': today - timedelta(days=rng.randint(0, 365)) if rng.random() < 0.6 else None,
+                'next_contact': today + timedelta(days=rng.randint(-10, 60)) if rng.random() < 0.4 else None,
+                'memo': '面談メモ' * rng.randint(0, 20),
+            })
+    _insert(Professor.__table__, prof_rows)
+    _insert(SalesInfo.__table__, sales_rows)
+
+    _insert(Tag.__table__, [{'id': i + 1, 'name': name} for i, name in enumerate(TAGS)])
+    _insert(SalesInfoTag.__table__, [
+        {'sales_info_id': row['id'], 'tag_id': tag_id, 'position': position}
+        for row in sales_rows
+        for position, tag_id in enumerate(rng.sample(range(1, len(TAGS) + 1), rng.randint(0, 3)))
+    ])
+
+    fields = []
+    for order, (name, field_type, options) in enumerate(CUSTOM_FIELDS):
+        field = CustomField(name=name, field_type=field_type, order=order)
+        field.options = options
+        db.session.add(field)
+        fields.append(field)
+    db.session.flush()
+    value_rows = []
+    for pid in range(1, professors + 1):
+        for field in fields:
+            if rng.random() < 0.5:
+                continue
+            if field.field_type == 'number':
+                value = str(rng.randint(1, 500) * 10000)
+            elif field.field_type == 'date':
+                value = (today + timedelta(days=rng.randint(-90, 90))).isoformat()
+            elif field.field_type == 'select':
+                value = rng.choice(field.options)
+            else:
+                value = rng.choice(SPECIALTIES) + 'について相談'
+            value_rows.append({'professor_id': pid, 'custom_field_id': field.id, 'value': value,
+                               **custom_values.typed_values(field.field_type, value)})
+    _insert(CustomFieldValue.__table__, value_rows)
+    db.session.commit()
+
+
+def create(path, professors, seed=0):
+    """Create ``path`` (replacing it) with ``professors`` rows. Must run
+    before ``app`` is imported in this process."""
+    if os.path.exists(path):
+        os.remove(path)
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(path)}'
+    from app import app
+    import migrations
+    with app.app_context():
+        migrations.upgrade()
+        generate(professors, seed)
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--professors', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='bench.db')
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    create(args.out, args.professors, args.seed)
+    print(f'{args.out}: {args.professors} professors in {time.perf_counter() - start:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""Regenerate the faculty page corpus in benchmarks/corpus/.
+
+Each layout (table, list, cards, definition list) is written once per
+encoding (UTF-8, Shift_JIS, EUC-JP) with a matching <meta charset>.
+Pages carry the usual noise around the listing, such as navigation,
+scripts, news and footers. The output is deterministic. manifest.json
+records each file's encoding and the professors the parser found when
+it was generated, so bench_parser can flag parser changes.
+
+    python -m benchmarks.make_corpus
+"""
+import json
+import os
+import random
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import scraper  # noqa: E402
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+
+# file suffix -> (codec, charset declared in the page)
+ENCODINGS = {
+    'utf8': ('utf-8', 'UTF-8'),
+    'sjis': ('cp932', 'Shift_JIS'),
+    'eucjp': ('euc-jp', 'EUC-JP'),
+}
+
+SURNAMES = ['山田', '鈴木', '佐藤', '高橋', '田中', '伊藤', '渡辺', '中村', '小林', '加藤',
+            '吉田', '山本', '松本', '井上', '木村', '林', '清水', '山口', '森', '池田']
+GIVEN_NAMES = ['太郎', '花子', '一郎', '次郎', '美咲', '健', '直樹', '由美', '翔', '陽子',
+               '誠', '恵', '大輔', '真理', '浩', '裕子']
+TITLES = ['教授', '准教授', '講師', '助教', '特任教授', '名誉教授']
+SPECIALTIES = ['情報工学', '機械学習', '循環器内科', '有機化学', '分子生物学', '構造力学',
+               '日本近代文学', '計量経済学', '量子光学', '環境工学', '教育心理学', '薬理学']
+NEWS = ['オープンキャンパスのお知らせ', '入試説明会を開催します', '研究成果が学術誌に掲載されました',
+        '公開講座の受講者を募集しています', '学位授与式について']
+
+
+def _people(rng, count):
+    people = []
+    seen = set()
+    while len(people) < count:
+        name = f'{rng.choice(SURNAMES)} {rng.choice(GIVEN_NAMES)}'
+        if name in seen:
+            continue
+        seen.add(name)
+        n = len(people)
+        people.append({
+            'name': name,
+            'title': rng.choice(TITLES),
+            'email': f'prof{n:03d}@example.ac.jp' if rng.random() < 0.8 else '',
+            'phone': f'03-{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}' if rng.random() < 0.5 else '',
+            'specialty': '・'.join(rng.sample(SPECIALTIES, rng.randint(1, 2))),
+        })
+    return people
+
+
+def _table(people):
+    rows = ''.join(
+        f'<tr><td>{p["title"]}</td><td><a href="/staff/{i}.html">{p["name"]}</a></td>'
+        f'<td>専門: {p["specialty"]}</td><td>{p["email"]}</td><td>{p["phone"]}</td></tr>\n'
+        for i, p in enumerate(people)
+    )
+    return f'<table class="staff"><tr><th>職位</th><th>氏名</th><th>専門</th><th>連絡先</th><th>電話</th></tr>\n{rows}</table>'
+
+
+def _list(people):
+    items = ''.join(
+        f'<li><strong>{p["name"]}</strong> {p["title"]}<br>研究分野：{p["specialty"]}'
+        f'{" / " + p["email"] if p["email"] else ""}</li>\n'
+        for p in people
+    )
+    return f'<ul class="faculty">\n{items}</ul>'
+
+
+def _cards(people):
+    cards = ''.join(
+        f'<div class="card"><img src="/img/{i}.jpg" alt=""><div class="body">'
+        f'<p class="title">{p["title"]}</p><h3>{p["name"]}</h3>'
+        f'<p>専門分野: {p["specialty"]}</p><p><span>E-mail:</span> {p["email"]}</p>'
+        f'<p>TEL {p["phone"]}</p></div></div>\n'
+        for i, p in enumerate(people)
+    )
+    return f'<div class="cards">\n{cards}</div>'
+
+
+def _dl(people):
+    entries = ''.join(
+        f'<dt>{p["name"]}　{p["title"]}</dt><dd>専門: {p["specialty"]}<br>{p["email"]}</dd>\n'
+        for p in people
+    )
+    return f'<dl class="members">\n{entries}</dl>'
+
+
+LAYOUTS = {'table': _table, 'list': _list, 'cards': _cards, 'dl': _dl}
+
+
+def _page(rng, charset, body):
+    nav = ''.join(f'<li><a href="/dept/{i}/">学科{i}</a></li>' for i in range(12))
+    news = ''.join(f'<li>{2024 - i}年{rng.randint(1, 12)}月 {rng.choice(NEWS)}</li>' for i in range(8))
+    return (
+        f'<!DOCTYPE html>\n<html lang="ja"><head><meta charset="{charset}">'
+        '<title>教員一覧 | 工学部</title>'
+        '<script>window.dataLayer=[];function gtag(){dataLayer.push(arguments)}</script>'
+        '<style>.card{display:flex}</style></head>\n<body>'
+        f'<header><nav><ul>{nav}</ul></nav></header>\n'
+        '<main><h1>教員紹介</h1><!-- generated listing -->\n'
+        f'{body}\n'
+        f'<section class="news"><h2>お知らせ</h2><ul>{news}</ul></section></main>\n'
+        '<footer><p>〒100-0001 東京都千代田区 TEL 03-0000-0000</p>'
+        '<p>Copyright (C) Example University</p></footer></body></html>\n'
+    )
+
+
+def main():
+    os.makedirs(CORPUS_DIR, exist_ok=True)
+    manifest = {}
+    for layout_index, (layout, render) in enumerate(LAYOUTS.items()):
+        for suffix, (codec, charset) in ENCODINGS.items():
+            rng = random.Random(f'{layout}-{suffix}')
+            people = _people(rng, 40 + 20 * layout_index)
+            html = _page(rng, charset, render(people))
+            name = f'{layout}.{suffix}.html'
+            with open(os.path.join(CORPUS_DIR, name), 'wb') as f:
+                f.write(html.encode(codec))
+            found = scraper.parse_professors(html)
+            manifest[name] = {
+                'encoding': codec,
+                'professors': len(found),
+                'names': sorted(p['name'] for p in found),
+            }
+    with open(os.path.join(CORPUS_DIR, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+        f.write('\n')
+    for name, entry in sorted(manifest.items()):
+        print(f'{name:20} {entry["encoding"]:7} {entry["professors"]:3} professors')
+
+
+if __name__ == '__main__':
+    main()
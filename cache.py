@@ -0,0 +1,61 @@
+"""Short-lived in-process snapshot cache.
+
+Each gunicorn worker keeps its own copy; entries expire after ``ttl``
+seconds and are dropped as soon as a committed transaction in this
+process has written to one of the watched models.
+"""
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+class SnapshotCache:
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        now = time.monotonic()
+        with self._lock:
+            hit = self._entries.get(key)
+            if hit is not None and hit[0] > now:
+                return hit[1]
+        value = compute()
+        with self._lock:
+            self._entries[key] = (now + self.ttl, value)
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+    def invalidate_on_write(self, *models):
+        """Clear the cache after any commit that touched one of ``models``,
+        through the unit of work or bulk insert/update/delete statements."""
+        flag = f'snapshot_cache_dirty_{id(self)}'
+
+        def touches(objects):
+            return any(isinstance(obj, models) for obj in objects)
+
+        @event.listens_for(Session, 'after_flush')
+        def _after_flush(session, _flush_context):
+            if touches(session.new) or touches(session.dirty) or touches(session.deleted):
+                session.info[flag] = True
+
+        @event.listens_for(Session, 'do_orm_execute')
+        def _on_execute(state):
+            if (state.is_insert or state.is_update or state.is_delete) and \
+                    state.bind_mapper is not None and issubclass(state.bind_mapper.class_, models):
+                state.session.info[flag] = True
+
+        @event.listens_for(Session, 'after_commit')
+        def _after_commit(session):
+            if session.info.pop(flag, False):
+                self.invalidate()
+
+        @event.listens_for(Session, 'after_rollback')
+        def _after_rollback(session):
+            session.info.pop(flag, None)
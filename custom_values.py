@@ -0,0 +1,129 @@
+"""Batched writes for custom fields.
+
+A professor's values are saved as a diff against what is stored: one
+query loads the existing rows, then inserts, updates and deletes each go
+out as a single statement. The unique (professor_id, custom_field_id)
+index guarantees there is at most one value per field.
+
+Next to the text ``value``, number and date fields also fill the typed
+``value_number`` / ``value_date`` columns, which are indexed together with
+``custom_field_id`` so the professor list can filter and sort on them.
+"""
+import math
+from datetime import date
+
+from sqlalchemy import case, delete, insert, select, update
+
+from models import db, CustomField, CustomFieldValue
+import tracking
+
+
+def parse_typed(field_type, raw):
+    """The typed value of ``raw`` for a number / date field, or None."""
+    raw = (raw or '').strip()
+    if field_type == 'number':
+        try:
+            number = float(raw.replace(',', ''))
+        except ValueError:
+            return None
+        return number if math.isfinite(number) else None
+    if field_type == 'date':
+        try:
+            return date.fromisoformat(raw.replace('/', '-'))
+        except ValueError:
+            return None
+    return None
+
+
+def typed_values(field_type, raw):
+    return {
+        'value_number': parse_typed(field_type, raw) if field_type == 'number' else None,
+        'value_date': parse_typed(field_type, raw) if field_type == 'date' else None,
+    }
+
+
+def value_column(field_type):
+    """The column that holds (and orders) values of ``field_type``."""
+    if field_type == 'number':
+        return CustomFieldValue.value_number
+    if field_type == 'date':
+        return CustomFieldValue.value_date
+    return CustomFieldValue.value
+
+
+def save_values(professor_id, submitted):
+    """Store ``submitted`` ({custom_field_id: value}) for one professor.
+
+    Fields missing from ``submitted`` or given an empty value are cleared.
+    Unknown field ids are ignored. The caller commits. Returns
+    ``{'inserted': n, 'updated': n, 'deleted': n}``.
+    """
+    field_types = dict(db.session.execute(select(CustomField.id, CustomField.field_type)).all())
+    existing = {
+        field_id: (value_id, value)
+        for value_id, field_id, value in db.session.execute(
+            select(CustomFieldValue.id, CustomFieldValue.custom_field_id, CustomFieldValue.value)
+            .where(CustomFieldValue.professor_id == professor_id)
+        )
+    }
+
+    inserts, updates, deletes = [], [], []
+    for field_id, field_type in field_types.items():
+        value = (submitted.get(field_id) or '').strip()
+        current = existing.get(field_id)
+        if current is None:
+            if value:
+                inserts.append({'professor_id': professor_id, 'custom_field_id': field_id, 'value': value,
+                                **typed_values(field_type, value)})
+        elif not value:
+            deletes.append(current[0])
+        elif value != current[1]:
+            updates.append({'id': current[0], 'value': value, **typed_values(field_type, value)})
+
+    if inserts:
+        db.session.execute(insert(CustomFieldValue.__table__), inserts)
+    if updates:
+        db.session.execute(update(CustomFieldValue), updates)
+    if deletes:
+        db.session.execute(
+            delete(CustomFieldValue).where(CustomFieldValue.id.in_(deletes)),
+            execution_options={'synchronize_session': False},
+        )
+        tracking.record_deletes(CustomFieldValue, [(value_id, professor_id) for value_id in deletes])
+    return {'inserted': len(inserts), 'updated': len(updates), 'deleted': len(deletes)}
+
+
+def values_from_form(form):
+    """``{custom_field_id: value}`` from ``cf_<id>`` form fields."""
+    values = {}
+    for key, value in form.items():
+        if key.startswith('cf_') and key[3:].isdigit():
+            values[int(key[3:])] = value
+    return values
+
+
+def reorder(positions):
+    """Set CustomField.order from ``positions`` ({id: order}) with one
+    CASE UPDATE. The caller commits. Returns the number of rows updated."""
+    if not positions:
+        return 0
+    result = db.session.execute(
+        update(CustomField)
+        .where(CustomField.id.in_(positions))
+        .values(order=case(positions, value=CustomField.id))
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+def refresh_typed(field):
+    """Recompute the typed columns of every value of ``field`` (after its
+    field_type changed). The caller commits."""
+    rows = db.session.execute(
+        select(CustomFieldValue.id, CustomFieldValue.value).where(CustomFieldValue.custom_field_id == field.id)
+    ).all()
+    if rows:
+        db.session.execute(update(CustomFieldValue), [
+            {'id': value_id, **typed_values(field.field_type, value)} for value_id, value in rows
+        ])
+    return len(rows)
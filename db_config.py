@@ -0,0 +1,166 @@
+"""Database engine configuration from the environment.
+
+``DATABASE_URL`` is normalised for pg8000. A ``pgbouncer=true`` parameter
+(Supabase's transaction pooler) is removed from the URL and switches the
+engine to NullPool: the pooler already pools, and a client-side pool would
+keep server connections that the pooler hands to other clients.
+
+PostgreSQL settings (all optional):
+
+``DB_POOL_SIZE`` / ``DB_MAX_OVERFLOW`` / ``DB_POOL_TIMEOUT``
+    QueuePool sizing (defaults 5 / 10 / 30 seconds).
+``DB_POOL_RECYCLE``
+    Reconnect connections older than this many seconds (default 1800),
+    before the hosting side drops them as idle.
+``DB_POOL_PRE_PING``
+    Test each connection on checkout and reconnect if it died (default on).
+``DB_NULLPOOL``
+    Force NullPool without ``pgbouncer=true`` in the URL.
+``DB_STATEMENT_TIMEOUT_MS``
+    Server-side ``statement_timeout`` (default 30000, 0 disables). It is set
+    once per connection, or with ``SET LOCAL`` at the start of every
+    transaction behind a transaction pooler, where session settings do not
+    stick. Migration steps lift it for their own transaction (see
+    migrations.upgrade).
+
+Pool usage is reported on ``/metrics`` through ``instrumentation.collectors``.
+"""
+import os
+import re
+from collections import Counter
+
+from sqlalchemy import event
+from sqlalchemy.pool import NullPool
+
+import instrumentation
+
+DEFAULT_URL = 'sqlite:///sales.db'
+
+
+def _env_int(environ, key, default):
+    value = environ.get(key, '').strip()
+    return int(value) if value else default
+
+
+def _env_bool(environ, key, default):
+    value = environ.get(key, '').strip().lower()
+    return value in ('1', 'true', 'yes', 'on') if value else default
+
+
+def database_url(raw):
+    """``(url, pgbouncer)`` for ``raw``: the URL pg8000 can use, and whether
+    it pointed at a transaction pooler."""
+    url = raw or DEFAULT_URL
+    # postgres:// → postgresql+pg8000:// に変換（Supabase/Render対応）
+    if url.startswith('postgres://'):
+        url = url.replace('postgres://', 'postgresql+pg8000://', 1)
+    elif url.startswith('postgresql://'):
+        url = url.replace('postgresql://', 'postgresql+pg8000://', 1)
+    # pg8000非対応のSupabaseパラメータを除去
+    match = re.search(r'[?&]pgbouncer=(\w+)', url)
+    pgbouncer = bool(match) and match.group(1).lower() in ('1', 'true')
+    url = re.sub(r'[?&]pgbouncer=\w+', '', url)
+    if '?' not in url and '&' in url:
+        url = url.replace('&', '?', 1)
+    return url, pgbouncer
+
+
+def engine_options(url, pgbouncer=False, environ=os.environ):
+    """SQLALCHEMY_ENGINE_OPTIONS for ``url``. SQLite keeps the defaults."""
+    if not url.startswith('postgresql'):
+        return {}
+    if pgbouncer or _env_bool(environ, 'DB_NULLPOOL', False):
+        return {'poolclass': NullPool}
+    return {
+        'pool_size': _env_int(environ, 'DB_POOL_SIZE', 5),
+        'max_overflow': _env_int(environ, 'DB_MAX_OVERFLOW', 10),
+        'pool_timeout': _env_int(environ, 'DB_POOL_TIMEOUT', 30),
+        'pool_recycle': _env_int(environ, 'DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': _env_bool(environ, 'DB_POOL_PRE_PING', True),
+    }
+
+
+# ─── statement timeout ───
+
+def _set_statement_timeout(cursor_source, timeout_ms, local):
+    cursor = cursor_source.cursor()
+    try:
+        cursor.execute(f"SET {'LOCAL ' if local else ''}statement_timeout = {int(timeout_ms)}")
+    finally:
+        cursor.close()
+
+
+def install_statement_timeout(engine, timeout_ms, pgbouncer=False):
+    if not timeout_ms or engine.dialect.name != 'postgresql':
+        return
+    if pgbouncer:
+        @event.listens_for(engine, 'begin')
+        def _on_begin(conn):
+            _set_statement_timeout(conn.connection.dbapi_connection, timeout_ms, local=True)
+    else:
+        @event.listens_for(engine, 'connect')
+        def _on_connect(dbapi_connection, connection_record):
+            _set_statement_timeout(dbapi_connection, timeout_ms, local=False)
+            dbapi_connection.commit()
+
+
+# ─── pool metrics ───
+
+def install_pool_metrics(engine):
+    """Count pool events for ``engine`` and report them with the current
+    pool usage on /metrics."""
+    events = Counter()
+
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        events['connect'] += 1
+
+    @event.listens_for(engine, 'checkout')
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        events['checkout'] += 1
+
+    @event.listens_for(engine, 'invalidate')
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        events['invalidate'] += 1
+
+    def collect():
+        pool = engine.pool
+        labels = {'pool': type(pool).__name__}
+        metrics = [
+            ('db_pool_connections_opened_total', 'counter',
+             'DBAPI connections opened by the pool.', [(labels, events['connect'])]),
+            ('db_pool_checkouts_total', 'counter',
+             'Connections checked out of the pool.', [(labels, events['checkout'])]),
+            ('db_pool_invalidations_total', 'counter',
+             'Connections discarded as broken (including failed pre-pings).', [(labels, events['invalidate'])]),
+        ]
+        if hasattr(pool, 'checkedout'):
+            metrics += [
+                ('db_pool_size', 'gauge', 'Configured pool size.', [(labels, pool.size())]),
+                ('db_pool_checked_out', 'gauge', 'Connections currently in use.', [(labels, pool.checkedout())]),
+                ('db_pool_checked_in', 'gauge', 'Idle connections in the pool.', [(labels, pool.checkedin())]),
+                ('db_pool_overflow', 'gauge', 'Connections open beyond the pool size.', [(labels, pool.overflow())]),
+            ]
+        return metrics
+
+    instrumentation.collectors.append(collect)
+
+
+def configure(app, environ=os.environ):
+    """Set the database URL and engine options on ``app`` before
+    ``db.init_app``. Returns whether the URL pointed at a pooler."""
+    url, pgbouncer = database_url(environ.get('DATABASE_URL'))
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(url, pgbouncer, environ)
+    app.config['DB_PGBOUNCER'] = pgbouncer
+    app.config['DB_STATEMENT_TIMEOUT_MS'] = _env_int(environ, 'DB_STATEMENT_TIMEOUT_MS', 30000)
+    return pgbouncer
+
+
+def init_engine(app, db):
+    """Attach the timeout and metrics listeners once ``db.init_app`` has
+    created the engine."""
+    with app.app_context():
+        engine = db.engine
+    install_statement_timeout(engine, app.config['DB_STATEMENT_TIMEOUT_MS'], app.config['DB_PGBOUNCER'])
+    install_pool_metrics(engine)
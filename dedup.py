@@ -0,0 +1,256 @@
+"""Fuzzy duplicate-professor detection and merging.
+
+The unique index only catches exact ``(university_id, name)`` repeats.
+Here names are compared by ``name_key``. It applies NFKC (full-width
+letters and spaces), drops whitespace and middle dots, maps old or variant
+kanji to their common forms, and casefolds. Rows are put in blocks under
+two keys:
+
+- ``(university_id, name_key)``: the same person listed under two
+  departments, or spelled with 旧字体 on one page.
+- the normalized email, across universities. Blocks larger than
+  ``MAX_EMAIL_BLOCK`` are skipped, since those are shared office
+  addresses.
+
+Only pairs inside a block are compared, and union-find joins them into
+groups. The work grows with the number of rows, not rows squared, and one
+pass reads just four columns. Pairs marked as not duplicates
+(DuplicateDismissal) are never joined.
+
+``merge`` folds the other professors of a group into the one kept and
+records their names as aliases under their own universities. ``ingest.sync_scraped`` matches incoming
+names by ``name_key`` and those aliases, so a re-scrape neither re-adds
+the merged rows nor splits them again.
+"""
+import json
+import re
+import unicodedata
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import delete, or_, select, update
+
+from models import db, Professor, ProfessorChange, ProfessorAlias, DuplicateDismissal
+
+# 旧字体 / 異体字 -> 新字体, for characters common in Japanese names.
+# NFKC already folds the CJK compatibility ideographs that have a decomposition.
+KANJI_VARIANTS = {
+    '齋': '斎', '齊': '斎', '斉': '斎', '邊': '辺', '邉': '辺', '髙': '高', '﨑': '崎',
+    '嵜': '崎', '碕': '崎', '濵': '浜', '濱': '浜', '澤': '沢', '櫻': '桜', '廣': '広',
+    '國': '国', '眞': '真', '藏': '蔵', '實': '実', '惠': '恵', '德': '徳', '榮': '栄',
+    '壽': '寿', '與': '与', '瀨': '瀬', '淺': '浅', '增': '増', '會': '会', '團': '団',
+    '學': '学', '圓': '円', '條': '条', '關': '関', '萬': '万', '來': '来', '禮': '礼',
+    '豐': '豊', '冨': '富', '嶋': '島', '嶌': '島', '槇': '槙', '桒': '桑', '舘': '館',
+    '嶽': '岳', '戶': '戸', '黑': '黒', '靑': '青', '淸': '清', '緖': '緒', '兒': '児',
+    '縣': '県', '佛': '仏', '驒': '騨', '莊': '荘', '彌': '弥', '龜': '亀', '勳': '勲',
+    '曾': '曽', '瀧': '滝',
+}
+_KANJI_TABLE = str.maketrans(KANJI_VARIANTS)
+_SEPARATORS_RE = re.compile(r'[\s・･.\-‐－]+')
+# Migration 001 renames repeated (university_id, name) rows with this suffix;
+# name_key ignores it so they are still offered for merging
+DUPLICATE_SUFFIX = '（重複 #{id}）'
+_DUPLICATE_SUFFIX_RE = re.compile(r'\(重複#\d+\)$')
+
+MAX_EMAIL_BLOCK = 3
+# Name blocks are compared pairwise; larger ones are not real duplicates
+MAX_NAME_BLOCK = 20
+MERGE_FIELDS = ('dept_id', 'title', 'email', 'phone', 'specialty', 'source_url')
+
+
+def name_key(name):
+    """Comparison key of a professor name."""
+    name = _SEPARATORS_RE.sub('', unicodedata.normalize('NFKC', name or ''))
+    return _DUPLICATE_SUFFIX_RE.sub('', name).translate(_KANJI_TABLE).casefold()
+
+
+def email_key(email):
+    email = unicodedata.normalize('NFKC', email or '').strip().casefold()
+    return email if '@' in email else ''
+
+
+# ─── detection ───
+
+class _UnionFind:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, x):
+        root = self.parent.setdefault(x, x)
+        while root != self.parent[root]:
+            root = self.parent[root]
+        while x != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+def blocks(rows):
+    """``{block key: [ids]}`` for ``(id, university_id, name, email)`` rows,
+    keeping only blocks with more than one member."""
+    index = defaultdict(list)
+    for prof_id, university_id, name, email in rows:
+        key = name_key(name)
+        if key:
+            index[('name', university_id, key)].append(prof_id)
+        key = email_key(email)
+        if key:
+            index[('email', key)].append(prof_id)
+    return {
+        key: ids for key, ids in index.items()
+        if 1 < len(ids) <= (MAX_NAME_BLOCK if key[0] == 'name' else MAX_EMAIL_BLOCK)
+    }
+
+
+def find_groups(rows, dismissed=()):
+    """Duplicate groups among ``rows`` (see ``blocks``).
+
+    ``dismissed`` holds ``(low_id, high_id)`` pairs that must not be joined.
+    Returns ``[{'ids': [...], 'reasons': {'name', 'email'}}]`` with ids
+    ascending, groups ordered by their first id.
+    """
+    dismissed = set(dismissed)
+    uf, reasons = _UnionFind(), defaultdict(set)
+    for key, ids in blocks(rows).items():
+        for i, a in enumerate(ids):
+            for b in ids[i + 1:]:
+                if (min(a, b), max(a, b)) not in dismissed:
+                    uf.union(a, b)
+                    reasons[min(a, b)].add(key[0])
+    groups = defaultdict(list)
+    for prof_id in uf.parent:
+        groups[uf.find(prof_id)].append(prof_id)
+    result = []
+    for root, ids in groups.items():
+        if len(ids) > 1:
+            ids.sort()
+            result.append({'ids': ids, 'reasons': set().union(*(reasons[i] for i in ids))})
+    return sorted(result, key=lambda g: g['ids'][0])
+
+
+def find_duplicates(university_id=None):
+    """Duplicate groups among the stored professors (of one university).
+
+    With a university, email blocks still only see that university's rows.
+    """
+    query = select(Professor.id, Professor.university_id, Professor.name, Professor.email)
+    if university_id:
+        query = query.where(Professor.university_id == university_id)
+    dismissed = db.session.execute(select(DuplicateDismissal.professor_id, DuplicateDismissal.other_id)).all()
+    return find_groups(db.session.execute(query), dismissed=[tuple(pair) for pair in dismissed])
+
+
+def dismiss(ids):
+    """Mark every pair among ``ids`` as not duplicates. The caller commits."""
+    ids = sorted(set(ids))
+    existing = set(db.session.execute(
+        select(DuplicateDismissal.professor_id, DuplicateDismissal.other_id)
+        .where(DuplicateDismissal.professor_id.in_(ids))
+    ).all())
+    for i, a in enumerate(ids):
+        for b in ids[i + 1:]:
+            if (a, b) not in existing:
+                db.session.add(DuplicateDismissal(professor_id=a, other_id=b))
+
+
+# ─── merge ───
+
+def _merge_sales(target, other):
+    source = other.sales_info
+    if source is None:
+        return
+    if target.sales_info is None:
+        # Detached first: deleting ``other`` would otherwise cascade to the moved row
+        other.sales_info = None
+        target.sales_info = source
+        return
+    # Read before anything is flushed: ``other`` and its tag links are deleted with it
+    tags = source.tags
+    kept = target.sales_info
+    if kept.status == '未接触' and source.status:
+        kept.status = source.status
+    if source.last_contact and (kept.last_contact is None or source.last_contact > kept.last_contact):
+        kept.last_contact = source.last_contact
+    kept.next_contact = kept.next_contact or source.next_contact
+    if source.memo and source.memo not in (kept.memo or ''):
+        kept.memo = f'{kept.memo}\n{source.memo}' if kept.memo else source.memo
+    if tags:
+        kept.tags = kept.tags + tags
+
+
+def merge(target_id, other_ids):
+    """Fold the professors ``other_ids`` into ``target_id`` and delete them.
+
+    Empty fields of the kept professor are filled from the others. Its sales
+    info takes over a status it lacked, the latest contact date, memos and
+    tags. Custom values it lacks are moved, and so is the change log. The
+    merged names become aliases, and a 'merged' entry is logged. The caller
+    commits. Returns the kept Professor, or None if an id does not exist.
+    """
+    other_ids = [pid for pid in dict.fromkeys(other_ids) if pid != target_id]
+    professors = {p.id: p for p in Professor.query.filter(Professor.id.in_([target_id] + other_ids))}
+    if len(professors) != len(other_ids) + 1:
+        return None
+    target = professors[target_id]
+    now = datetime.utcnow()
+
+    # Moved with UPDATEs first, so deleting the others does not cascade to them
+    db.session.execute(update(ProfessorChange).where(ProfessorChange.professor_id.in_(other_ids))
+                       .values(professor_id=target_id))
+    db.session.execute(update(ProfessorAlias).where(ProfessorAlias.professor_id.in_(other_ids))
+                       .values(professor_id=target_id))
+    db.session.execute(delete(DuplicateDismissal).where(or_(
+        DuplicateDismissal.professor_id.in_(other_ids), DuplicateDismissal.other_id.in_(other_ids))))
+
+    target_key = (target.university_id, name_key(target.name))
+    known_aliases = set(db.session.execute(
+        select(ProfessorAlias.university_id, ProfessorAlias.name_key).where(
+            ProfessorAlias.university_id.in_({p.university_id for p in professors.values()}))
+    ).all())
+    for pid in other_ids:
+        other = professors[pid]
+        for field in MERGE_FIELDS:
+            if not getattr(target, field) and getattr(other, field):
+                setattr(target, field, getattr(other, field))
+        if not target.photo_url and other.photo_url:
+            target.photo_url, target.photo_hash, target.photo_source = (
+                other.photo_url, other.photo_hash, other.photo_source)
+        _merge_sales(target, other)
+        have = {cfv.custom_field_id for cfv in target.custom_field_values}
+        for cfv in list(other.custom_field_values):
+            if cfv.custom_field_id not in have and cfv.value:
+                target.custom_field_values.append(cfv)
+                have.add(cfv.custom_field_id)
+
+        # Under the merged row's own university: its next scrape must not add it again,
+        # even when the kept professor belongs to another university (email blocks)
+        key = (other.university_id, name_key(other.name))
+        if key != target_key and key not in known_aliases:
+            db.session.add(ProfessorAlias(professor_id=target_id, university_id=key[0], name_key=key[1]))
+            known_aliases.add(key)
+        db.session.add(ProfessorChange(
+            professor_id=target_id, university_id=target.university_id, kind='merged', created_at=now,
+            _changes=json.dumps({'name': [other.name, target.name]}, ensure_ascii=False),
+        ))
+        db.session.delete(other)
+    return target
+
+
+# ─── ingest ───
+
+def alias_map(university_id):
+    """``{name_key: professor_id}`` of the merge aliases of one university.
+
+    The professor may belong to another university if it was merged with a
+    professor found there by email.
+    """
+    # Joined so aliases of deleted professors are ignored where FKs do not cascade (SQLite)
+    return dict(db.session.execute(
+        select(ProfessorAlias.name_key, ProfessorAlias.professor_id)
+        .join(Professor, Professor.id == ProfessorAlias.professor_id)
+        .where(ProfessorAlias.university_id == university_id)
+    ).all())
@@ -0,0 +1,265 @@
+"""Streaming professor export (CSV / JSONL / XLSX).
+
+Rows are read with plain column selects in keyset batches (see
+queries.iter_row_batches), so neither ORM objects nor the full result are
+held in memory. Tags and custom field values are fetched once per batch
+and custom fields are pivoted into one column each.
+"""
+import csv
+import io
+import json
+import re
+import zipfile
+from collections import defaultdict
+from xml.sax.saxutils import escape
+
+from sqlalchemy import select
+
+from models import db, University, Department, Professor, SalesInfo, SalesInfoTag, Tag, CustomField, CustomFieldValue
+import queries
+
+BATCH_SIZE = 1000
+
+# (key, CSV/XLSX header)
+COLUMNS = [
+    ('id', 'ID'),
+    ('university', '大学'),
+    ('department', '学科'),
+    ('name', '氏名'),
+    ('title', '職位'),
+    ('email', 'メール'),
+    ('phone', '電話'),
+    ('specialty', '専門'),
+    ('status', 'ステータス'),
+    ('last_contact', '最終接触'),
+    ('next_contact', '次回予定'),
+    ('tags', 'タグ'),
+    ('memo', 'メモ'),
+    ('source_url', '出典URL'),
+]
+
+
+def _select():
+    return (
+        select(
+            Professor.id,
+            University.name.label('university'),
+            Department.name.label('department'),
+            Professor.name,
+            Professor.title,
+            Professor.email,
+            Professor.phone,
+            Professor.specialty,
+            queries.status_expr().label('status'),
+            SalesInfo.last_contact,
+            SalesInfo.next_contact,
+            SalesInfo.memo,
+            Professor.source_url,
+            SalesInfo.id.label('sales_info_id'),
+        )
+        .select_from(Professor)
+        .join(University, University.id == Professor.university_id)
+        .outerjoin(Department, Department.id == Professor.dept_id)
+        .outerjoin(SalesInfo, SalesInfo.professor_id == Professor.id)
+    )
+
+
+def _tags_by_sales_info(ids):
+    tags = defaultdict(list)
+    if ids:
+        rows = db.session.execute(
+            select(SalesInfoTag.sales_info_id, Tag.name)
+            .join(Tag, Tag.id == SalesInfoTag.tag_id)
+            .where(SalesInfoTag.sales_info_id.in_(ids))
+            .order_by(SalesInfoTag.sales_info_id, SalesInfoTag.position)
+        )
+        for sales_info_id, name in rows:
+            tags[sales_info_id].append(name)
+    return tags
+
+
+def _custom_values_by_professor(ids):
+    values = defaultdict(dict)
+    rows = db.session.execute(
+        select(CustomFieldValue.professor_id, CustomFieldValue.custom_field_id, CustomFieldValue.value)
+        .where(CustomFieldValue.professor_id.in_(ids))
+    )
+    for professor_id, field_id, value in rows:
+        values[professor_id][field_id] = value
+    return values
+
+
+def iter_records(filters, custom_fields, batch_size=BATCH_SIZE):
+    """Yield ``(record, custom_values)`` per professor matching ``filters``.
+
+    ``record`` maps the COLUMNS keys to values (``tags`` is a list);
+    ``custom_values`` maps custom field id to value.
+    """
+    stmt, keys = queries.apply_filters(_select(), filters)
+    for rows in queries.iter_row_batches(stmt, keys=keys, size=batch_size):
+        tags = _tags_by_sales_info([r.sales_info_id for r in rows if r.sales_info_id])
+        custom_values = (
+            _custom_values_by_professor([r.id for r in rows]) if custom_fields else {}
+        )
+        for r in rows:
+            record = {key: getattr(r, key) for key, _header in COLUMNS if key != 'tags'}
+            record['tags'] = tags.get(r.sales_info_id, [])
+            yield record, custom_values.get(r.id, {})
+
+
+def _cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return ', '.join(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+# ─── writers ───
+# Each writer takes the record iterator and the custom fields and yields
+# chunks of the response body (one per batch of rows).
+
+def write_csv(records, custom_fields):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    # BOM so Excel opens the UTF-8 file with the right encoding
+    buf.write('\ufeff')
+    writer.writerow([header for _key, header in COLUMNS] + [cf.name for cf in custom_fields])
+    for count, (record, custom_values) in enumerate(records, 1):
+        writer.writerow([_cell(record[key]) for key, _header in COLUMNS]
+                        + [_cell(custom_values.get(cf.id)) for cf in custom_fields])
+        if count % BATCH_SIZE == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+def write_jsonl(records, custom_fields):
+    lines = []
+    for record, custom_values in records:
+        record = {key: (value.isoformat() if hasattr(value, 'isoformat') else value)
+                  for key, value in record.items()}
+        record['custom_fields'] = {cf.name: custom_values.get(cf.id) for cf in custom_fields}
+        lines.append(json.dumps(record, ensure_ascii=False) + '\n')
+        if len(lines) >= BATCH_SIZE:
+            yield ''.join(lines)
+            lines = []
+    yield ''.join(lines)
+
+
+# XML 1.0 forbids most control characters, and Excel refuses files containing them
+_XML_ILLEGAL_RE = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="教授一覧" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, non-seekable stream that collects bytes until drained."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _xlsx_row(values):
+    cells = []
+    for value in values:
+        if value is None or value == '':
+            cells.append('<c/>')
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            cells.append(f'<c><v>{value}</v></c>')
+        else:
+            text = escape(_XML_ILLEGAL_RE.sub('', str(value)))
+            cells.append(f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>')
+    return '<row>' + ''.join(cells) + '</row>'
+
+
+def write_xlsx(records, custom_fields):
+    # A minimal workbook with inline strings, written straight into a zip
+    # stream: zipfile uses data descriptors on non-seekable output, so each
+    # batch of rows can be sent as soon as it is compressed.
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, content in _XLSX_PARTS.items():
+            zf.writestr(name, content)
+        with zf.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                '<sheetData>'
+                + _xlsx_row([header for _key, header in COLUMNS] + [cf.name for cf in custom_fields])
+            ).encode('utf-8'))
+            rows = []
+            for record, custom_values in records:
+                rows.append(_xlsx_row([_cell(record[key]) for key, _header in COLUMNS]
+                                      + [_cell(custom_values.get(cf.id)) for cf in custom_fields]))
+                if len(rows) >= BATCH_SIZE:
+                    sheet.write(''.join(rows).encode('utf-8'))
+                    rows = []
+                    yield sink.drain()
+            sheet.write((''.join(rows) + '</sheetData></worksheet>').encode('utf-8'))
+    yield sink.drain()
+
+
+# format -> (writer, mimetype, file extension)
+FORMATS = {
+    'csv': (write_csv, 'text/csv; charset=utf-8', 'csv'),
+    'jsonl': (write_jsonl, 'application/x-ndjson; charset=utf-8', 'jsonl'),
+    'xlsx': (write_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+}
+
+
+def generate(fmt, filters):
+    """Yield the export body for ``fmt`` (a FORMATS key)."""
+    writer = FORMATS[fmt][0]
+    custom_fields = CustomField.query.order_by(CustomField.order, CustomField.id).all()
+    yield from writer(iter_records(filters, custom_fields), custom_fields)
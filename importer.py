@@ -0,0 +1,281 @@
+"""Bulk import of universities, departments and professors from CSV / JSONL.
+
+Each input row is one professor; its university and department are given
+by name and created when missing. Rows are read as a stream and handled
+in chunks: validated, resolved to ids through in-memory lookup tables,
+upserted with ingest.upsert_records and committed together. Invalid
+rows are skipped and written to an error report. After every committed
+chunk a checkpoint file records how far the import got, so an
+interrupted run can be continued with ``--resume``.
+
+    flask --app app import-professors professors.csv [--dry-run] [--resume]
+"""
+import csv
+import json
+import os
+from collections import defaultdict
+from itertools import islice
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import insert, select
+
+from models import db, University, Department, Professor
+import export
+import ingest
+import jobs
+import photos
+
+CHUNK_SIZE = 1000
+
+FIELDS = ('university', 'university_url', 'department', 'name', 'title', 'email',
+          'phone', 'photo_url', 'specialty', 'source_url')
+
+# Header aliases, so files written by export.py import as-is
+ALIASES = {header: key for key, header in export.COLUMNS if key in FIELDS}
+
+# Column length limits, checked up front so one long value cannot fail a whole chunk
+MAX_LENGTHS = {
+    'university': University.__table__.c.name.type.length,
+    'university_url': University.__table__.c.url.type.length,
+    'department': Department.__table__.c.name.type.length,
+    **{f: Professor.__table__.c[f].type.length
+       for f in ('name', 'title', 'email', 'phone', 'photo_url', 'specialty', 'source_url')},
+}
+
+
+def detect_format(path):
+    return 'jsonl' if path.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def read_rows(path, fmt, encoding='utf-8-sig'):
+    """Yield ``(line_number, row)`` for each record in the file.
+
+    A JSONL line that is not a JSON object is yielded as the raw string.
+    """
+    with open(path, encoding=encoding, newline='') as f:
+        if fmt == 'jsonl':
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield line_number, row if isinstance(row, dict) else line.rstrip('\r\n')
+        else:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+
+
+def normalize(row):
+    """Map a raw row onto FIELDS and return ``(record, error)``."""
+    if not isinstance(row, dict):
+        return None, 'JSONオブジェクトとして読めません'
+    record = {}
+    for key, value in row.items():
+        field = ALIASES.get(key, key)
+        if field in FIELDS and value is not None:
+            record[field] = str(value).strip()
+    if not record.get('university'):
+        return None, '大学名がありません'
+    if not record.get('name'):
+        return None, '氏名がありません'
+    for field, limit in MAX_LENGTHS.items():
+        if limit and len(record.get(field, '')) > limit:
+            return None, f'{field} が長すぎます（最大{limit}文字）'
+    if record.get('email') and '@' not in record['email']:
+        return None, f'メールアドレスが不正です: {record["email"]}'
+    return record, None
+
+
+class Lookup:
+    """Name -> id tables for universities and departments.
+
+    Loaded once per import; names missing from the database are inserted
+    in one statement per chunk.
+    """
+
+    def __init__(self):
+        self.universities = {}
+        for uid, name in db.session.execute(select(University.id, University.name).order_by(University.id)):
+            self.universities.setdefault(name, uid)
+        self.departments = {}
+        for did, uid, name in db.session.execute(
+                select(Department.id, Department.university_id, Department.name).order_by(Department.id)):
+            self.departments.setdefault((uid, name), did)
+
+    def resolve(self, records):
+        """Set ``university_id`` / ``dept_id`` on ``records``, creating
+        missing rows. Returns ``(universities_created, departments_created)``."""
+        new_universities = {}
+        for rec in records:
+            if rec['university'] not in self.universities:
+                new_universities.setdefault(rec['university'], rec.get('university_url', ''))
+        if new_universities:
+            rows = [{'name': name, 'url': url} for name, url in new_universities.items()]
+            ids = db.session.scalars(insert(University).returning(University.id, sort_by_parameter_order=True), rows)
+            self.universities.update(zip(new_universities, ids))
+
+        new_departments = []
+        for rec in records:
+            rec['university_id'] = self.universities[rec['university']]
+            key = (rec['university_id'], rec.get('department'))
+            if key[1] and key not in self.departments and key not in new_departments:
+                new_departments.append(key)
+        if new_departments:
+            rows = [{'university_id': uid, 'name': name} for uid, name in new_departments]
+            ids = db.session.scalars(insert(Department).returning(Department.id, sort_by_parameter_order=True), rows)
+            self.departments.update(zip(new_departments, ids))
+
+        for rec in records:
+            name = rec.get('department')
+            rec['dept_id'] = self.departments[(rec['university_id'], name)] if name else None
+        return len(new_universities), len(new_departments)
+
+
+# ─── checkpoint ───
+
+def _checkpoint_path(path):
+    return path + '.checkpoint'
+
+
+def _file_signature(path):
+    st = os.stat(path)
+    return {'file': os.path.abspath(path), 'size': st.st_size, 'mtime': st.st_mtime}
+
+
+def load_checkpoint(path):
+    """Number of rows already committed by an earlier run of the same file."""
+    try:
+        with open(_checkpoint_path(path), encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    if {k: data.get(k) for k in ('file', 'size', 'mtime')} != _file_signature(path):
+        return 0  # the file changed since: start over
+    return data.get('rows', 0)
+
+
+def save_checkpoint(path, rows):
+    tmp = _checkpoint_path(path) + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({**_file_signature(path), 'rows': rows}, f)
+    os.replace(tmp, _checkpoint_path(path))
+
+
+def clear_checkpoint(path):
+    try:
+        os.remove(_checkpoint_path(path))
+    except OSError:
+        pass
+
+
+# ─── import ───
+
+def _chunks(iterable, size):
+    it = iter(iterable)
+    while chunk := list(islice(it, size)):
+        yield chunk
+
+
+def import_file(path, fmt=None, encoding='utf-8-sig', dry_run=False, resume=False,
+                chunk_size=CHUNK_SIZE, on_error=None, on_chunk=None):
+    """Import ``path`` and return a summary dict of counts.
+
+    ``on_error(line_number, message, row)`` is called for every rejected
+    row once its chunk is committed (so a resumed run does not report a
+    row twice) and ``on_chunk(summary)`` after every chunk. With ``dry_run``
+    everything runs inside one transaction that is rolled back at the end.
+    """
+    fmt = fmt or detect_format(path)
+    skip = load_checkpoint(path) if resume and not dry_run else 0
+    summary = defaultdict(int, skipped=skip)
+    lookup = Lookup()
+    rows = islice(read_rows(path, fmt, encoding), skip, None)
+    done = skip
+    try:
+        for chunk in _chunks(rows, chunk_size):
+            records, errors = [], []
+            for line_number, row in chunk:
+                record, error = normalize(row)
+                if error:
+                    errors.append((line_number, error, row))
+                else:
+                    records.append(record)
+
+            universities, departments = lookup.resolve(records)
+            summary['universities'] += universities
+            summary['departments'] += departments
+            result = ingest.upsert_records(records)
+            summary['added'] += len(result['added'])
+            summary['updated'] += len(result['updated'])
+            summary['unchanged'] += result['unchanged']
+
+            done += len(chunk)
+            summary['rows'] = done - skip
+            if not dry_run:
+                db.session.commit()
+                save_checkpoint(path, done)
+            summary['errors'] += len(errors)
+            if on_error:
+                for error in errors:
+                    on_error(*error)
+            if on_chunk:
+                on_chunk(summary)
+    finally:
+        db.session.rollback()
+    if not dry_run:
+        clear_checkpoint(path)
+    return dict(summary)
+
+
+@click.command('import-professors')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='既定は拡張子から判定')
+@click.option('--encoding', default='utf-8-sig', show_default=True, help='CSVの文字コード（Excel出力なら cp932）')
+@click.option('--dry-run', is_flag=True, help='検証と件数の確認のみ（書き込まない）')
+@click.option('--resume', is_flag=True, help='前回中断した位置から再開する')
+@click.option('--chunk-size', default=CHUNK_SIZE, show_default=True)
+@click.option('--errors', 'error_path', type=click.Path(dir_okay=False),
+              help='エラー行の出力先（既定: <PATH>.errors.csv）')
+@with_appcontext
+def import_command(path, fmt, encoding, dry_run, resume, chunk_size, error_path):
+    """教授データ（大学・学科を含む）をCSV / JSONLから一括登録する。"""
+    error_path = error_path or path + '.errors.csv'
+    # 再開時は前回分のエラー行を残して追記する（チェックポイントが無ければ最初からなので上書き）
+    append = (resume and not dry_run and load_checkpoint(path) > 0
+              and os.path.exists(error_path) and os.path.getsize(error_path) > 0)
+    with open(error_path, 'a' if append else 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        if not append:
+            writer.writerow(['line', 'error', 'row'])
+
+        def on_error(line_number, message, row):
+            writer.writerow([line_number, message,
+                             json.dumps(row, ensure_ascii=False) if isinstance(row, dict) else row])
+
+        def on_chunk(summary):
+            click.echo(f'{summary["skipped"] + summary["rows"]}行処理済み', err=True)
+
+        summary = import_file(path, fmt=fmt, encoding=encoding, dry_run=dry_run, resume=resume,
+                              chunk_size=chunk_size, on_error=on_error, on_chunk=on_chunk)
+
+    click.echo(
+        ('[dry-run] ' if dry_run else '')
+        + f'{summary.get("rows", 0)}行: 教授 {summary.get("added", 0)}件追加 / '
+        f'{summary.get("updated", 0)}件更新 / {summary.get("unchanged", 0)}件変更なし, '
+        f'大学 {summary.get("universities", 0)}件・学科 {summary.get("departments", 0)}件追加'
+        + (f', 前回までの{summary["skipped"]}行はスキップ' if summary.get('skipped') else '')
+    )
+    # 取り込んだ教授の写真サムネイルはワーカーのジョブで作成する
+    if not dry_run and (summary.get('added') or summary.get('updated')) and photos.count_pending():
+        jobs.enqueue_photos()
+        click.echo('写真サムネイルの作成をジョブに登録しました')
+    if summary.get('errors'):
+        click.echo(f'エラー {summary["errors"]}行 → {error_path}')
+    elif append:
+        click.echo(f'前回までのエラー行 → {error_path}')
+    else:
+        os.remove(error_path)
@@ -0,0 +1,271 @@
+"""Bulk ingest of scraped (or imported) professor records.
+
+Existing rows for the incoming (university_id, name) keys are loaded with
+one query and new records are deduplicated against them in memory. New
+rows go in with one batched INSERT ... ON CONFLICT DO NOTHING (both served
+by the ux_professors_university_name index), and changed fields on
+existing rows are written with one executemany UPDATE by primary key.
+
+Re-scrapes go through ``sync_pages``, which is incremental: pages whose
+HTML hash matches the stored ScrapePage are not parsed again (their
+records are replayed from the table), and if no page changed nothing else
+runs. Otherwise each merged record's hash is compared with
+``Professor.record_hash``; only mismatches are diffed field by field, and
+every addition, change, disappearance and return goes to the
+ProfessorChange log. Names are matched by ``dedup.name_key`` and the
+merge aliases, so spelling variants of a stored professor (full-width
+spaces, 旧字体) and professors merged away on the duplicates page are
+not added again.
+"""
+import hashlib
+import json
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import and_, insert, or_, select, update
+
+from models import db, Professor, ProfessorChange, ScrapePage
+import dedup
+import scraper
+
+# Fields refreshed on existing rows when the incoming value is non-empty and differs
+TEXT_FIELDS = ('title', 'email', 'phone', 'photo_url', 'specialty')
+UPDATE_FIELDS = TEXT_FIELDS + ('dept_id',)
+INSERT_FIELDS = TEXT_FIELDS + ('source_url',)
+# Scraped fields covered by Professor.record_hash
+HASH_FIELDS = ('name',) + TEXT_FIELDS + ('source_url',)
+
+
+def _insert_ignoring_conflicts(model, index_elements):
+    # Against the Table, not the mapped class: the ORM bulk path splits the
+    # executemany wherever a row's set of None values changes
+    table = model.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return insert(table)
+    return dialect_insert(table).on_conflict_do_nothing(index_elements=index_elements)
+
+
+def upsert_professors(university_id, records):
+    """Insert new and update changed professors of one university.
+
+    ``records`` are dicts as returned by ``scraper.parse_professors``,
+    optionally with a ``dept_id``. The caller commits. Returns
+    ``{'added': [ids], 'updated': [ids], 'unchanged': n}``.
+    """
+    return upsert_records([dict(rec, university_id=university_id) for rec in records])
+
+
+def _select_by_keys(names, *columns):
+    # One (university_id = ? AND name IN (...)) branch per university: unlike a
+    # row-value IN, each branch is an index search on SQLite as well
+    return db.session.execute(
+        select(Professor.id, Professor.university_id, Professor.name, *columns)
+        .where(or_(*(
+            and_(Professor.university_id == university_id, Professor.name.in_(group))
+            for university_id, group in names.items()
+        )))
+    )
+
+
+def upsert_records(records):
+    """Like upsert_professors, for records spanning several universities
+    (each carries its own ``university_id``)."""
+    names = defaultdict(set)
+    for rec in records:
+        name = (rec.get('name') or '').strip()
+        if name:
+            names[rec['university_id']].add(name)
+    existing = {
+        (row.university_id, row.name): row
+        for row in _select_by_keys(names, *(getattr(Professor, f) for f in UPDATE_FIELDS))
+    } if names else {}
+
+    now = datetime.utcnow()
+    new_rows, updates, seen = [], [], set()
+    unchanged = 0
+    for rec in records:
+        key = (rec['university_id'], (rec.get('name') or '').strip())
+        if not key[1] or key in seen:
+            continue
+        seen.add(key)
+        row = existing.get(key)
+        if row is None:
+            new_rows.append(dict(
+                university_id=key[0], name=key[1],
+                dept_id=rec.get('dept_id'),
+                **{f: rec.get(f) or '' for f in INSERT_FIELDS},
+            ))
+            continue
+        values = {f: getattr(row, f) for f in UPDATE_FIELDS}
+        changed = {f: rec[f] for f in UPDATE_FIELDS if rec.get(f) and rec[f] != values[f]}
+        if changed:
+            values.update(changed)
+            updates.append(dict(id=row.id, updated_at=now, **values))
+        else:
+            unchanged += 1
+
+    added = []
+    if new_rows:
+        # A plain executemany; RETURNING with ON CONFLICT would run row by
+        # row. The new ids are then read back through the same index.
+        db.session.execute(_insert_ignoring_conflicts(Professor, ['university_id', 'name']), new_rows)
+        new_names = defaultdict(set)
+        for row in new_rows:
+            new_names[row['university_id']].add(row['name'])
+        added = [row.id for row in _select_by_keys(new_names)]
+    if updates:
+        db.session.execute(update(Professor), updates)
+
+    return {'added': added, 'updated': [u['id'] for u in updates], 'unchanged': unchanged}
+
+
+# ─── incremental re-scrape ───
+
+def record_hash(rec):
+    """Digest of the scraped fields of ``rec``."""
+    payload = json.dumps([(rec.get(f) or '').strip() for f in HASH_FIELDS], ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def sync_scraped(university_id, records, page_urls, job_id=None):
+    """Apply a full scrape result of one university and log the changes.
+
+    ``records`` are merged scraper records and ``page_urls`` the pages they
+    came from. Professors whose ``source_url`` is one of those pages but who
+    are no longer listed are marked disappeared; professors from pages that
+    were not fetched this time are left alone. The caller commits. Returns
+    ``{'added', 'changed', 'disappeared', 'returned': [ids], 'unchanged': n}``.
+    """
+    rows = db.session.execute(
+        select(Professor.id, Professor.name, Professor.record_hash, Professor.disappeared_at,
+               Professor.source_url)
+        .where(Professor.university_id == university_id)
+        .order_by(Professor.id)
+    ).all()
+    # Keyed by dedup.name_key; of unmerged duplicates the oldest row is matched
+    existing = {}
+    for row in rows:
+        existing.setdefault(dedup.name_key(row.name), row)
+    by_id = {row.id: row for row in rows}
+    # Names merged into a professor of another university are skipped
+    merged_elsewhere = set()
+    for key, prof_id in dedup.alias_map(university_id).items():
+        if key in existing:
+            continue
+        if prof_id in by_id:
+            existing[key] = by_id[prof_id]
+        else:
+            merged_elsewhere.add(key)
+
+    now = datetime.utcnow()
+    incoming, matched, new_rows, mismatched, returned = {}, set(), [], [], []
+    for rec in records:
+        name = (rec.get('name') or '').strip()
+        key = dedup.name_key(name)
+        if not key or key in incoming or key in merged_elsewhere:
+            continue
+        row = existing.get(key)
+        if row is not None and row.id in matched:
+            continue  # the same professor listed under its merged name as well
+        incoming[key] = digest = record_hash(rec)
+        if row is None:
+            new_rows.append(dict(
+                university_id=university_id, name=name, dept_id=rec.get('dept_id'),
+                record_hash=digest, **{f: rec.get(f) or '' for f in INSERT_FIELDS},
+            ))
+            continue
+        matched.add(row.id)
+        if row.disappeared_at is not None:
+            returned.append(row.id)
+        if row.record_hash != digest:
+            mismatched.append((row.id, rec, digest))
+
+    # Field-level diff, loading the current values of mismatched rows only
+    current = {
+        row.id: row for row in db.session.execute(
+            select(Professor.id, *(getattr(Professor, f) for f in TEXT_FIELDS + ('source_url',)))
+            .where(Professor.id.in_([prof_id for prof_id, _, _ in mismatched]))
+        )
+    } if mismatched else {}
+    updates, log, changed = [], [], []
+    for prof_id, rec, digest in mismatched:
+        row = current[prof_id]
+        diff = {f: [getattr(row, f), rec[f]] for f in TEXT_FIELDS if rec.get(f) and rec[f] != getattr(row, f)}
+        values = {f: getattr(row, f) for f in TEXT_FIELDS}
+        values.update({f: new for f, (_, new) in diff.items()})
+        updates.append(dict(id=prof_id, record_hash=digest, source_url=rec.get('source_url') or row.source_url,
+                            updated_at=now, **values))
+        if diff:
+            changed.append(prof_id)
+            log.append({'professor_id': prof_id, 'kind': 'changed', 'changes': json.dumps(diff, ensure_ascii=False)})
+
+    page_urls = set(page_urls)
+    # Unmerged spelling variants of a listed name are not reported as gone
+    disappeared = [
+        row.id for row in rows
+        if row.id not in matched and dedup.name_key(row.name) not in incoming
+        and row.disappeared_at is None and row.source_url in page_urls
+    ]
+
+    added = []
+    if new_rows:
+        db.session.execute(_insert_ignoring_conflicts(Professor, ['university_id', 'name']), new_rows)
+        added = [row.id for row in _select_by_keys({university_id: {r['name'] for r in new_rows}})]
+    if updates:
+        db.session.execute(update(Professor), updates)
+    if returned or disappeared:
+        db.session.execute(update(Professor), (
+            [{'id': prof_id, 'disappeared_at': None} for prof_id in returned]
+            + [{'id': prof_id, 'disappeared_at': now} for prof_id in disappeared]
+        ))
+
+    log += [{'professor_id': prof_id, 'kind': 'added', 'changes': None} for prof_id in added]
+    log += [{'professor_id': prof_id, 'kind': 'returned', 'changes': None} for prof_id in returned]
+    log += [{'professor_id': prof_id, 'kind': 'disappeared', 'changes': None} for prof_id in disappeared]
+    if log:
+        db.session.execute(insert(ProfessorChange.__table__), [
+            dict(entry, university_id=university_id, job_id=job_id, created_at=now) for entry in log
+        ])
+
+    return {'added': added, 'changed': changed, 'disappeared': disappeared, 'returned': returned,
+            'unchanged': len(matched) - len(set(changed) | set(returned))}
+
+
+def sync_pages(university_id, pages, job_id=None):
+    """Incrementally apply freshly fetched ``pages`` of one university.
+
+    Only pages whose content hash changed are parsed; when none changed the
+    professors are not touched at all. The caller commits. Returns the
+    sync_scraped result plus ``pages`` / ``parsed`` counts.
+    """
+    now = datetime.utcnow()
+    stored = {p.url: p for p in ScrapePage.query.filter_by(university_id=university_id)}
+    per_page, parsed = [], 0
+    for page in pages:
+        digest = scraper.content_hash(page.html)
+        entry = stored.get(page.url)
+        if entry is not None and entry.content_hash == digest:
+            entry.checked_at = now
+            per_page.append(entry.records)
+            continue
+        records = scraper.parse_page(page)
+        parsed += 1
+        if entry is None:
+            entry = ScrapePage(university_id=university_id, url=page.url)
+            db.session.add(entry)
+        entry.content_hash = digest
+        entry.records = records
+        entry.changed_at = entry.checked_at = now
+        per_page.append(records)
+
+    records = scraper.merge_professors(per_page, key=dedup.name_key)
+    summary = {'pages': len(pages), 'parsed': parsed}
+    if not parsed:
+        return dict(summary, added=[], changed=[], disappeared=[], returned=[], unchanged=len(records))
+    result = sync_scraped(university_id, records, [page.url for page in pages], job_id=job_id)
+    return dict(summary, **result)
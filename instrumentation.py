@@ -0,0 +1,219 @@
+"""Per-request performance instrumentation.
+
+SQLAlchemy cursor events count the queries of the current request and
+sum their time. Each response carries the numbers in a ``Server-Timing``
+header. When the request finishes, slow requests and repeated statements
+(likely N+1 lazy loads) are logged and per-endpoint metrics are recorded.
+Slow statements are logged wherever they run, including the job worker.
+The metrics are served in Prometheus text format at ``/metrics``
+(loopback or logged-in clients only). They are per process: with several
+gunicorn workers each reports its own.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+
+from flask import Response, abort, current_app, g, has_app_context, request, session
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable through app.config
+SLOW_REQUEST_MS = 1000
+SLOW_QUERY_MS = 200
+N_PLUS_ONE_THRESHOLD = 10
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+LOCAL_ADDRS = ('127.0.0.1', '::1')
+
+
+# ─── metrics ───
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class CounterMetric:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, labels
+        self._values = Counter()
+        self._lock = threading.Lock()
+
+    def inc(self, label_values=(), amount=1):
+        with self._lock:
+            self._values[tuple(label_values)] += amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            yield f'{self.name}{_labels(self.labels, label_values)} {value}'
+
+
+class HistogramMetric:
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets, labels=()):
+        self.name, self.help, self.labels = name, help, labels
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        with self._lock:
+            series = self._series.setdefault(tuple(label_values), [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        bounds = [f'le="{bound}"' for bound in self.buckets] + ['le="+Inf"']
+        for label_values, series in items:
+            counts = series[:len(self.buckets)] + [series[-1]]
+            for bound, count in zip(bounds, counts):
+                yield f'{self.name}_bucket{_labels(self.labels, label_values, bound)} {count}'
+            yield f'{self.name}_sum{_labels(self.labels, label_values)} {series[-2]}'
+            yield f'{self.name}_count{_labels(self.labels, label_values)} {series[-1]}'
+
+
+REQUEST_LATENCY = HistogramMetric(
+    'http_request_duration_seconds', 'Request latency by endpoint.',
+    LATENCY_BUCKETS, labels=('endpoint', 'method'))
+REQUESTS = CounterMetric(
+    'http_requests_total', 'Requests by endpoint and status.', labels=('endpoint', 'method', 'status'))
+REQUEST_QUERIES = HistogramMetric(
+    'db_queries_per_request', 'SQL statements executed per request.',
+    QUERY_COUNT_BUCKETS, labels=('endpoint',))
+REQUEST_SQL_TIME = CounterMetric(
+    'db_query_seconds_total', 'Time spent in SQL by endpoint.', labels=('endpoint',))
+N_PLUS_ONE = CounterMetric(
+    'db_repeated_statement_requests_total',
+    'Requests that repeated one statement more than the N+1 threshold.', labels=('endpoint',))
+SLOW_QUERIES = CounterMetric('db_slow_queries_total', 'Statements slower than SLOW_QUERY_MS.')
+
+METRICS = [REQUEST_LATENCY, REQUESTS, REQUEST_QUERIES, REQUEST_SQL_TIME, N_PLUS_ONE, SLOW_QUERIES]
+
+# Callables returning extra metrics as (name, type, help, [(labels dict, value)])
+collectors = []
+
+
+def render_metrics():
+    lines = []
+    for metric in METRICS:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        lines.extend(metric.samples())
+    for collect in collectors:
+        for name, kind, help, samples in collect():
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                lines.append(f'{name}{_labels(labels.keys(), labels.values())} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+# ─── SQL events ───
+
+def _config(key, default):
+    return current_app.config.get(key, default) if has_app_context() else default
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._instrumentation_start = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - getattr(context, '_instrumentation_start', time.perf_counter())
+    stats = g.get('_perf') if has_app_context() else None
+    if stats is not None:
+        stats.queries += 1
+        stats.sql_time += elapsed
+        stats.statements[statement] += 1
+    if elapsed * 1000 >= _config('SLOW_QUERY_MS', SLOW_QUERY_MS):
+        SLOW_QUERIES.inc()
+        logger.warning('slow query (%.0f ms): %s', elapsed * 1000, ' '.join(statement.split())[:500])
+
+
+# ─── request hooks ───
+
+class RequestStats:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.statements = Counter()
+        self.status = 500
+
+
+def _before_request():
+    g._perf = RequestStats()
+
+
+def _after_request(response):
+    stats = g.get('_perf')
+    if stats is None:
+        return response
+    stats.status = response.status_code
+    elapsed = time.perf_counter() - stats.start
+    # For streamed responses this covers only the work done before the first chunk
+    response.headers.add('Server-Timing', (
+        f'db;dur={stats.sql_time * 1000:.1f};desc="{stats.queries} queries", '
+        f'app;dur={elapsed * 1000:.1f}'
+    ))
+    return response
+
+
+def _teardown_request(exc):
+    stats = g.pop('_perf', None)
+    if stats is None:
+        return
+    elapsed = time.perf_counter() - stats.start
+    endpoint = request.endpoint or 'unmatched'
+    REQUEST_LATENCY.observe((endpoint, request.method), elapsed)
+    REQUESTS.inc((endpoint, request.method, stats.status if exc is None else 500))
+    REQUEST_QUERIES.observe((endpoint,), stats.queries)
+    REQUEST_SQL_TIME.inc((endpoint,), stats.sql_time)
+
+    threshold = _config('N_PLUS_ONE_THRESHOLD', N_PLUS_ONE_THRESHOLD)
+    repeated = [(n, sql) for sql, n in stats.statements.items() if n > threshold]
+    if repeated:
+        N_PLUS_ONE.inc((endpoint,))
+        for n, sql in sorted(repeated, reverse=True):
+            logger.warning('possible N+1 in %s %s: %d× %s',
+                           request.method, request.path, n, ' '.join(sql.split())[:300])
+    if elapsed * 1000 >= _config('SLOW_REQUEST_MS', SLOW_REQUEST_MS):
+        logger.warning('slow request %s %s: %.0f ms, %d queries, %.0f ms SQL',
+                       request.method, request.full_path.rstrip('?'), elapsed * 1000,
+                       stats.queries, stats.sql_time * 1000)
+
+
+def metrics():
+    if request.remote_addr not in LOCAL_ADDRS and not session.get('logged_in'):
+        abort(404)
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.add_url_rule('/metrics', 'metrics', metrics)
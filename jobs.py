@@ -0,0 +1,164 @@
+"""DB-backed background job queue.
+
+Jobs are rows in the ``jobs`` table. Web requests only enqueue them; a
+worker process (``python worker.py``) claims queued jobs one at a time
+with a conditional UPDATE, so several workers can share the queue safely.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from models import db, Job, University
+import ingest
+import photos
+import scraper
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 2
+# Running jobs record a heartbeat (at most every HEARTBEAT_INTERVAL) as they report
+# progress; one silent for STALE_AFTER (e.g. the worker was killed) is requeued
+HEARTBEAT_INTERVAL = timedelta(seconds=5)
+STALE_AFTER = timedelta(minutes=15)
+# Every running worker sweeps for stale jobs (and due photo retries) this often, not only when it starts
+REQUEUE_INTERVAL = 60
+
+
+def enqueue(kind, university_id=None):
+    job = Job(kind=kind, university_id=university_id, status='queued')
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def enqueue_photos(university_id=None):
+    """Queue a thumbnail job unless one is already waiting for the same scope."""
+    job = Job.query.filter_by(kind='photos', university_id=university_id, status='queued').first()
+    return job or enqueue('photos', university_id)
+
+
+def claim_next(worker_id):
+    """Atomically move the oldest queued job to 'running' and return it."""
+    while True:
+        job_id = db.session.query(Job.id).filter_by(status='queued').order_by(Job.id).limit(1).scalar()
+        if job_id is None:
+            return None
+        now = datetime.utcnow()
+        claimed = Job.query.filter_by(id=job_id, status='queued').update(
+            {'status': 'running', 'started_at': now, 'heartbeat_at': now, 'worker': worker_id},
+            synchronize_session=False,
+        )
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, job_id)
+
+
+def requeue_stale():
+    cutoff = datetime.utcnow() - STALE_AFTER
+    last_seen = db.func.coalesce(Job.heartbeat_at, Job.started_at)
+    count = Job.query.filter(Job.status == 'running', last_seen < cutoff).update(
+        {'status': 'queued', 'started_at': None, 'heartbeat_at': None, 'worker': None},
+        synchronize_session=False)
+    db.session.commit()
+    return count
+
+
+def set_progress(job, progress, total):
+    """Record progress; doubles as the heartbeat that keeps the job from
+    being requeued. Committed at most every HEARTBEAT_INTERVAL (and at the end)."""
+    now = datetime.utcnow()
+    job.progress = progress
+    job.total = total
+    if progress >= total or job.heartbeat_at is None or now - job.heartbeat_at >= HEARTBEAT_INTERVAL:
+        job.heartbeat_at = now
+        db.session.commit()
+
+
+def run_scrape(job):
+    u = db.session.get(University, job.university_id)
+    if u is None or not u.url:
+        raise RuntimeError('大学のURLが登録されていません')
+
+    pages, error = scraper.fetch_university(
+        u.url,
+        max_depth=current_app.config['SCRAPE_CRAWL_DEPTH'],
+        on_progress=lambda done, total: set_progress(job, done, total),
+    )
+    if error:
+        raise RuntimeError(f'スクレイピングエラー: {error}')
+
+    # Only pages that changed since the last run are parsed; differences go to the change log
+    result = ingest.sync_pages(u.id, pages, job_id=job.id)
+    db.session.commit()
+    message = (f'スクレイピング完了: {len(result["added"])}件追加 / '
+               f'{len(result["changed"])}件更新 / {result["unchanged"]}件変更なし')
+    if result['disappeared'] or result['returned']:
+        message += f' / {len(result["disappeared"])}件掲載終了 / {len(result["returned"])}件再掲載'
+    if photos.count_pending(u.id):
+        enqueue_photos(u.id)
+    return message + f'（変更ページ {result["parsed"]}/{result["pages"]}）'
+
+
+def run_photos(job):
+    result = photos.sync_photos(job.university_id, on_progress=lambda done, total: set_progress(job, done, total))
+    return f'写真サムネイル作成: {result["stored"]}件 / 取得失敗 {result["failed"]}件'
+
+
+HANDLERS = {
+    'scrape': run_scrape,
+    'photos': run_photos,
+}
+
+
+def run_job(job):
+    try:
+        message = HANDLERS[job.kind](job)
+    except Exception as e:
+        db.session.rollback()
+        logger.exception('job %s failed', job.id)
+        job.status = 'failed'
+        job.message = str(e)
+    else:
+        job.status = 'done'
+        job.message = message
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+
+def work(app, once=False, poll_interval=POLL_INTERVAL):
+    """Process jobs until interrupted (or until the queue is empty if ``once``)."""
+    worker_id = f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+    next_requeue = 0
+    while True:
+        with app.app_context():
+            if time.monotonic() >= next_requeue:
+                requeue_stale()
+                # Photo downloads that failed transiently and are due again (see photos.py)
+                if photos.retries_due():
+                    enqueue_photos()
+                next_requeue = time.monotonic() + REQUEUE_INTERVAL
+            job = claim_next(worker_id)
+            if job is not None:
+                logger.info('running job %s (%s)', job.id, job.kind)
+                run_job(job)
+            db.session.remove()
+        if job is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+
+
+def start_worker_thread(app):
+    """Run a worker inside the current process (for single-process setups).
+
+    Called from the WSGI factory only, never at import: CLI commands such as
+    ``db upgrade`` must not claim jobs, which would stay 'running' on exit.
+    """
+    thread = threading.Thread(target=work, args=(app,), name='job-worker', daemon=True)
+    thread.start()
+    return thread
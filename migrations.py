@@ -0,0 +1,297 @@
+"""Versioned schema migrations.
+
+``db.create_all()`` only creates missing tables, so changes to existing
+tables (new indexes, columns, data moves) are listed here as numbered
+steps. Each step runs once, in its own transaction, and is recorded in
+``schema_migrations``. Steps must be idempotent because on a fresh
+database ``create_all`` has already built the current schema. Steps write
+through ``text()`` or lightweight ``table()`` constructs, never the mapped
+model tables, whose columns may be newer than the schema being upgraded.
+
+Nothing runs at import time: the schema is created or upgraded once per
+deploy with ``flask --app app db upgrade`` (the release / pre-deploy step),
+so web and worker processes boot without touching the database.
+``flask --app app db status`` lists applied and pending steps.
+"""
+import json
+import logging
+from datetime import datetime
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import bindparam, column, inspect, table, text
+
+from models import db, CustomFieldValue, Job, Professor, SalesInfo
+import custom_values
+import dedup
+import search
+
+logger = logging.getLogger(__name__)
+
+NAME_LENGTH = Professor.__table__.c.name.type.length
+
+
+class SchemaMigration(db.Model):
+    __tablename__ = 'schema_migrations'
+    version = db.Column(db.Integer, primary_key=True)
+    description = db.Column(db.String(200))
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# ─── helpers ───
+
+def _create_unique_index(conn, name, table, columns):
+    cols = ', '.join(columns)
+    dupes = conn.execute(text(
+        f'SELECT {cols}, COUNT(*) FROM {table} GROUP BY {cols} HAVING COUNT(*) > 1 LIMIT 5'
+    )).fetchall()
+    if dupes:
+        raise RuntimeError(
+            f'{table} に ({cols}) の重複があるため一意インデックス {name} を作成できません: '
+            + ', '.join(str(tuple(row[:-1])) for row in dupes)
+        )
+    conn.execute(text(f'CREATE UNIQUE INDEX IF NOT EXISTS {name} ON {table} ({cols})'))
+
+
+def _create_index(conn, name, table, columns):
+    conn.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({", ".join(columns)})'))
+
+
+def _has_column(conn, table, column):
+    return any(c['name'] == column for c in inspect(conn).get_columns(table))
+
+
+def _add_column(conn, column):
+    # ``column`` is the mapped model column; its type is compiled for the dialect
+    table = column.table.name
+    if not _has_column(conn, table, column.name):
+        conn.execute(text(
+            f'ALTER TABLE {table} ADD COLUMN {column.name} {column.type.compile(dialect=conn.dialect)}'
+        ))
+
+
+# ─── steps ───
+
+def m001_professor_unique_name(conn):
+    # The old forms allowed repeated names. The oldest row keeps the name and
+    # later ones get a suffix, so the deploy is not blocked; they are logged and
+    # still grouped on /duplicates (name_key ignores the suffix) to be merged
+    rows = conn.execute(text(
+        'SELECT p.id, p.university_id, p.name FROM professors p WHERE p.id > ('
+        'SELECT MIN(o.id) FROM professors o WHERE o.university_id = p.university_id AND o.name = p.name)'
+    )).fetchall()
+    renamed = []
+    for prof_id, university_id, name in rows:
+        suffix = dedup.DUPLICATE_SUFFIX.format(id=prof_id)
+        renamed.append({'id': prof_id, 'name': name[:NAME_LENGTH - len(suffix)] + suffix})
+        logger.warning('duplicate professor name renamed: id=%s university_id=%s %r -> %r',
+                       prof_id, university_id, name, renamed[-1]['name'])
+    if renamed:
+        conn.execute(text('UPDATE professors SET name = :name WHERE id = :id'), renamed)
+    _create_unique_index(conn, 'ux_professors_university_name', 'professors', ['university_id', 'name'])
+
+
+def m002_professor_dept_index(conn):
+    _create_index(conn, 'ix_professors_dept_id', 'professors', ['dept_id'])
+
+
+def m003_tags_from_json(conn):
+    # Copy SalesInfo.tags JSON arrays into tags / sales_info_tags. The old
+    # column is left in place (no longer mapped) so the data is not lost.
+    if not _has_column(conn, 'sales_info', 'tags'):
+        return
+    rows = conn.execute(text(
+        "SELECT id, tags FROM sales_info WHERE tags IS NOT NULL AND tags NOT IN ('', '[]')"
+    )).fetchall()
+    parsed = []
+    for sales_info_id, raw in rows:
+        try:
+            names = json.loads(raw)
+        except ValueError:
+            continue
+        if isinstance(names, list):
+            names = [str(n).strip() for n in names if str(n).strip()]
+            parsed.append((sales_info_id, list(dict.fromkeys(names))))
+
+    tag_ids = {name: tid for tid, name in conn.execute(text('SELECT id, name FROM tags'))}
+    new_names = sorted({n for _, names in parsed for n in names} - set(tag_ids))
+    if new_names:
+        conn.execute(text('INSERT INTO tags (name) VALUES (:name)'), [{'name': n} for n in new_names])
+        tag_ids = {name: tid for tid, name in conn.execute(text('SELECT id, name FROM tags'))}
+
+    linked = {tuple(r) for r in conn.execute(text('SELECT sales_info_id, tag_id FROM sales_info_tags'))}
+    links = [
+        {'sales_info_id': sid, 'tag_id': tag_ids[name], 'position': pos}
+        for sid, names in parsed
+        for pos, name in enumerate(names)
+        if (sid, tag_ids[name]) not in linked
+    ]
+    if links:
+        conn.execute(text(
+            'INSERT INTO sales_info_tags (sales_info_id, tag_id, position) '
+            'VALUES (:sales_info_id, :tag_id, :position)'
+        ), links)
+
+
+def m004_search_index(conn):
+    search.install(conn)
+
+
+def m005_custom_value_professor_index(conn):
+    _create_index(conn, 'ix_custom_field_values_professor_id', 'custom_field_values', ['professor_id'])
+
+
+def m006_custom_value_unique(conn):
+    # Keep the oldest row of any duplicated (professor_id, custom_field_id):
+    # it is the one update_custom_fields kept writing to
+    conn.execute(text(
+        'DELETE FROM custom_field_values WHERE id NOT IN ('
+        'SELECT MIN(id) FROM custom_field_values GROUP BY professor_id, custom_field_id)'
+    ))
+    _create_unique_index(conn, 'ux_custom_field_values_professor_field', 'custom_field_values',
+                         ['professor_id', 'custom_field_id'])
+    # the unique index leads with professor_id, so the single-column one is redundant
+    conn.execute(text('DROP INDEX IF EXISTS ix_custom_field_values_professor_id'))
+
+
+def m007_custom_value_typed_columns(conn):
+    _add_column(conn, CustomFieldValue.__table__.c.value_number)
+    _add_column(conn, CustomFieldValue.__table__.c.value_date)
+    rows = conn.execute(text(
+        'SELECT v.id, f.field_type, v.value FROM custom_field_values v '
+        "JOIN custom_fields f ON f.id = v.custom_field_id WHERE f.field_type IN ('number', 'date')"
+    )).fetchall()
+    if rows:
+        # A lightweight table, not the mapped one: later columns (and their
+        # onupdate defaults) do not exist yet when this step runs
+        values = table('custom_field_values', column('id'), column('value_number', db.Float),
+                       column('value_date', db.Date))
+        conn.execute(
+            values.update()
+            .where(values.c.id == bindparam('value_id'))
+            .values(value_number=bindparam('value_number'), value_date=bindparam('value_date')),
+            [{'value_id': value_id, **custom_values.typed_values(field_type, value)}
+             for value_id, field_type, value in rows],
+        )
+    _create_index(conn, 'ix_custom_field_values_field_number', 'custom_field_values',
+                  ['custom_field_id', 'value_number'])
+    _create_index(conn, 'ix_custom_field_values_field_date', 'custom_field_values',
+                  ['custom_field_id', 'value_date'])
+
+
+def m008_professor_scrape_tracking(conn):
+    # scrape_pages / professor_changes are new tables and come from create_all
+    _add_column(conn, Professor.__table__.c.record_hash)
+    _add_column(conn, Professor.__table__.c.disappeared_at)
+
+
+def m009_updated_at_tracking(conn):
+    # Existing rows get "now" so the first delta sync after the upgrade sees them once
+    now = datetime.utcnow()
+    for column in (SalesInfo.__table__.c.updated_at, CustomFieldValue.__table__.c.updated_at):
+        _add_column(conn, column)
+    for table in ('professors', 'sales_info', 'custom_field_values'):
+        conn.execute(text(f'UPDATE {table} SET updated_at = :now WHERE updated_at IS NULL')
+                     .bindparams(bindparam('now', type_=db.DateTime)), {'now': now})
+        _create_index(conn, f'ix_{table}_updated_at', table, ['updated_at', 'id'])
+
+
+def m010_professor_photo_cache(conn):
+    _add_column(conn, Professor.__table__.c.photo_hash)
+    _add_column(conn, Professor.__table__.c.photo_source)
+    _create_index(conn, 'ix_professors_photo_hash', 'professors', ['photo_hash'])
+
+
+def m011_job_heartbeat(conn):
+    _add_column(conn, Job.__table__.c.heartbeat_at)
+
+
+def m012_search_bigram_index(conn):
+    search.install_bigrams(conn)
+
+
+def m013_professor_photo_retry(conn):
+    _add_column(conn, Professor.__table__.c.photo_failures)
+    _add_column(conn, Professor.__table__.c.photo_retry_at)
+    _create_index(conn, 'ix_professors_photo_retry_at', 'professors', ['photo_retry_at'])
+
+
+MIGRATIONS = [
+    (1, 'professors (university_id, name) unique index', m001_professor_unique_name),
+    (2, 'professors dept_id index', m002_professor_dept_index),
+    (3, 'tags / sales_info_tags from sales_info.tags JSON', m003_tags_from_json),
+    (4, 'full-text search index (FTS5 trigram / pg_trgm)', m004_search_index),
+    (5, 'custom_field_values professor_id index', m005_custom_value_professor_index),
+    (6, 'custom_field_values (professor_id, custom_field_id) unique index', m006_custom_value_unique),
+    (7, 'custom_field_values typed value_number / value_date columns', m007_custom_value_typed_columns),
+    (8, 'professors record_hash / disappeared_at for incremental re-scrapes', m008_professor_scrape_tracking),
+    (9, 'updated_at on sales_info / custom_field_values, updated_at indexes', m009_updated_at_tracking),
+    (10, 'professors photo_hash / photo_source for local thumbnails', m010_professor_photo_cache),
+    (11, 'jobs heartbeat_at for requeueing stalled jobs', m011_job_heartbeat),
+    (12, 'bigram index for two-character search terms', m012_search_bigram_index),
+    (13, 'professors photo_failures / photo_retry_at for retrying photo downloads', m013_professor_photo_retry),
+]
+
+
+def upgrade():
+    """Create missing tables and apply pending migrations. Returns applied versions."""
+    db.create_all()
+    applied = {v for (v,) in db.session.query(SchemaMigration.version)}
+    db.session.rollback()
+    done = []
+    for version, description, step in MIGRATIONS:
+        if version in applied:
+            continue
+        logger.info('applying migration %03d: %s', version, description)
+        with db.engine.begin() as conn:
+            if conn.dialect.name == 'postgresql':
+                # Index builds and backfills on large tables may run far longer than
+                # DB_STATEMENT_TIMEOUT_MS (or a role default) allows web requests
+                conn.execute(text('SET LOCAL statement_timeout = 0'))
+            step(conn)
+            conn.execute(SchemaMigration.__table__.insert().values(
+                version=version, description=description, applied_at=datetime.utcnow()))
+        done.append(version)
+    return done
+
+
+def status():
+    """``[(version, description, applied_at or None)]`` for every step.
+    Does not create anything."""
+    if not inspect(db.engine).has_table(SchemaMigration.__tablename__):
+        applied = {}
+    else:
+        applied = dict(db.session.query(SchemaMigration.version, SchemaMigration.applied_at))
+        db.session.rollback()
+    return [(version, description, applied.get(version)) for version, description, _ in MIGRATIONS]
+
+
+# ─── CLI ───
+
+@click.group('db')
+def db_command():
+    """スキーマの作成・マイグレーション（デプロイ時に1回だけ実行する）"""
+
+
+@db_command.command('upgrade')
+@with_appcontext
+def upgrade_command():
+    """テーブルを作成し、未適用のマイグレーションを適用する。"""
+    done = upgrade()
+    if done:
+        click.echo('適用: ' + ', '.join(f'{v:03d}' for v in done))
+    else:
+        click.echo('スキーマは最新です')
+
+
+@db_command.command('status')
+@with_appcontext
+def status_command():
+    """マイグレーションの適用状況を表示する。"""
+    rows = status()
+    for version, description, applied_at in rows:
+        state = applied_at.strftime('%Y-%m-%d %H:%M') if applied_at else '未適用'
+        click.echo(f'{version:03d}  {state:16}  {description}')
+    pending = sum(applied_at is None for _, _, applied_at in rows)
+    if pending:
+        click.echo(f'未適用 {pending}件: flask --app app db upgrade を実行してください')
@@ -15,6 +15,8 @@ class University(db.Model):
 
     departments = db.relationship('Department', backref='university', lazy=True, cascade='all, delete-orphan')
     professors = db.relationship('Professor', backref='university', lazy=True, cascade='all, delete-orphan')
+    jobs = db.relationship('Job', backref='university', lazy=True, cascade='all, delete-orphan')
+    scrape_pages = db.relationship('ScrapePage', backref='university', lazy=True, cascade='all, delete-orphan')
 
     def to_dict(self):
         return {
@@ -45,9 +47,15 @@ class Department(db.Model):
 
 class Professor(db.Model):
     __tablename__ = 'professors'
+    __table_args__ = (
+        db.Index('ux_professors_university_name', 'university_id', 'name', unique=True),
+        db.Index('ix_professors_updated_at', 'updated_at', 'id'),
+        db.Index('ix_professors_photo_hash', 'photo_hash'),
+        db.Index('ix_professors_photo_retry_at', 'photo_retry_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     university_id = db.Column(db.Integer, db.ForeignKey('universities.id'), nullable=False)
-    dept_id = db.Column(db.Integer, db.ForeignKey('departments.id'), nullable=True)
+    dept_id = db.Column(db.Integer, db.ForeignKey('departments.id'), nullable=True, index=True)
     name = db.Column(db.String(200), nullable=False)
     title = db.Column(db.String(100))
     email = db.Column(db.String(200))
@@ -55,11 +63,23 @@ class Professor(db.Model):
     photo_url = db.Column(db.String(500))
     specialty = db.Column(db.String(500))
     source_url = db.Column(db.String(500))
+    # Hash of the scraped fields as last seen on source_url (see ingest.record_hash)
+    record_hash = db.Column(db.String(40))
+    # Set when a re-scrape of source_url no longer lists this professor
+    disappeared_at = db.Column(db.DateTime)
+    # Local thumbnail of photo_url (see photos.py): content hash, and the URL it was made from
+    photo_hash = db.Column(db.String(64))
+    photo_source = db.Column(db.String(500))
+    # Transient download failures of photo_source in a row, and when to try it again
+    photo_failures = db.Column(db.Integer, default=0)
+    photo_retry_at = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     sales_info = db.relationship('SalesInfo', backref='professor', lazy=True, uselist=False, cascade='all, delete-orphan')
     custom_field_values = db.relationship('CustomFieldValue', backref='professor', lazy=True, cascade='all, delete-orphan')
+    changes = db.relationship('ProfessorChange', backref='professor', lazy=True, cascade='all, delete-orphan',
+                              order_by='ProfessorChange.id.desc()')
 
     def to_dict(self):
         return {
@@ -73,6 +93,7 @@ class Professor(db.Model):
             'photo_url': self.photo_url,
             'specialty': self.specialty,
             'source_url': self.source_url,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
         }
 
 
@@ -81,24 +102,39 @@ SALES_STATUSES = ['未接触', 'アプローチ中', '検討中', '商談中', '
 
 class SalesInfo(db.Model):
     __tablename__ = 'sales_info'
+    __table_args__ = (
+        db.Index('ix_sales_info_updated_at', 'updated_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     professor_id = db.Column(db.Integer, db.ForeignKey('professors.id'), nullable=False, unique=True)
     status = db.Column(db.String(50), default='未接触')
     last_contact = db.Column(db.Date, nullable=True)
     next_contact = db.Column(db.Date, nullable=True)
     memo = db.Column(db.Text)
-    _tags = db.Column('tags', db.Text, default='[]')
+    # Also bumped when only the tags change (see tracking.py)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    tag_links = db.relationship('SalesInfoTag', lazy=True, order_by='SalesInfoTag.position',
+                                cascade='all, delete-orphan')
 
     @property
     def tags(self):
-        try:
-            return json.loads(self._tags or '[]')
-        except Exception:
-            return []
+        return [link.tag.name for link in self.tag_links]
 
     @tags.setter
     def tags(self, value):
-        self._tags = json.dumps(value, ensure_ascii=False)
+        names = list(dict.fromkeys(t.strip() for t in value if t and t.strip()))
+        current = {link.tag.name: link for link in self.tag_links}
+        missing = [n for n in names if n not in current]
+        known = {t.name: t for t in Tag.query.filter(Tag.name.in_(missing))} if missing else {}
+        links = []
+        for position, name in enumerate(names):
+            link = current.get(name)
+            if link is None:
+                link = SalesInfoTag(tag=known.get(name) or Tag(name=name))
+            link.position = position
+            links.append(link)
+        self.tag_links = links
 
     def to_dict(self):
         return {
@@ -109,9 +145,31 @@ class SalesInfo(db.Model):
             'next_contact': self.next_contact.isoformat() if self.next_contact else None,
             'memo': self.memo,
             'tags': self.tags,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+
+class Tag(db.Model):
+    __tablename__ = 'tags'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False, unique=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
         }
 
 
+class SalesInfoTag(db.Model):
+    __tablename__ = 'sales_info_tags'
+    sales_info_id = db.Column(db.Integer, db.ForeignKey('sales_info.id'), primary_key=True)
+    tag_id = db.Column(db.Integer, db.ForeignKey('tags.id'), primary_key=True, index=True)
+    position = db.Column(db.Integer, default=0)
+
+    tag = db.relationship('Tag', lazy='joined')
+
+
 class CustomField(db.Model):
     __tablename__ = 'custom_fields'
     id = db.Column(db.Integer, primary_key=True)
@@ -145,10 +203,20 @@ class CustomField(db.Model):
 
 class CustomFieldValue(db.Model):
     __tablename__ = 'custom_field_values'
+    __table_args__ = (
+        db.Index('ux_custom_field_values_professor_field', 'professor_id', 'custom_field_id', unique=True),
+        db.Index('ix_custom_field_values_field_number', 'custom_field_id', 'value_number'),
+        db.Index('ix_custom_field_values_field_date', 'custom_field_id', 'value_date'),
+        db.Index('ix_custom_field_values_updated_at', 'updated_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     professor_id = db.Column(db.Integer, db.ForeignKey('professors.id'), nullable=False)
     custom_field_id = db.Column(db.Integer, db.ForeignKey('custom_fields.id'), nullable=False)
     value = db.Column(db.Text)
+    # Typed copies of value for number / date fields (see custom_values.typed_values)
+    value_number = db.Column(db.Float)
+    value_date = db.Column(db.Date)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     def to_dict(self):
         return {
@@ -156,4 +224,149 @@ class CustomFieldValue(db.Model):
             'professor_id': self.professor_id,
             'custom_field_id': self.custom_field_id,
             'value': self.value,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
         }
+
+
+class Tombstone(db.Model):
+    """Marks a deleted Professor / SalesInfo / CustomFieldValue row for the
+    delta sync feed (see tracking.py)."""
+    __tablename__ = 'tombstones'
+    __table_args__ = (
+        db.Index('ix_tombstones_deleted_at', 'deleted_at', 'id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(30), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    professor_id = db.Column(db.Integer)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def to_dict(self):
+        return {
+            'entity': self.entity,
+            'id': self.entity_id,
+            'professor_id': self.professor_id,
+            'deleted_at': self.deleted_at.isoformat() if self.deleted_at else None,
+        }
+
+
+JOB_STATUSES = ['queued', 'running', 'done', 'failed']
+
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False, default='scrape')
+    university_id = db.Column(db.Integer, db.ForeignKey('universities.id'), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)
+    progress = db.Column(db.Integer, default=0)
+    total = db.Column(db.Integer, default=0)
+    message = db.Column(db.Text)
+    worker = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    # Refreshed while running (jobs.set_progress); stale jobs are requeued by it
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    @property
+    def active(self):
+        return self.status in ('queued', 'running')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'university_id': self.university_id,
+            'status': self.status,
+            'progress': self.progress,
+            'total': self.total,
+            'message': self.message,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class ScrapePage(db.Model):
+    """A page fetched by the last scrape of a university, with the hash of
+    its HTML and what was parsed from it, so unchanged pages are not parsed
+    again."""
+    __tablename__ = 'scrape_pages'
+    __table_args__ = (
+        db.Index('ux_scrape_pages_university_url', 'university_id', 'url', unique=True),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    university_id = db.Column(db.Integer, db.ForeignKey('universities.id'), nullable=False)
+    url = db.Column(db.String(500), nullable=False)
+    content_hash = db.Column(db.String(40), nullable=False)
+    _records = db.Column('records', db.Text, default='[]')
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    checked_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @property
+    def records(self):
+        try:
+            return json.loads(self._records or '[]')
+        except Exception:
+            return []
+
+    @records.setter
+    def records(self, value):
+        self._records = json.dumps(value, ensure_ascii=False)
+
+
+CHANGE_KINDS = ['added', 'changed', 'disappeared', 'returned', 'merged']
+
+
+class ProfessorChange(db.Model):
+    """One entry of the re-scrape change log. ``changes`` holds
+    ``{field: [old, new]}`` for 'changed' and 'merged' entries."""
+    __tablename__ = 'professor_changes'
+    id = db.Column(db.Integer, primary_key=True)
+    professor_id = db.Column(db.Integer, db.ForeignKey('professors.id'), nullable=False, index=True)
+    university_id = db.Column(db.Integer, db.ForeignKey('universities.id'), nullable=False, index=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('jobs.id', ondelete='SET NULL'), nullable=True)
+    kind = db.Column(db.String(20), nullable=False)
+    _changes = db.Column('changes', db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    @property
+    def changes(self):
+        try:
+            return json.loads(self._changes or '{}')
+        except Exception:
+            return {}
+
+
+class PhotoThumbnail(db.Model):
+    """A professor photo thumbnail, keyed by the SHA-256 of its JPEG bytes
+    (see photos.py). Shared by the web and worker services."""
+    __tablename__ = 'photo_thumbnails'
+    hash = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class ProfessorAlias(db.Model):
+    """A name under which a professor was listed before being merged (see
+    dedup.py), so re-scrapes map that name to the remaining professor."""
+    __tablename__ = 'professor_aliases'
+    __table_args__ = (
+        db.Index('ux_professor_aliases_university_key', 'university_id', 'name_key', unique=True),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    professor_id = db.Column(db.Integer, db.ForeignKey('professors.id', ondelete='CASCADE'),
+                             nullable=False, index=True)
+    university_id = db.Column(db.Integer, db.ForeignKey('universities.id', ondelete='CASCADE'), nullable=False)
+    # dedup.name_key of the merged name
+    name_key = db.Column(db.String(200), nullable=False)
+
+
+class DuplicateDismissal(db.Model):
+    """A pair of professors marked as not duplicates (``professor_id < other_id``)."""
+    __tablename__ = 'duplicate_dismissals'
+    professor_id = db.Column(db.Integer, db.ForeignKey('professors.id', ondelete='CASCADE'), primary_key=True)
+    other_id = db.Column(db.Integer, db.ForeignKey('professors.id', ondelete='CASCADE'), primary_key=True,
+                         index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,127 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PageCache:
+    """Content-addressed on-disk cache of fetched pages, keyed by URL.
+
+    Each entry stores the decoded HTML, the detected encoding and the HTTP
+    validators (ETag / Last-Modified) as a gzipped JSON file named after the
+    SHA-256 of the URL. Entries older than ``ttl`` seconds are stale: they
+    are revalidated with a conditional GET but can still be replayed offline.
+    The file mtime doubles as the LRU clock, and the least recently used
+    entries are evicted once the cache grows past ``max_bytes``.
+    """
+
+    def __init__(self, directory, ttl=3600, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total_bytes = None
+
+    @staticmethod
+    def key(url):
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def _path(self, url):
+        key = self.key(url)
+        return os.path.join(self.directory, key[:2], key + '.json.gz')
+
+    def get(self, url):
+        """Return the cached entry for ``url`` (with a ``fresh`` flag) or None."""
+        path = self._path(url)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        if entry.get('url') != url:
+            return None
+        entry['fresh'] = time.time() - entry.get('fetched_at', 0) < self.ttl
+        return entry
+
+    def put(self, url, html, encoding, etag=None, last_modified=None):
+        """Store a fetched page and return its entry, or None if it could not
+        be written (disk full, read-only directory): the page is then simply
+        not cached, as ``get`` treats unreadable entries as misses."""
+        path = self._path(url)
+        entry = {
+            'url': url,
+            'html': html,
+            'encoding': encoding,
+            'etag': etag,
+            'last_modified': last_modified,
+            'fetched_at': time.time(),
+        }
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning('page cache write failed: %s (%s)', url, e)
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return None
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes += os.path.getsize(path) - old_size
+        self._evict()
+        entry['fresh'] = True
+        return entry
+
+    def touch(self, url):
+        """Mark a stale entry fresh again after a 304 revalidation."""
+        entry = self.get(url)
+        if entry is not None:
+            entry = self.put(url, entry['html'], entry['encoding'],
+                             entry['etag'], entry['last_modified'])
+        return entry
+
+    def _files(self):
+        for root, _dirs, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith('.json.gz'):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    yield st.st_mtime, st.st_size, path
+
+    def _evict(self):
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(size for _mtime, size, _path in self._files())
+            if self._total_bytes <= self.max_bytes:
+                return
+            for _mtime, size, path in sorted(self._files()):
+                if self._total_bytes <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                self._total_bytes -= size
+
+    def clear(self):
+        with self._lock:
+            for _mtime, _size, path in list(self._files()):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._total_bytes = 0
@@ -0,0 +1,269 @@
+"""Local thumbnails of professor photos.
+
+Pages used to hotlink ``Professor.photo_url``, so every list render made
+the browser pull full-size images from university servers. Now the job
+worker downloads each photo once and makes a fixed-size JPEG thumbnail.
+The thumbnail is stored in the ``photo_thumbnails`` table under the SHA-256
+of its bytes, so the web and worker services share it without a shared
+disk, and it survives deploys. The row keeps that hash in ``photo_hash``
+and the URL it was made from in ``photo_source``. A row whose
+``photo_url`` no longer matches ``photo_source`` is pending. It is picked
+up by the ``photos`` job, which is queued after every scrape or edit.
+
+A download that fails for a transient reason (timeout, connection error,
+HTTP 429 or 5xx) is retried with exponential backoff: ``photo_retry_at``
+makes the row pending again, and the job worker queues a ``photos`` job
+when retries fall due. Other failures wait until ``photo_url`` changes.
+
+The hash changes whenever the image changes, so ``/photos/<hash>.jpg``
+is served as immutable for a year. Web requests never contact the remote
+host. If a thumbnail is missing, the request gets an uncached placeholder,
+and the rows that point at the thumbnail become pending again.
+"""
+import hashlib
+import io
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+import click
+import requests
+from flask import Response, abort, request
+from flask.cli import with_appcontext
+from PIL import Image, ImageOps, UnidentifiedImageError
+from sqlalchemy import select, update
+
+from models import db, Professor, PhotoThumbnail
+import ingest
+import scraper
+
+logger = logging.getLogger(__name__)
+
+# Square thumbnails: 2x the 64px list photo, also used for the 120px detail photo
+THUMB_SIZE = 128
+JPEG_QUALITY = 85
+MAX_BYTES = 10 * 1024 * 1024
+FETCH_TIMEOUT = 15
+MAX_WORKERS = 8
+PER_HOST = 2
+BATCH_SIZE = 200
+CACHE_MAX_AGE = 365 * 24 * 3600
+# Transient failures are retried after RETRY_BASE, doubling each time, at most MAX_RETRIES times
+RETRY_BASE = timedelta(minutes=10)
+MAX_RETRIES = 5
+
+HASH_RE = re.compile(r'^[0-9a-f]{64}$')
+PLACEHOLDER_SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="128" height="128" viewBox="0 0 128 128">'
+    '<rect width="128" height="128" fill="#f8f9fa"/>'
+    '<circle cx="64" cy="50" r="22" fill="#adb5bd"/>'
+    '<path d="M24 112c4-24 20-36 40-36s36 12 40 36z" fill="#adb5bd"/></svg>'
+)
+
+
+class PhotoError(Exception):
+    def __init__(self, message, transient=False):
+        super().__init__(message)
+        self.transient = transient
+
+
+# ─── thumbnails ───
+
+def make_thumbnail(data):
+    """JPEG bytes of a ``THUMB_SIZE`` square, center-cropped thumbnail of
+    the image in ``data``. Raises PhotoError if it is not an image."""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image = ImageOps.exif_transpose(image)
+            if image.mode in ('RGBA', 'LA', 'P'):
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, 'white')
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            thumb = ImageOps.fit(image.convert('RGB'), (THUMB_SIZE, THUMB_SIZE), Image.LANCZOS)
+    except (UnidentifiedImageError, OSError, ValueError, Image.DecompressionBombError) as e:
+        raise PhotoError(f'not an image: {e}') from e
+    out = io.BytesIO()
+    thumb.save(out, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+def store(thumbnails):
+    """Insert ``{hash: bytes}`` thumbnails that are not stored yet. The caller commits."""
+    if thumbnails:
+        known = set(db.session.scalars(
+            select(PhotoThumbnail.hash).where(PhotoThumbnail.hash.in_(thumbnails))))
+        rows = [{'hash': digest, 'data': data} for digest, data in thumbnails.items() if digest not in known]
+        if rows:
+            db.session.execute(ingest._insert_ignoring_conflicts(PhotoThumbnail, ['hash']), rows)
+
+
+def download(url):
+    """Raw bytes of the image at ``url``. Raises PhotoError."""
+    try:
+        with scraper.get_session().get(url, timeout=FETCH_TIMEOUT, stream=True) as resp:
+            if resp.status_code >= 400:
+                raise PhotoError(f'HTTP {resp.status_code}',
+                                 transient=resp.status_code == 429 or resp.status_code >= 500)
+            chunks, size = [], 0
+            for chunk in resp.iter_content(64 * 1024):
+                size += len(chunk)
+                if size > MAX_BYTES:
+                    raise PhotoError('image too large')
+                chunks.append(chunk)
+    except requests.RequestException as e:
+        raise PhotoError(str(e), transient=True) from e
+    return b''.join(chunks)
+
+
+def fetch_thumbnail(url):
+    """Download ``url`` and make its thumbnail. Returns ``(hash, bytes)``."""
+    thumbnail = make_thumbnail(download(url))
+    return hashlib.sha256(thumbnail).hexdigest(), thumbnail
+
+
+# ─── background sync ───
+
+def pending_query(university_id=None, now=None):
+    query = select(Professor.id, Professor.photo_url, Professor.photo_source, Professor.photo_failures).where(
+        Professor.photo_url != '',
+        (Professor.photo_source.is_(None)) | (Professor.photo_source != Professor.photo_url)
+        | (Professor.photo_retry_at <= (now or datetime.utcnow())),
+    )
+    if university_id is not None:
+        query = query.where(Professor.university_id == university_id)
+    return query
+
+
+def count_pending(university_id=None, now=None):
+    return db.session.execute(
+        select(db.func.count()).select_from(pending_query(university_id, now).subquery())
+    ).scalar()
+
+
+def retries_due(now=None):
+    """Whether a failed download is due for another try."""
+    return db.session.execute(
+        select(Professor.id).where(Professor.photo_retry_at <= (now or datetime.utcnow())).limit(1)
+    ).first() is not None
+
+
+def _failure(row, error, now):
+    """Column values recording a failed download of ``row``."""
+    failures = (row.photo_failures or 0) if row.photo_source == row.photo_url else 0
+    if not error.transient:
+        return {'photo_failures': failures, 'photo_retry_at': None}
+    failures += 1
+    retry_at = now + RETRY_BASE * 2 ** (failures - 1) if failures <= MAX_RETRIES else None
+    return {'photo_failures': failures, 'photo_retry_at': retry_at}
+
+
+def sync_photos(university_id=None, on_progress=None):
+    """Make thumbnails for every pending professor (of one university).
+
+    Downloads run on a bounded thread pool with at most ``PER_HOST``
+    requests per host. Each batch is written with one INSERT of the new
+    thumbnails and one executemany UPDATE, and committed. A photo that
+    cannot be fetched is recorded with no hash, so it shows the placeholder.
+    Transient failures get a ``photo_retry_at`` (see ``_failure``); the
+    others are retried only when ``photo_url`` changes. Returns
+    ``{'stored': n, 'failed': n}``.
+    """
+    host_locks = {}
+    host_locks_guard = threading.Lock()
+
+    def fetch_one(row):
+        host = urlparse(row.photo_url).netloc
+        with host_locks_guard:
+            lock = host_locks.setdefault(host, threading.BoundedSemaphore(PER_HOST))
+        with lock:
+            try:
+                return row, fetch_thumbnail(row.photo_url)
+            except PhotoError as e:
+                logger.warning('photo failed: %s (%s)', row.photo_url, e)
+                return row, e
+
+    # Fixed for the run: rows given a retry time now are not picked up again by it
+    now = datetime.utcnow()
+    total = count_pending(university_id, now)
+    stored = failed = 0
+    last_id = 0
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        while True:
+            rows = db.session.execute(
+                pending_query(university_id, now).where(Professor.id > last_id)
+                .order_by(Professor.id).limit(BATCH_SIZE)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            values, thumbnails = [], {}
+            for row, result in pool.map(fetch_one, rows):
+                value = {'id': row.id, 'photo_hash': None, 'photo_source': row.photo_url}
+                if isinstance(result, PhotoError):
+                    value.update(_failure(row, result, now))
+                    failed += 1
+                else:
+                    digest, thumbnail = result
+                    thumbnails[digest] = thumbnail
+                    value.update(photo_hash=digest, photo_failures=0, photo_retry_at=None)
+                    stored += 1
+                values.append(value)
+                if on_progress:
+                    on_progress(stored + failed, total)
+            store(thumbnails)
+            db.session.execute(update(Professor), values)
+            db.session.commit()
+    return {'stored': stored, 'failed': failed}
+
+
+# ─── serving ───
+
+def send_thumbnail(digest):
+    """Response for ``/photos/<digest>.jpg``, or None if that thumbnail is
+    not stored (see ``forget``)."""
+    if not HASH_RE.match(digest):
+        abort(404)
+    data = db.session.execute(select(PhotoThumbnail.data).where(PhotoThumbnail.hash == digest)).scalar()
+    if data is None:
+        return None
+    response = Response(data, mimetype='image/jpeg')
+    response.set_etag(digest)
+    response.headers['Cache-Control'] = f'private, max-age={CACHE_MAX_AGE}, immutable'
+    return response.make_conditional(request)
+
+
+def forget(digest):
+    """Make the professors that point at a missing thumbnail pending again.
+
+    Returns the ids of their universities, so the caller can queue jobs. The
+    caller commits.
+    """
+    university_ids = set(db.session.scalars(
+        select(Professor.university_id).where(Professor.photo_hash == digest)))
+    if university_ids:
+        db.session.execute(update(Professor).where(Professor.photo_hash == digest)
+                           .values(photo_hash=None, photo_source=None))
+    return university_ids
+
+
+def placeholder():
+    """Stand-in image for a missing thumbnail. It must not be cached under the hash URL."""
+    response = Response(PLACEHOLDER_SVG, mimetype='image/svg+xml')
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+# ─── CLI ───
+
+@click.command('photos')
+@click.option('--university-id', type=int, default=None, help='この大学の教授だけを処理する')
+@with_appcontext
+def photos_command(university_id):
+    """未取得の教授写真をダウンロードしてサムネイルを作成する。"""
+    click.echo(f'対象: {count_pending(university_id)}件')
+    result = sync_photos(university_id)
+    click.echo(f'作成 {result["stored"]}件 / 失敗 {result["failed"]}件')
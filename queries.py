@@ -0,0 +1,282 @@
+"""Shared professor list queries: request filters and keyset pagination."""
+import base64
+import json
+import re
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import and_, case, or_, select, tuple_
+from sqlalchemy.orm import aliased, contains_eager, selectinload
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import UnaryExpression
+
+from models import db, Professor, SalesInfo, SalesInfoTag, Tag, CustomField, CustomFieldValue
+import custom_values
+import search
+
+DEFAULT_STATUS = '未接触'
+PAGE_SIZE = 60
+# Rows fetched per round trip when streaming a whole result set
+BATCH_SIZE = 200
+
+# Listing order. (university_id, name) is unique (ux_professors_university_name),
+# so it is a complete keyset served directly by that index.
+SORT_KEYS = (Professor.university_id, Professor.name)
+
+# cf_<id>=value (equality), cf_<id>_min / cf_<id>_max (range, number and date fields)
+CUSTOM_FILTER_RE = re.compile(r'^cf_(\d+)(?:_(min|max))?$')
+# sort=cf_<id> (ascending) / sort=-cf_<id> (descending)
+CUSTOM_SORT_RE = re.compile(r'^(-?)cf_(\d+)$')
+
+
+def filters_from_args(args):
+    return {
+        'university_id': args.get('university_id', type=int),
+        'dept_id': args.get('dept_id', type=int),
+        'status': args.get('status', ''),
+        'tag': args.get('tag', ''),
+        'q': args.get('q', '').strip(),
+        'sort': args.get('sort', ''),
+        **{key: value.strip() for key, value in args.items()
+           if CUSTOM_FILTER_RE.match(key) and value.strip()},
+    }
+
+
+def status_expr():
+    # A professor without a SalesInfo row counts as 未接触
+    return db.func.coalesce(SalesInfo.status, DEFAULT_STATUS)
+
+
+def professor_query(filters):
+    """Professors matching ``filters``, with sales info joined and the
+    university / department relationships loaded in batches.
+
+    Returns ``(query, sort_keys)``: search results are ordered by rank,
+    everything else by SORT_KEYS.
+    """
+    query = (
+        Professor.query
+        .outerjoin(SalesInfo, SalesInfo.professor_id == Professor.id)
+        .options(
+            contains_eager(Professor.sales_info).selectinload(SalesInfo.tag_links),
+            selectinload(Professor.university),
+            selectinload(Professor.department),
+        )
+    )
+    return apply_filters(query, filters)
+
+
+def apply_filters(query, filters):
+    """Apply ``filters`` to a query or select() that already outer-joins
+    SalesInfo onto Professor. Returns ``(query, sort_keys)``."""
+    if filters.get('professor_id'):
+        query = query.filter(Professor.id == filters['professor_id'])
+    if filters.get('university_id'):
+        query = query.filter(Professor.university_id == filters['university_id'])
+    if filters.get('dept_id'):
+        query = query.filter(Professor.dept_id == filters['dept_id'])
+    if filters.get('status'):
+        query = query.filter(status_expr() == filters['status'])
+    if filters.get('tag'):
+        query = query.filter(SalesInfo.id.in_(
+            select(SalesInfoTag.sales_info_id).join(Tag).where(Tag.name == filters['tag'])
+        ))
+    query, keys = _apply_custom_fields(query, filters)
+    if filters.get('q'):
+        q = filters['q']
+        matches = search.ranked(q)
+        if matches is not None:
+            query = query.join(matches, matches.c.id == Professor.id)
+            if keys is None:
+                keys = (matches.c.rank, Professor.id)
+            # Terms too short for the trigram index, checked on the matched rows
+            query = query.filter(*search.term_filters(search.split_terms(q)[1]))
+        else:
+            query = query.filter(*search.term_filters(q.split()))
+    return query, keys or SORT_KEYS
+
+
+def _apply_custom_fields(query, filters):
+    """Custom field predicates and sort from ``filters``.
+
+    Each predicate is an IN subquery served by the (custom_field_id,
+    value_number / value_date) indexes. Returns ``(query, sort_keys)`` with
+    sort_keys None unless a custom field sort was requested.
+    """
+    predicates = []
+    for key, raw in filters.items():
+        match = CUSTOM_FILTER_RE.match(key)
+        if match and raw:
+            predicates.append((int(match.group(1)), match.group(2), raw))
+    sort = CUSTOM_SORT_RE.match(filters.get('sort') or '')
+    field_ids = {field_id for field_id, _op, _raw in predicates}
+    if sort:
+        field_ids.add(int(sort.group(2)))
+    if not field_ids:
+        return query, None
+    field_types = dict(db.session.execute(
+        select(CustomField.id, CustomField.field_type).where(CustomField.id.in_(field_ids))
+    ).all())
+
+    for field_id, op, raw in predicates:
+        field_type = field_types.get(field_id)
+        if field_type is None:
+            continue
+        column = custom_values.value_column(field_type)
+        if column is CustomFieldValue.value:
+            if op:
+                continue  # ranges only make sense on typed fields
+            value = raw
+        else:
+            value = custom_values.parse_typed(field_type, raw)
+            if value is None:
+                continue
+        condition = {None: column == value, 'min': column >= value, 'max': column <= value}[op]
+        query = query.filter(Professor.id.in_(
+            select(CustomFieldValue.professor_id)
+            .where(CustomFieldValue.custom_field_id == field_id, condition)
+        ))
+
+    if not sort or int(sort.group(2)) not in field_types:
+        return query, None
+    field_id = int(sort.group(2))
+    field_type = field_types[field_id]
+    sort_value = aliased(CustomFieldValue, name='sort_value')
+    column = getattr(sort_value, custom_values.value_column(field_type).key)
+    query = query.outerjoin(sort_value, and_(
+        sort_value.professor_id == Professor.id, sort_value.custom_field_id == field_id,
+    ))
+    # Professors without a value sort last either way. coalesce keeps the key
+    # non-NULL so it can take part in keyset comparisons.
+    placeholder = {'number': 0.0, 'date': date.min}.get(field_type, '')
+    value_key = db.func.coalesce(column, placeholder).label('sort_value')
+    missing = case((column.is_(None), 1), else_=0).label('sort_missing')
+    value_key = value_key.desc() if sort.group(1) else value_key
+    return query, (missing, value_key, Professor.id)
+
+
+def all_tag_names():
+    """Names of the tags currently attached to at least one SalesInfo."""
+    return db.session.scalars(
+        select(Tag.name).where(Tag.id.in_(select(SalesInfoTag.tag_id))).order_by(Tag.name)
+    ).all()
+
+
+def encode_cursor(values):
+    raw = json.dumps(list(values), ensure_ascii=False, separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _cursor_value(column, value):
+    """``value`` from a cursor as the Python type of ``column``. Raises
+    ValueError on a mismatch, so a crafted cursor never reaches the SQL."""
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        raise ValueError(f'untyped key {column}') from None
+    if isinstance(value, bool):
+        raise ValueError('bool key value')
+    if python_type is int and isinstance(value, int):
+        return value
+    if python_type in (float, Decimal) and isinstance(value, (int, float, str)):
+        return python_type(value)
+    if python_type is str and isinstance(value, str):
+        return value
+    if python_type in (date, datetime) and isinstance(value, str):
+        return python_type.fromisoformat(value)
+    raise ValueError(f'{type(value).__name__} value for {python_type.__name__} key')
+
+
+def decode_cursor(cursor, keys=SORT_KEYS):
+    """Return the values in ``cursor`` typed for ``keys``, or None if it is
+    invalid (not ours, or made for another ordering)."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw.decode('utf-8'))
+        if not isinstance(values, list) or len(values) != len(keys):
+            return None
+        return [_cursor_value(_key_column(key), value) for key, value in zip(keys, values)]
+    except (ValueError, UnicodeDecodeError, ArithmeticError):
+        return None
+
+
+def _key_column(key):
+    """The column of an order_by key, without its desc() modifier."""
+    if isinstance(key, UnaryExpression) and key.modifier is operators.desc_op:
+        return key.element
+    return key
+
+
+def _after(keys, values):
+    """Condition selecting rows after ``values`` in ``keys`` order."""
+    columns = [_key_column(key) for key in keys]
+    if all(col is key for col, key in zip(columns, keys)):
+        return tuple_(*columns) > tuple_(*values)
+    # Mixed directions: expand the lexicographic comparison
+    condition = None
+    for col, key, value in reversed(list(zip(columns, keys, values))):
+        step = col < value if col is not key else col > value
+        condition = step if condition is None else or_(step, and_(col == value, condition))
+    return condition
+
+
+def keyset_page(query, after=None, size=PAGE_SIZE, keys=SORT_KEYS):
+    """Return ``(items, next_cursor)`` for the page after cursor ``after``.
+
+    ``keys`` must be a unique ordering (keys may be ``desc()``); their values
+    are selected alongside each row and the last row's values become the
+    next cursor.
+    """
+    values = decode_cursor(after, keys)
+    if values is not None:
+        query = query.filter(_after(keys, values))
+    rows = query.add_columns(*map(_key_column, keys)).order_by(*keys).limit(size + 1).all()
+    items = [row[0] for row in rows[:size]]
+    if len(rows) <= size:
+        return items, None
+    return items, encode_cursor(rows[size - 1][1:])
+
+
+def iter_batched(query, keys=SORT_KEYS, size=BATCH_SIZE):
+    """Yield every row of ``query`` in ``keys`` order, ``size`` rows per query.
+
+    Eager-load options on ``query`` run once per batch. The rows of a batch
+    (with the children their cascades reach, such as sales info and custom
+    values) are expunged before the next one, so memory stays flat however
+    many rows there are; only use this for read-only paths. Other objects
+    in the session, like the universities a template also renders, stay
+    attached.
+    """
+    values = None
+    while True:
+        batch = query
+        if values is not None:
+            batch = batch.filter(_after(keys, values))
+        rows = batch.add_columns(*map(_key_column, keys)).order_by(*keys).limit(size).all()
+        for row in rows:
+            yield row[0]
+        if len(rows) < size:
+            return
+        values = tuple(rows[-1][1:])
+        for row in rows:
+            if row[0] in db.session:
+                db.session.expunge(row[0])
+
+
+def iter_row_batches(stmt, keys=SORT_KEYS, size=BATCH_SIZE):
+    """Core counterpart of iter_batched: yield lists of result rows of the
+    select() ``stmt`` in ``keys`` order, one query per batch."""
+    key_columns = [_key_column(key).label(f'_key{i}') for i, key in enumerate(keys)]
+    values = None
+    while True:
+        batch = stmt
+        if values is not None:
+            batch = batch.where(_after(keys, values))
+        rows = db.session.execute(batch.add_columns(*key_columns).order_by(*keys).limit(size)).all()
+        if rows:
+            yield rows
+        if len(rows) < size:
+            return
+        values = tuple(rows[-1][-len(keys):])
@@ -1,6 +1,21 @@
+import hashlib
+import logging
+import os
 import re
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urldefrag, urlparse
+
 import requests
 from bs4 import BeautifulSoup
+from lxml import etree
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from page_cache import PageCache
+
+logger = logging.getLogger(__name__)
 
 
 HEADERS = {
@@ -15,107 +30,486 @@ EMAIL_RE = re.compile(r'[a-zA-Z0-9._%+\-]+@[a-zA-Z0-9.\-]+\.[a-zA-Z]{2,}')
 PHONE_RE = re.compile(r'(?:0\d{1,4}[-\s]?\d{1,4}[-\s]?\d{3,4}|\+81[-\s]?\d{1,4}[-\s]?\d{1,4}[-\s]?\d{3,4})')
 
 TITLE_WORDS = ['教授', '准教授', '講師', '助教', '助手', '名誉教授', 'Professor', 'Associate Professor', 'Lecturer']
+SPECIALTY_KEYWORDS = ['専門', '研究分野', '研究領域', 'キーワード']
+NAME_RE = re.compile(r'[\u4e00-\u9fff]{2,4}[\s\u3000]*[\u4e00-\u9fff]{2,4}')
+
+# Keyword matching with single precompiled alternations (longest first)
+_title_alternation = '|'.join(re.escape(w) for w in sorted(TITLE_WORDS, key=len, reverse=True))
+TITLE_ANY_RE = re.compile(_title_alternation)
+TITLE_RE = re.compile(f'(?=({_title_alternation}))')
+# Rank of the earliest TITLE_WORDS entry implied by each match
+TITLE_RANK = {w: min(i for i, v in enumerate(TITLE_WORDS) if v in w) for w in TITLE_WORDS}
+SPECIALTY_RE = re.compile('|'.join(re.escape(kw) for kw in SPECIALTY_KEYWORDS))
+SPECIALTY_RANK = {kw: i for i, kw in enumerate(SPECIALTY_KEYWORDS)}
+
+# Elements considered as professor blocks, and elements whose text
+# BeautifulSoup's get_text() leaves out
+BLOCK_TAGS = frozenset(['td', 'div', 'li', 'article', 'section', 'tr'])
+TEXTLESS_TAGS = frozenset(['script', 'style', 'template', 'rt', 'rp'])
+
+# Crawl mode: which in-domain links look like faculty directories or pagination
+DIRECTORY_LINK_RE = re.compile(
+    r'教員|教授|スタッフ|研究者|研究室|講座|分野|教室|学科|専攻|診療科|メンバー|'
+    r'faculty|staff|member|people|researcher|professor|directory|laborator',
+    re.IGNORECASE,
+)
+PAGINATION_LINK_RE = re.compile(
+    r'^(?:\d+|次へ|次のページ|次|next|more|もっと見る|»|›|>)$|[?&](?:page|p|pg|start|offset)=\d+|/page/\d+',
+    re.IGNORECASE,
+)
+SKIP_EXTENSIONS = ('.pdf', '.jpg', '.jpeg', '.png', '.gif', '.svg', '.zip', '.doc', '.docx',
+                   '.xls', '.xlsx', '.ppt', '.pptx', '.mp4', '.mp3', '.css', '.js')
+
+CRAWL_MAX_WORKERS = 8
+CRAWL_PER_HOST = 4
+CRAWL_MAX_PAGES = 200
+
+# HTTP session: connection pooling, retries with backoff on 5xx / timeouts
+HTTP_POOL_SIZE = CRAWL_MAX_WORKERS * 2
+HTTP_RETRIES = 3
+HTTP_BACKOFF = 0.5
+HTTP_RETRY_STATUSES = (500, 502, 503, 504)
+PARSED_CACHE_SIZE = 512
+
+# On-disk page cache (set SCRAPER_CACHE_DIR='' to disable). In offline mode
+# pages are replayed from the cache only and never fetched.
+CACHE_DIR = os.environ.get(
+    'SCRAPER_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.scrape_cache'),
+)
+CACHE_TTL = int(os.environ.get('SCRAPER_CACHE_TTL', 3600))
+CACHE_MAX_BYTES = int(os.environ.get('SCRAPER_CACHE_MAX_MB', 256)) * 1024 * 1024
+OFFLINE = os.environ.get('SCRAPER_OFFLINE', '') not in ('', '0', 'false')
+
+
+class FetchError(Exception):
+    pass
+
+
+# ``not_modified`` is True when ``html`` was replayed from the page cache
+# (a fresh entry, a 304 revalidation or offline mode).
+Page = namedtuple('Page', 'url html encoding etag last_modified not_modified')
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Return the shared, pooled HTTP session (created on first use)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                retry = Retry(
+                    total=HTTP_RETRIES,
+                    backoff_factor=HTTP_BACKOFF,
+                    status_forcelist=HTTP_RETRY_STATUSES,
+                    allowed_methods=frozenset(['GET', 'HEAD']),
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE,
+                                      pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+                session = requests.Session()
+                session.headers.update(HEADERS)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+
+class _ParsedCache:
+    """Bounded in-memory memo of parse results keyed by (URL, page digest).
+
+    Lets a page replayed from the cache or answered with a 304 skip parsing.
+    """
+
+    def __init__(self, maxsize=PARSED_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, professors):
+        with self._lock:
+            self._entries[key] = professors
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+_parsed = _ParsedCache()
+page_cache = PageCache(CACHE_DIR, ttl=CACHE_TTL, max_bytes=CACHE_MAX_BYTES) if CACHE_DIR else None
+
+
+def _detect_encoding(resp):
+    if resp.encoding and resp.encoding.lower() in ('shift_jis', 'shift-jis', 'sjis', 'ms932', 'cp932'):
+        return 'cp932'
+    if resp.encoding and resp.encoding.lower() in ('euc-jp', 'euc_jp'):
+        return 'euc-jp'
+    return resp.apparent_encoding or 'utf-8'
+
+
+def _page_from_entry(entry):
+    return Page(entry['url'], entry['html'], entry['encoding'], entry['etag'],
+                entry['last_modified'], True)
+
+
+def fetch_page(url, timeout=15, offline=None):
+    """Fetch ``url`` through the page cache and the shared session.
+
+    Fresh cache entries are returned without touching the network; stale
+    ones are revalidated with a conditional GET. Raises FetchError when the
+    page cannot be retrieved.
+    """
+    offline = OFFLINE if offline is None else offline
+    cached = page_cache.get(url) if page_cache else None
+    if cached and (cached['fresh'] or offline):
+        return _page_from_entry(cached)
+    if offline:
+        raise FetchError('offline: page not in cache')
+
+    headers = {}
+    if cached:
+        if cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+        if cached['last_modified']:
+            headers['If-Modified-Since'] = cached['last_modified']
+    try:
+        resp = get_session().get(url, headers=headers, timeout=timeout)
+    except requests.RequestException as e:
+        raise FetchError(str(e)) from e
+
+    if resp.status_code == 304 and cached:
+        return _page_from_entry(page_cache.touch(url) or cached)
+    if resp.status_code >= 400:
+        raise FetchError(f'HTTP {resp.status_code}')
+
+    resp.encoding = _detect_encoding(resp)
+    page = Page(url, resp.text, resp.encoding, resp.headers.get('ETag'),
+                resp.headers.get('Last-Modified'), False)
+    if page_cache:
+        page_cache.put(url, page.html, page.encoding, page.etag, page.last_modified)
+    return page
 
 
 def fetch_html(url, timeout=15):
     try:
-        resp = requests.get(url, headers=HEADERS, timeout=timeout)
-        # encoding detection
-        if resp.encoding and resp.encoding.lower() in ('shift_jis', 'shift-jis', 'sjis', 'ms932', 'cp932'):
-            resp.encoding = 'cp932'
-        elif resp.encoding and resp.encoding.lower() in ('euc-jp', 'euc_jp'):
-            resp.encoding = 'euc-jp'
+        return fetch_page(url, timeout=timeout).html
+    except FetchError as e:
+        logger.warning('fetch failed: %s (%s)', url, e)
+        return None
+
+
+def _block_text_spans(root):
+    """Walk the tree once and return ``(pieces, blocks)``.
+
+    ``pieces`` are the stripped text strings of the document in order, as
+    BeautifulSoup's ``get_text(' ', strip=True)`` would yield them (text
+    inside script/style/template/rt/rp and comments is skipped). ``blocks``
+    lists ``(element, start, end)`` for every BLOCK_TAGS element in document
+    order, so its text is ``' '.join(pieces[start:end])``.
+    """
+    pieces = []
+    blocks = []
+    open_blocks = []
+    skip_depth = 0
+    for event, el in etree.iterwalk(root, events=('start', 'end', 'comment', 'pi')):
+        tag = el.tag
+        if not isinstance(tag, str):
+            # Comment / processing instruction: only its tail is text
+            if el.tail and not skip_depth:
+                stripped = el.tail.strip()
+                if stripped:
+                    pieces.append(stripped)
+            continue
+        if event == 'start':
+            if tag in BLOCK_TAGS:
+                open_blocks.append(len(blocks))
+                blocks.append([el, len(pieces), None])
+            if tag in TEXTLESS_TAGS:
+                skip_depth += 1
+            if el.text and not skip_depth:
+                stripped = el.text.strip()
+                if stripped:
+                    pieces.append(stripped)
         else:
-            resp.encoding = resp.apparent_encoding or 'utf-8'
-        return resp.text
-    except Exception as e:
+            if tag in BLOCK_TAGS:
+                blocks[open_blocks.pop()][2] = len(pieces)
+            if tag in TEXTLESS_TAGS:
+                skip_depth -= 1
+            if el.tail and not skip_depth:
+                stripped = el.tail.strip()
+                if stripped:
+                    pieces.append(stripped)
+    return pieces, blocks
+
+
+def _parse_tree(html):
+    # Parse from UTF-8 bytes so a <meta charset> or XML declaration in the
+    # already-decoded text cannot confuse lxml. Returns None for empty input.
+    data = html.encode('utf-8', 'replace')
+    if not data.strip():
         return None
+    return etree.fromstring(data, etree.HTMLParser(encoding='utf-8'))
 
 
-def parse_professors(html, base_url=''):
-    soup = BeautifulSoup(html, 'html.parser')
-    results = []
+def _lxml_candidates(html):
+    """Yield ``(text, img_src)`` for each block containing a title word."""
+    root = _parse_tree(html)
+    if root is None:
+        return
+    pieces, blocks = _block_text_spans(root)
+
+    # Title words never span two pieces (the multi-word ones contain
+    # 'Professor'), so a block matches iff one of its pieces does.
+    # Prefix sums make that an O(1) test per block.
+    hits = [0]
+    for piece in pieces:
+        hits.append(hits[-1] + (1 if TITLE_ANY_RE.search(piece) else 0))
+
+    for el, start, end in blocks:
+        if hits[end] - hits[start]:
+            img = next(el.iter('img'), None)
+            yield ' '.join(pieces[start:end]), img.get('src') if img is not None else None
 
-    # Try to find structured professor blocks
-    # Strategy: look for elements containing title words near a name
-    candidates = []
 
-    for tag in soup.find_all(['td', 'div', 'li', 'article', 'section', 'tr']):
+def _html_parser_candidates(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    for tag in soup.find_all(list(BLOCK_TAGS)):
         text = tag.get_text(' ', strip=True)
-        if any(word in text for word in TITLE_WORDS):
-            candidates.append(tag)
+        if TITLE_ANY_RE.search(text):
+            img = tag.find('img')
+            yield text, img.get('src') if img else None
 
-    seen_names = set()
 
-    for block in candidates:
-        text = block.get_text(' ', strip=True)
+def _match_title(text):
+    # Earliest entry of TITLE_WORDS present in text. The lookahead regex
+    # reports overlapping matches; shorter words contained in a longer
+    # match (e.g. 教授 in 名誉教授) are accounted for by TITLE_RANK.
+    ranks = [TITLE_RANK[m.group(1)] for m in TITLE_RE.finditer(text)]
+    return TITLE_WORDS[min(ranks)] if ranks else ''
+
 
-        # Extract title
-        title = ''
-        for word in TITLE_WORDS:
-            if word in text:
-                title = word
+def _match_specialty(text):
+    best_rank = best_idx = None
+    for m in SPECIALTY_RE.finditer(text):
+        rank = SPECIALTY_RANK[m.group()]
+        if best_rank is None or rank < best_rank:
+            best_rank, best_idx = rank, m.start()
+            if rank == 0:
                 break
+    if best_idx is None:
+        return ''
+    return text[best_idx:best_idx + 80].split('。')[0].split('\n')[0].strip()
 
-        # Extract name: look for Japanese name pattern (2-4 kanji, optional space, 2-4 kanji)
-        name = ''
-        name_match = re.search(r'[\u4e00-\u9fff]{2,4}[\s\u3000]*[\u4e00-\u9fff]{2,4}', text)
-        if name_match:
-            name = name_match.group().replace('\u3000', ' ').strip()
 
+def parse_professors(html, base_url='', engine='lxml'):
+    """Extract professor records from a faculty page.
+
+    ``engine='lxml'`` walks the lxml tree once and computes each block's
+    text from shared pieces; ``engine='html.parser'`` is the original
+    BeautifulSoup implementation, kept for comparison. Both scan blocks in
+    document order and keep the first block per name.
+    """
+    candidates = _html_parser_candidates(html) if engine == 'html.parser' else _lxml_candidates(html)
+    results = []
+    seen_names = set()
+
+    for text, src in candidates:
+        # Extract name: look for Japanese name pattern (2-4 kanji, optional space, 2-4 kanji)
+        name_match = NAME_RE.search(text)
+        name = name_match.group().replace('\u3000', ' ').strip() if name_match else ''
         if not name or name in seen_names:
             continue
         seen_names.add(name)
 
-        # Extract email
         email_match = EMAIL_RE.search(text)
-        email = email_match.group() if email_match else ''
-
-        # Extract phone
         phone_match = PHONE_RE.search(text)
-        phone = phone_match.group() if phone_match else ''
 
         # Extract photo URL
         photo_url = ''
-        img = block.find('img')
-        if img and img.get('src'):
-            src = img['src']
+        if src:
             if src.startswith('http'):
                 photo_url = src
             elif src.startswith('//'):
                 photo_url = 'https:' + src
             elif base_url:
-                from urllib.parse import urljoin
                 photo_url = urljoin(base_url, src)
 
-        # Extract specialty: look for research keywords
-        specialty = ''
-        for kw in ['専門', '研究分野', '研究領域', 'キーワード']:
-            idx = text.find(kw)
-            if idx != -1:
-                snippet = text[idx:idx+80].split('。')[0].split('\n')[0]
-                specialty = snippet.strip()
-                break
-
         results.append({
             'name': name,
-            'title': title,
-            'email': email,
-            'phone': phone,
+            'title': _match_title(text),
+            'email': email_match.group() if email_match else '',
+            'phone': phone_match.group() if phone_match else '',
             'photo_url': photo_url,
-            'specialty': specialty,
+            'specialty': _match_specialty(text),
             'source_url': base_url,
         })
 
     return results
 
 
-def scrape_university(url):
-    html = fetch_html(url)
-    if not html:
+def _site_key(host):
+    # Treat sibling hosts of the same university as in-domain
+    # (e.g. www.med.example-u.ac.jp and www.example-u.ac.jp)
+    labels = (host or '').lower().split(':')[0].split('.')
+    keep = 3 if len(labels) >= 3 and len(labels[-2]) == 2 and len(labels[-1]) == 2 else 2
+    return '.'.join(labels[-keep:])
+
+
+def extract_links(html, base_url):
+    """Return in-domain links that look like directory or pagination pages."""
+    root = _parse_tree(html)
+    if root is None:
+        return []
+    site = _site_key(urlparse(base_url).netloc)
+    links = []
+    seen = set()
+    for a in root.iter('a'):
+        href = (a.get('href') or '').strip()
+        if not href or href.startswith(('mailto:', 'tel:', 'javascript:')):
+            continue
+        url = urldefrag(urljoin(base_url, href))[0]
+        parsed = urlparse(url)
+        if parsed.scheme not in ('http', 'https') or _site_key(parsed.netloc) != site:
+            continue
+        if parsed.path.lower().endswith(SKIP_EXTENSIONS) or url in seen:
+            continue
+        text = ' '.join(t.strip() for t in a.itertext() if t.strip())
+        if (DIRECTORY_LINK_RE.search(text) or DIRECTORY_LINK_RE.search(parsed.path)
+                or PAGINATION_LINK_RE.search(text) or PAGINATION_LINK_RE.search(url)):
+            seen.add(url)
+            links.append(url)
+    return links
+
+
+def merge_professors(lists, key=None):
+    """Merge per-page results into one list deduplicated by name (or by
+    ``key(name)``, e.g. dedup.name_key).
+
+    The first occurrence wins; empty fields are filled in from later duplicates.
+    """
+    merged = {}
+    for professors in lists:
+        for p in professors:
+            name = key(p['name']) if key else p['name']
+            existing = merged.get(name)
+            if existing is None:
+                merged[name] = dict(p)
+                continue
+            for field, value in p.items():
+                if value and not existing.get(field):
+                    existing[field] = value
+    return list(merged.values())
+
+
+def crawl(url, max_depth=1, max_workers=CRAWL_MAX_WORKERS, per_host=CRAWL_PER_HOST,
+          max_pages=CRAWL_MAX_PAGES, on_progress=None):
+    """Fetch ``url`` and the directory/pagination pages it links to.
+
+    Pages are fetched level by level (breadth first) on a bounded thread pool,
+    with at most ``per_host`` requests in flight per host. Returns a list of
+    Page tuples in crawl order; pages that failed are omitted.
+    """
+    host_locks = {}
+    host_locks_guard = threading.Lock()
+
+    def host_semaphore(page_url):
+        host = urlparse(page_url).netloc
+        with host_locks_guard:
+            if host not in host_locks:
+                host_locks[host] = threading.BoundedSemaphore(per_host)
+            return host_locks[host]
+
+    def fetch_one(page_url):
+        with host_semaphore(page_url):
+            try:
+                page = fetch_page(page_url)
+            except FetchError as e:
+                logger.warning('fetch failed: %s (%s)', page_url, e)
+                return None, []
+        return page, extract_links(page.html, page_url)
+
+    pages = []
+    visited = {url}
+    level = [url]
+    depth = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while level:
+            next_level = []
+            for page, links in pool.map(fetch_one, level):
+                if page:
+                    pages.append(page)
+                if depth < max_depth:
+                    for link in links:
+                        if link not in visited and len(visited) < max_pages:
+                            visited.add(link)
+                            next_level.append(link)
+                # Per page, not per level: the job worker's heartbeat rides on it
+                if on_progress:
+                    on_progress(len(pages), len(visited))
+            level = next_level
+            depth += 1
+    return pages
+
+
+def content_hash(html):
+    """Digest of a page's decoded HTML, used to spot unchanged pages."""
+    return hashlib.sha1(html.encode('utf-8')).hexdigest()
+
+
+def parse_page(page):
+    """Parse a fetched Page, reusing the previous result for unchanged HTML."""
+    key = (page.url, content_hash(page.html))
+    professors = _parsed.get(key)
+    if professors is None:
+        professors = parse_professors(page.html, base_url=page.url)
+        _parsed.put(key, [dict(p) for p in professors])
+        return professors
+    return [dict(p) for p in professors]
+
+
+def replay(url):
+    """Parse ``url`` from the page cache only, without network access."""
+    return parse_page(fetch_page(url, offline=True))
+
+
+def fetch_university(url, max_depth=0, **crawl_options):
+    """Fetch the pages to scrape for ``url``: ``(pages, error)``.
+
+    With ``max_depth`` > 0 in-domain directory and pagination links are
+    followed up to that depth.
+    """
+    if max_depth <= 0:
+        try:
+            return [fetch_page(url)], None
+        except FetchError as e:
+            return [], f'URLの取得に失敗しました（{e}）'
+
+    pages = crawl(url, max_depth=max_depth, **crawl_options)
+    if not pages or pages[0].url != url:
         return [], 'URLの取得に失敗しました'
-    professors = parse_professors(html, base_url=url)
-    return professors, None
+    return pages, None
+
+
+def scrape_university(url, max_depth=0, **crawl_options):
+    """Scrape ``url`` for professors.
+
+    With ``max_depth`` > 0 the scraper also follows in-domain directory and
+    pagination links up to that depth and merges the results.
+    """
+    pages, error = fetch_university(url, max_depth=max_depth, **crawl_options)
+    if error:
+        return [], error
+    if len(pages) == 1:
+        return parse_page(pages[0]), None
+    return merge_professors(parse_page(page) for page in pages), None
 
 
 def scrape_department(url):
@@ -0,0 +1,223 @@
+"""Ranked full-text search over professor name, specialty and email.
+
+SQLite uses an FTS5 table with the trigram tokenizer (external content,
+kept in sync by triggers); PostgreSQL uses pg_trgm GIN indexes with
+similarity ranking. Terms are ANDed, each matching any of the three
+columns case-insensitively. Trigram indexes cannot serve terms shorter
+than three characters (most Japanese given and family names are two).
+The index therefore narrows a query by its longer terms, and the short
+ones are checked with LIKE on the matched rows only.
+
+Two-character terms (山田, 佐藤, 工学) have a bigram index of their own: a
+``professor_bigrams`` table kept by triggers on SQLite, and a GIN index on
+``professor_bigrams(name, specialty, email)`` on PostgreSQL. It narrows the
+rows before the LIKE check. Single characters, and databases without the
+indexes, scan with ``term_filters`` alone. All paths return the same rows.
+"""
+import sqlite3
+import time
+
+from sqlalchemy import Float, column, literal_column, select, table, text
+from sqlalchemy.dialects.postgresql import array
+
+from models import db, Professor
+
+MIN_TERM_LENGTH = 3
+BIGRAM_LENGTH = 2
+# SQLite does not enforce VARCHAR lengths; longer values are indexed up to this
+BIGRAM_MAX_POSITION = max(Professor.__table__.c[name].type.length for name in ('name', 'specialty', 'email'))
+# A missing index is looked up again after this many seconds: ``db upgrade`` may be adding it
+RECHECK_AFTER = 60
+
+_INSTALLED_SQL = {
+    ('sqlite', 'trigram'): "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'professors_fts'",
+    ('sqlite', 'bigram'): "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'professor_bigrams'",
+    ('postgresql', 'trigram'): "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'",
+    ('postgresql', 'bigram'): "SELECT 1 FROM pg_indexes WHERE indexname = 'ix_professors_bigrams'",
+}
+_installed = {}
+
+_bigrams = table('professor_bigrams', column('gram'), column('professor_id'))
+
+# Bigrams of one row: lower() on both sides, as in the LIKE of term_filters
+_SQLITE_BIGRAMS = (
+    "SELECT DISTINCT lower(substr(v.text, p.n, 2)), {row}.id "
+    "FROM (SELECT {row}.name AS text UNION ALL SELECT {row}.specialty UNION ALL SELECT {row}.email) v "
+    "JOIN search_positions p ON p.n < length(v.text)"
+)
+
+
+def _dialect(bind):
+    return bind.dialect.name
+
+
+def install(conn):
+    """Create the search index for the connection's dialect (idempotent)."""
+    dialect = _dialect(conn)
+    if dialect == 'sqlite':
+        if sqlite3.sqlite_version_info < (3, 34):
+            return  # no trigram tokenizer: keep the LIKE fallback
+        conn.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS professors_fts USING fts5("
+            "name, specialty, email, content='professors', content_rowid='id', tokenize='trigram')"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS professors_fts_ai AFTER INSERT ON professors BEGIN "
+            "INSERT INTO professors_fts(rowid, name, specialty, email) "
+            "VALUES (new.id, new.name, new.specialty, new.email); END"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS professors_fts_ad AFTER DELETE ON professors BEGIN "
+            "INSERT INTO professors_fts(professors_fts, rowid, name, specialty, email) "
+            "VALUES ('delete', old.id, old.name, old.specialty, old.email); END"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS professors_fts_au AFTER UPDATE OF name, specialty, email "
+            "ON professors BEGIN "
+            "INSERT INTO professors_fts(professors_fts, rowid, name, specialty, email) "
+            "VALUES ('delete', old.id, old.name, old.specialty, old.email); "
+            "INSERT INTO professors_fts(rowid, name, specialty, email) "
+            "VALUES (new.id, new.name, new.specialty, new.email); END"
+        ))
+        conn.execute(text("INSERT INTO professors_fts(professors_fts) VALUES ('rebuild')"))
+    elif dialect == 'postgresql':
+        conn.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        for column in ('name', 'specialty', 'email'):
+            conn.execute(text(
+                f'CREATE INDEX IF NOT EXISTS ix_professors_{column}_trgm '
+                f'ON professors USING gin ({column} gin_trgm_ops)'
+            ))
+
+
+def install_bigrams(conn):
+    """Create the bigram index for two-character terms (idempotent)."""
+    dialect = _dialect(conn)
+    if dialect == 'sqlite':
+        conn.execute(text('CREATE TABLE IF NOT EXISTS search_positions (n INTEGER PRIMARY KEY)'))
+        conn.execute(text('INSERT OR IGNORE INTO search_positions (n) VALUES (:n)'),
+                     [{'n': n} for n in range(1, BIGRAM_MAX_POSITION)])
+        conn.execute(text(
+            'CREATE TABLE IF NOT EXISTS professor_bigrams ('
+            'gram TEXT NOT NULL, professor_id INTEGER NOT NULL, PRIMARY KEY (gram, professor_id)'
+            ') WITHOUT ROWID'
+        ))
+        conn.execute(text(
+            'CREATE INDEX IF NOT EXISTS ix_professor_bigrams_professor_id ON professor_bigrams (professor_id)'
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS professor_bigrams_ai AFTER INSERT ON professors BEGIN "
+            "INSERT OR IGNORE INTO professor_bigrams (gram, professor_id) "
+            + _SQLITE_BIGRAMS.format(row='new') + "; END"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS professor_bigrams_ad AFTER DELETE ON professors BEGIN "
+            "DELETE FROM professor_bigrams WHERE professor_id = old.id; END"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS professor_bigrams_au AFTER UPDATE OF name, specialty, email "
+            "ON professors BEGIN "
+            "DELETE FROM professor_bigrams WHERE professor_id = old.id; "
+            "INSERT OR IGNORE INTO professor_bigrams (gram, professor_id) "
+            + _SQLITE_BIGRAMS.format(row='new') + "; END"
+        ))
+        conn.execute(text('DELETE FROM professor_bigrams'))
+        conn.execute(text(
+            'INSERT OR IGNORE INTO professor_bigrams (gram, professor_id) '
+            'SELECT DISTINCT lower(substr(v.text, p.n, 2)), v.id FROM ('
+            'SELECT id, name AS text FROM professors UNION ALL SELECT id, specialty FROM professors '
+            'UNION ALL SELECT id, email FROM professors) v '
+            'JOIN search_positions p ON p.n < length(v.text)'
+        ))
+    elif dialect == 'postgresql':
+        conn.execute(text(
+            'CREATE OR REPLACE FUNCTION professor_bigrams(name text, specialty text, email text) '
+            'RETURNS text[] LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$ '
+            "SELECT coalesce(array_agg(DISTINCT lower(substr(v, i, 2))), '{}') "
+            'FROM unnest(ARRAY[name, specialty, email]) AS v, generate_series(1, length(v) - 1) AS i $$'
+        ))
+        conn.execute(text(
+            'CREATE INDEX IF NOT EXISTS ix_professors_bigrams '
+            'ON professors USING gin (professor_bigrams(name, specialty, email))'
+        ))
+
+
+def _available(kind):
+    bind = db.session.get_bind()
+    key = (str(bind.url), kind)
+    installed, checked_at = _installed.get(key, (False, None))
+    if not installed and (checked_at is None or time.monotonic() - checked_at >= RECHECK_AFTER):
+        sql = _INSTALLED_SQL.get((_dialect(bind), kind))
+        installed = bool(sql and db.session.execute(text(sql)).first())
+        _installed[key] = (installed, time.monotonic())
+    return installed
+
+
+def available():
+    """Whether the trigram index can serve this database."""
+    return _available('trigram')
+
+
+def bigrams_available():
+    """Whether the bigram index for two-character terms can serve this database."""
+    return _available('bigram')
+
+
+def split_terms(q):
+    """``(indexed, short)`` terms of ``q``."""
+    terms = q.split()
+    return ([t for t in terms if len(t) >= MIN_TERM_LENGTH],
+            [t for t in terms if len(t) < MIN_TERM_LENGTH])
+
+
+def _bigram_filter(term):
+    if _dialect(db.session.get_bind()) == 'sqlite':
+        return Professor.id.in_(select(_bigrams.c.professor_id).where(_bigrams.c.gram == db.func.lower(term)))
+    grams = db.func.professor_bigrams(Professor.name, Professor.specialty, Professor.email)
+    return grams.op('@>')(array([db.func.lower(term)]))
+
+
+def term_filters(terms):
+    """One case-insensitive LIKE condition per term (ANDed by the caller).
+
+    Two-character terms also get a bigram index lookup, so the LIKE only
+    checks the rows that contain the term's bigram."""
+    columns = (Professor.name, Professor.specialty, Professor.email)
+    filters = [db.or_(*(col.icontains(term, autoescape=True) for col in columns)) for term in terms]
+    if any(len(term) == BIGRAM_LENGTH for term in terms) and bigrams_available():
+        filters += [_bigram_filter(term) for term in terms if len(term) == BIGRAM_LENGTH]
+    return filters
+
+
+def _fts5_query(terms):
+    return ' '.join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def ranked(q):
+    """Return a subquery of ``(id, rank)`` for professors matching the
+    indexed terms of ``q``, best first by ascending ``rank``, or None when
+    ``q`` has no indexed term or there is no index. The caller adds
+    ``term_filters`` for the short terms (or for all terms on None)."""
+    terms, _short = split_terms(q)
+    if not terms or not available():
+        return None
+
+    if _dialect(db.session.get_bind()) == 'sqlite':
+        # bm25 is negative, lower = more relevant; name matches weigh most
+        return (
+            select(
+                literal_column('professors_fts.rowid').label('id'),
+                literal_column('bm25(professors_fts, 10.0, 2.0, 1.0)', Float).label('rank'),
+            )
+            .select_from(text('professors_fts'))
+            .where(text('professors_fts MATCH :fts_query').bindparams(fts_query=_fts5_query(terms)))
+            .subquery('search')
+        )
+
+    conditions = term_filters(terms)
+    score = db.func.greatest(
+        db.func.similarity(Professor.name, q),
+        db.func.word_similarity(q, db.func.coalesce(Professor.specialty, '')),
+        db.func.similarity(db.func.coalesce(Professor.email, ''), q),
+        type_=Float,
+    )
+    return select(Professor.id.label('id'), (-score).label('rank')).where(*conditions).subquery('search')
@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db  # noqa: E402
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Returns a factory for an app context on a fresh SQLite file."""
+    apps = []
+
+    def factory(name='test.db'):
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp_path / name}'
+        db.init_app(app)
+        ctx = app.app_context()
+        ctx.push()
+        apps.append(ctx)
+        return app
+
+    yield factory
+    for ctx in reversed(apps):
+        db.session.remove()
+        db.engine.dispose()
+        ctx.pop()
+
+
+@pytest.fixture
+def app_db(make_app):
+    """An app context on a fresh database with the current schema."""
+    import migrations
+    app = make_app()
+    migrations.upgrade()
+    return app
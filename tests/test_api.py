@@ -0,0 +1,52 @@
+import base64
+import json
+
+import pytest
+
+from models import db, Professor, SalesInfo, University
+import api
+import queries
+
+
+def _cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+@pytest.fixture
+def client(app_db, monkeypatch):
+    monkeypatch.setenv('API_TOKEN', 'secret')
+    app_db.register_blueprint(api.bp)
+    university = University(name='東京大学')
+    db.session.add(university)
+    db.session.flush()
+    db.session.add_all([Professor(university_id=university.id, name=f'山田 太郎{i}') for i in range(3)])
+    db.session.commit()
+    client = app_db.test_client()
+    client.environ_base['HTTP_AUTHORIZATION'] = 'Bearer secret'
+    return client
+
+
+@pytest.mark.parametrize('values', [[{'a': 1}, 'x'], [True, '山田'], ['1', '山田'], [1]])
+def test_list_rejects_crafted_cursor(client, values):
+    response = client.get('/api/v1/professors', query_string={'after': _cursor(values)})
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'invalid cursor'}
+
+
+def test_list_rejects_cursor_of_another_ordering(client):
+    first = client.get('/api/v1/professors', query_string={'limit': 1}).get_json()
+    assert client.get('/api/v1/professors', query_string={'limit': 1, 'after': first['next_cursor']}).status_code == 200
+    response = client.get('/api/v1/professors', query_string={'q': '山田 太郎0', 'after': first['next_cursor']})
+    assert response.status_code == 400
+
+
+def test_patch_sales_rejects_bool_professor_id(client):
+    response = client.patch('/api/v1/professors/sales', json=[{'professor_id': True, 'status': '商談中'}])
+    assert response.status_code == 400
+    assert response.get_json()['errors'] == [{'index': 0, 'error': 'professor_id (integer) is required'}]
+    assert SalesInfo.query.count() == 0
+
+    professor_id = Professor.query.first().id
+    response = client.patch('/api/v1/professors/sales', json=[{'professor_id': professor_id, 'status': '商談中'}])
+    assert response.get_json() == {'updated': 0, 'created': 1}
+    assert queries.DEFAULT_STATUS != SalesInfo.query.one().status
@@ -0,0 +1,105 @@
+from models import db, Professor, ProfessorAlias, SalesInfo, University
+import dedup
+import ingest
+
+
+def _university(name):
+    university = University(name=name)
+    db.session.add(university)
+    db.session.flush()
+    return university
+
+
+def test_name_key_folds_variants():
+    assert dedup.name_key('齋藤　太郎') == dedup.name_key('斎藤 太郎') == dedup.name_key('斎藤太郎')
+    assert dedup.name_key('髙橋・花子') == dedup.name_key('高橋 花子')
+    assert dedup.name_key('ＳＭＩＴＨ John') == 'smithjohn'
+
+
+def test_find_groups_blocks_and_dismissals():
+    rows = [
+        (1, 1, '齋藤 太郎', ''),
+        (2, 1, '斎藤 太郎', 'saito@example.ac.jp'),
+        (3, 2, 'SAITO Taro', 'Saito@Example.ac.jp'),
+        (4, 2, '斎藤 太郎', ''),  # same name, other university: not a candidate
+        (5, 1, '山田 一郎', ''),
+        (6, 1, '山田一郎', ''),
+    ]
+    groups = dedup.find_groups(rows)
+    assert [g['ids'] for g in groups] == [[1, 2, 3], [5, 6]]
+    assert groups[0]['reasons'] == {'name', 'email'}
+    assert [g['ids'] for g in dedup.find_groups(rows, dismissed=[(5, 6)])] == [[1, 2, 3]]
+
+
+def test_cross_university_merge_survives_rescrape(app_db):
+    tokyo, kyoto = _university('東京大学'), _university('京都大学')
+    kept = Professor(university_id=tokyo.id, name='斎藤 太郎', email='saito@example.ac.jp')
+    other = Professor(university_id=kyoto.id, name='SAITO Taro', email='saito@example.ac.jp',
+                      source_url='https://kyoto.example/staff')
+    db.session.add_all([kept, other])
+    db.session.commit()
+
+    dedup.merge(kept.id, [other.id])
+    db.session.commit()
+    assert ProfessorAlias.query.filter_by(university_id=kyoto.id).one().professor_id == kept.id
+
+    result = ingest.sync_scraped(kyoto.id, [{'name': 'SAITO Taro', 'source_url': 'https://kyoto.example/staff'}],
+                                 ['https://kyoto.example/staff'])
+    db.session.commit()
+    assert result['added'] == []
+    assert Professor.query.filter_by(university_id=kyoto.id).count() == 0
+
+
+def test_rescrape_matches_spelling_variants(app_db):
+    tokyo = _university('東京大学')
+    kept = Professor(university_id=tokyo.id, name='齋藤 太郎', source_url='https://tokyo.example/a')
+    db.session.add(kept)
+    db.session.commit()
+    result = ingest.sync_scraped(tokyo.id, [
+        {'name': '斎藤　太郎', 'source_url': 'https://tokyo.example/a'},
+        {'name': '山田 花子', 'source_url': 'https://tokyo.example/a'},
+    ], ['https://tokyo.example/a'])
+    db.session.commit()
+    assert len(result['added']) == 1
+    assert result['disappeared'] == []
+    assert Professor.query.count() == 2
+
+
+def _professor(university, name, status=None, memo=None, tags=()):
+    professor = Professor(university_id=university.id, name=name)
+    if status:
+        professor.sales_info = SalesInfo(status=status, memo=memo)
+        professor.sales_info.tags = list(tags)
+    db.session.add(professor)
+    db.session.flush()
+    return professor
+
+
+def test_merge_moves_sales_info_to_kept_professor(app_db):
+    tokyo = _university('東京大学')
+    kept = _professor(tokyo, '斎藤 太郎')
+    other = _professor(tokyo, '齋藤 太郎', status='商談中', memo='初回訪問済み', tags=['AI'])
+    db.session.commit()
+
+    dedup.merge(kept.id, [other.id])
+    db.session.commit()
+    sales = SalesInfo.query.one()
+    assert sales.professor_id == kept.id
+    assert (sales.status, sales.memo, sales.tags) == ('商談中', '初回訪問済み', ['AI'])
+
+
+def test_merge_three_combines_sales_and_tags(app_db):
+    tokyo = _university('東京大学')
+    kept = _professor(tokyo, '斎藤 太郎')
+    first = _professor(tokyo, '齋藤 太郎', status='商談中', memo='初回訪問済み', tags=['AI', '材料'])
+    second = _professor(tokyo, '齊藤 太郎', status='受注', memo='見積送付', tags=['材料', '共同研究'])
+    db.session.commit()
+
+    dedup.merge(kept.id, [first.id, second.id])
+    db.session.commit()
+    sales = SalesInfo.query.one()
+    assert sales.professor_id == kept.id
+    assert sales.status == '商談中'
+    assert sales.memo == '初回訪問済み\n見積送付'
+    assert sales.tags == ['AI', '材料', '共同研究']
+    assert Professor.query.count() == 1
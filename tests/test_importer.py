@@ -0,0 +1,64 @@
+import csv
+
+import pytest
+from click.testing import CliRunner
+
+from models import Job
+import importer
+
+
+def _errors(path):
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        return list(csv.reader(f))
+
+
+def test_resume_keeps_earlier_error_rows(app_db, tmp_path, monkeypatch):
+    source = tmp_path / 'professors.csv'
+    source.write_text(
+        'university,name,email\n'
+        '東京大学,山田 太郎,yamada@example.ac.jp\n'
+        '東京大学,,missing-name@example.ac.jp\n'
+        '東京大学,佐藤 花子,sato@example.ac.jp\n'
+        '東京大学,,also-missing@example.ac.jp\n',
+        encoding='utf-8',
+    )
+    runner = CliRunner()
+
+    def run(*args):
+        result = runner.invoke(importer.import_command, [str(source), '--chunk-size', '2', *args],
+                               obj=_script_info(app_db), catch_exceptions=False)
+        assert result.exit_code == 0, result.output
+        return result
+
+    # Interrupt the first run while it checkpoints its second chunk
+    save_checkpoint = importer.save_checkpoint
+
+    def interrupt(path, rows):
+        if rows > 2:
+            raise RuntimeError('interrupted')
+        save_checkpoint(path, rows)
+
+    monkeypatch.setattr(importer, 'save_checkpoint', interrupt)
+    with pytest.raises(RuntimeError):
+        run()
+    monkeypatch.setattr(importer, 'save_checkpoint', save_checkpoint)
+    error_path = str(source) + '.errors.csv'
+    assert [row[0] for row in _errors(error_path)] == ['line', '3']
+
+    run('--resume')
+    assert [row[0] for row in _errors(error_path)] == ['line', '3', '5']
+
+
+def _script_info(app):
+    from flask.cli import ScriptInfo
+    return ScriptInfo(create_app=lambda: app)
+
+
+def test_import_queues_photo_thumbnails(app_db, tmp_path):
+    source = tmp_path / 'professors.csv'
+    source.write_text('university,name,photo_url\n東京大学,山田 太郎,https://example.ac.jp/yamada.jpg\n',
+                      encoding='utf-8')
+    result = CliRunner().invoke(importer.import_command, [str(source)], obj=_script_info(app_db),
+                                catch_exceptions=False)
+    assert result.exit_code == 0, result.output
+    assert [(job.kind, job.status) for job in Job.query] == [('photos', 'queued')]
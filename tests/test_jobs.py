@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+
+from models import db, Job
+import jobs
+
+
+def test_requeue_stale_uses_heartbeat(app_db):
+    long_ago = datetime.utcnow() - timedelta(hours=3)
+    alive = Job(kind='photos', status='running', started_at=long_ago, heartbeat_at=datetime.utcnow())
+    stalled = Job(kind='photos', status='running', started_at=long_ago, heartbeat_at=long_ago)
+    legacy = Job(kind='scrape', status='running', started_at=long_ago)
+    db.session.add_all([alive, stalled, legacy])
+    db.session.commit()
+
+    assert jobs.requeue_stale() == 2
+    db.session.expire_all()
+    assert alive.status == 'running'
+    assert stalled.status == legacy.status == 'queued'
+    assert stalled.heartbeat_at is None
+
+
+def test_set_progress_beats(app_db):
+    job = jobs.enqueue('photos')
+    claimed = jobs.claim_next('test')
+    assert claimed.id == job.id and claimed.heartbeat_at is not None
+    claimed.heartbeat_at -= jobs.HEARTBEAT_INTERVAL * 2
+    db.session.commit()
+    before = claimed.heartbeat_at
+    jobs.set_progress(claimed, 1, 10)
+    db.session.expire_all()
+    assert claimed.progress == 1 and claimed.heartbeat_at > before
+
+
+def test_worker_requeues_stale_jobs_while_running(app_db, monkeypatch):
+    long_ago = datetime.utcnow() - timedelta(hours=3)
+    ran = []
+
+    def handler(job):
+        if not ran:
+            # a job another worker left running while this one was busy
+            db.session.add(Job(kind='photos', status='running', started_at=long_ago, heartbeat_at=long_ago))
+            db.session.commit()
+        ran.append(job.id)
+        return 'ok'
+
+    monkeypatch.setitem(jobs.HANDLERS, 'photos', handler)
+    monkeypatch.setattr(jobs, 'REQUEUE_INTERVAL', 0)
+    first = jobs.enqueue('photos')
+    jobs.work(app_db, once=True)
+    assert len(ran) == 2 and ran[0] == first.id
+    db.session.expire_all()
+    assert [job.status for job in Job.query.order_by(Job.id)] == ['done', 'done']
@@ -0,0 +1,87 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import inspect, text
+
+from models import db
+import dedup
+import migrations
+
+# Schema as created by the original release (db.create_all, no migrations)
+BASELINE_SCHEMA = """
+CREATE TABLE universities (
+    id INTEGER NOT NULL, name VARCHAR(200) NOT NULL, url VARCHAR(500), note TEXT, created_at DATETIME,
+    PRIMARY KEY (id)
+);
+CREATE TABLE custom_fields (
+    id INTEGER NOT NULL, name VARCHAR(100) NOT NULL, field_type VARCHAR(20) NOT NULL, options TEXT,
+    "order" INTEGER, PRIMARY KEY (id)
+);
+CREATE TABLE departments (
+    id INTEGER NOT NULL, university_id INTEGER NOT NULL, name VARCHAR(200) NOT NULL, url VARCHAR(500),
+    PRIMARY KEY (id), FOREIGN KEY(university_id) REFERENCES universities (id)
+);
+CREATE TABLE professors (
+    id INTEGER NOT NULL, university_id INTEGER NOT NULL, dept_id INTEGER, name VARCHAR(200) NOT NULL,
+    title VARCHAR(100), email VARCHAR(200), phone VARCHAR(100), photo_url VARCHAR(500),
+    specialty VARCHAR(500), source_url VARCHAR(500), created_at DATETIME, updated_at DATETIME,
+    PRIMARY KEY (id), FOREIGN KEY(university_id) REFERENCES universities (id),
+    FOREIGN KEY(dept_id) REFERENCES departments (id)
+);
+CREATE TABLE sales_info (
+    id INTEGER NOT NULL, professor_id INTEGER NOT NULL, status VARCHAR(50), last_contact DATE,
+    next_contact DATE, memo TEXT, tags TEXT, PRIMARY KEY (id), UNIQUE (professor_id),
+    FOREIGN KEY(professor_id) REFERENCES professors (id)
+);
+CREATE TABLE custom_field_values (
+    id INTEGER NOT NULL, professor_id INTEGER NOT NULL, custom_field_id INTEGER NOT NULL, value TEXT,
+    PRIMARY KEY (id), FOREIGN KEY(professor_id) REFERENCES professors (id),
+    FOREIGN KEY(custom_field_id) REFERENCES custom_fields (id)
+);
+INSERT INTO universities (id, name) VALUES (1, '東京大学');
+INSERT INTO professors (id, university_id, name) VALUES (1, 1, '山田 太郎');
+INSERT INTO sales_info (id, professor_id, status, tags) VALUES (1, 1, '商談中', '["重要", "再訪"]');
+INSERT INTO custom_fields (id, name, field_type, options, "order") VALUES
+    (1, '予算', 'number', '[]', 0), (2, '締切', 'date', '[]', 1), (3, 'メモ', 'text', '[]', 2);
+INSERT INTO custom_field_values (id, professor_id, custom_field_id, value) VALUES
+    (1, 1, 1, '1500000'), (2, 1, 2, '2025-03-31'), (3, 1, 3, 'x');
+"""
+
+
+@pytest.fixture
+def baseline_app(make_app, tmp_path):
+    with sqlite3.connect(tmp_path / 'baseline.db') as conn:
+        conn.executescript(BASELINE_SCHEMA)
+    return make_app('baseline.db')
+
+
+def test_upgrade_from_baseline(baseline_app):
+    done = migrations.upgrade()
+    assert done == [version for version, _, _ in migrations.MIGRATIONS]
+    assert all(applied_at for _, _, applied_at in migrations.status())
+
+    typed = db.session.execute(text(
+        'SELECT id, value_number, value_date FROM custom_field_values ORDER BY id')).all()
+    assert typed[0][1] == 1500000
+    assert str(typed[1][2]) == '2025-03-31'
+    assert typed[2][1:] == (None, None)
+    tags = db.session.execute(text(
+        'SELECT t.name FROM sales_info_tags l JOIN tags t ON t.id = l.tag_id ORDER BY l.position')).scalars().all()
+    assert tags == ['重要', '再訪']
+    columns = {c['name'] for c in inspect(db.engine).get_columns('custom_field_values')}
+    assert {'value_number', 'value_date', 'updated_at'} <= columns
+
+    # A second run has nothing left to do
+    assert migrations.upgrade() == []
+
+
+def test_upgrade_renames_duplicate_names(make_app, tmp_path):
+    with sqlite3.connect(tmp_path / 'baseline.db') as conn:
+        conn.executescript(BASELINE_SCHEMA)
+        conn.execute("INSERT INTO professors (id, university_id, name) VALUES (2, 1, '山田 太郎'), (3, 1, '山田 太郎')")
+    make_app('baseline.db')
+
+    migrations.upgrade()
+    names = db.session.execute(text('SELECT id, name FROM professors ORDER BY id')).all()
+    assert names == [(1, '山田 太郎'), (2, '山田 太郎（重複 #2）'), (3, '山田 太郎（重複 #3）')]
+    assert [group['ids'] for group in dedup.find_duplicates()] == [[1, 2, 3]]
@@ -0,0 +1,41 @@
+import errno
+import os
+
+import requests
+
+import page_cache
+import scraper
+from page_cache import PageCache
+
+
+def test_put_failure_removes_tmp_file(tmp_path, monkeypatch):
+    cache = PageCache(str(tmp_path))
+
+    def disk_full(src, dst):
+        raise OSError(errno.ENOSPC, 'No space left on device')
+
+    monkeypatch.setattr(page_cache.os, 'replace', disk_full)
+    assert cache.put('https://example.ac.jp/', '<html></html>', 'utf-8') is None
+    assert [name for _root, _dirs, names in os.walk(tmp_path) for name in names] == []
+    assert cache.get('https://example.ac.jp/') is None
+
+
+class _Session:
+    def get(self, url, headers=None, timeout=None):
+        resp = requests.Response()
+        resp.status_code = 200
+        resp.url = url
+        resp._content = '<html><body>教授一覧</body></html>'.encode('utf-8')
+        resp.encoding = 'utf-8'
+        return resp
+
+
+def test_fetch_page_survives_unwritable_cache(tmp_path, monkeypatch):
+    blocker = tmp_path / 'cache'
+    blocker.write_text('')  # a file where the cache directory should be
+    monkeypatch.setattr(scraper, 'page_cache', PageCache(str(blocker)))
+    monkeypatch.setattr(scraper, 'get_session', _Session)
+
+    page = scraper.fetch_page('https://example.ac.jp/faculty', offline=False)
+    assert '教授一覧' in page.html
+    assert page.not_modified is False
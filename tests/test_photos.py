@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+
+from models import db, Job, Professor, University
+import jobs
+import photos
+
+
+def _professor(name, photo_url, **values):
+    university = University.query.first()
+    if university is None:
+        university = University(name='東京大学')
+        db.session.add(university)
+        db.session.flush()
+    professor = Professor(university_id=university.id, name=name, photo_url=photo_url, **values)
+    db.session.add(professor)
+    db.session.commit()
+    return professor
+
+
+def _due(professor):
+    professor.photo_retry_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+
+def test_transient_failures_are_retried_with_backoff(app_db, monkeypatch):
+    flaky = _professor('山田 太郎', 'https://example.ac.jp/flaky.jpg')
+    broken = _professor('佐藤 花子', 'https://example.ac.jp/gone.jpg')
+    errors = {flaky.photo_url: photos.PhotoError('timed out', transient=True),
+              broken.photo_url: photos.PhotoError('HTTP 404')}
+
+    def fetch(url):
+        raise errors[url]
+
+    monkeypatch.setattr(photos, 'fetch_thumbnail', fetch)
+    assert photos.sync_photos() == {'stored': 0, 'failed': 2}
+    db.session.expire_all()
+    assert (broken.photo_failures, broken.photo_retry_at) == (0, None)
+    assert flaky.photo_failures == 1
+    assert flaky.photo_retry_at > datetime.utcnow() + photos.RETRY_BASE - timedelta(minutes=1)
+    assert not photos.retries_due()
+    assert photos.sync_photos() == {'stored': 0, 'failed': 0}
+
+    # Each retry doubles the wait, until MAX_RETRIES
+    delays = []
+    for attempt in range(2, photos.MAX_RETRIES + 2):
+        _due(flaky)
+        assert photos.retries_due()
+        before = datetime.utcnow()
+        assert photos.sync_photos() == {'stored': 0, 'failed': 1}
+        db.session.expire_all()
+        assert flaky.photo_failures == attempt
+        if flaky.photo_retry_at:
+            delays.append(flaky.photo_retry_at - before)
+    assert len(delays) == photos.MAX_RETRIES - 1
+    assert all(later > earlier * 1.9 for earlier, later in zip(delays, delays[1:]))
+    assert flaky.photo_retry_at is None and not photos.retries_due()
+
+
+def test_retry_success_clears_failures(app_db, monkeypatch):
+    professor = _professor('山田 太郎', 'https://example.ac.jp/a.jpg', photo_source='https://example.ac.jp/a.jpg',
+                           photo_failures=2)
+    _due(professor)
+    monkeypatch.setattr(photos, 'fetch_thumbnail', lambda url: ('a' * 64, b'jpeg'))
+    assert photos.sync_photos() == {'stored': 1, 'failed': 0}
+    db.session.expire_all()
+    assert (professor.photo_hash, professor.photo_failures, professor.photo_retry_at) == ('a' * 64, 0, None)
+
+
+def test_worker_queues_due_retries(app_db, monkeypatch):
+    professor = _professor('山田 太郎', 'https://example.ac.jp/a.jpg', photo_source='https://example.ac.jp/a.jpg')
+    _due(professor)
+    monkeypatch.setitem(jobs.HANDLERS, 'photos', lambda job: 'ok')
+    jobs.work(app_db, once=True)
+    assert [(job.kind, job.status) for job in Job.query] == [('photos', 'done')]
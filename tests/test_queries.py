@@ -0,0 +1,98 @@
+import base64
+import json
+from datetime import date
+
+import pytest
+from sqlalchemy.orm import selectinload
+
+from models import db, CustomField, CustomFieldValue, Professor, University
+import queries
+
+
+def _cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+@pytest.fixture
+def professors(app_db):
+    university = University(name='東京大学')
+    budget = CustomField(name='予算', field_type='number')
+    deadline = CustomField(name='締切', field_type='date')
+    db.session.add_all([university, budget, deadline])
+    db.session.flush()
+    for i in range(7):
+        professor = Professor(university_id=university.id, name=f'山田 太郎{i}', specialty='機械工学')
+        db.session.add(professor)
+        db.session.flush()
+        db.session.add_all([
+            CustomFieldValue(professor_id=professor.id, custom_field_id=budget.id,
+                             value=str(i * 1000), value_number=i * 1000.0),
+            CustomFieldValue(professor_id=professor.id, custom_field_id=deadline.id,
+                             value=f'2025-01-0{i + 1}', value_date=date(2025, 1, i + 1)),
+        ])
+    db.session.commit()
+    return {'budget': budget.id, 'deadline': deadline.id}
+
+
+def _all_pages(filters):
+    query, keys = queries.professor_query(filters)
+    names, after = [], None
+    while True:
+        page, after = queries.keyset_page(query, after=after, size=3, keys=keys)
+        names += [p.name for p in page]
+        if after is None:
+            return names
+
+
+@pytest.mark.parametrize('filters', [
+    {},
+    {'q': '山田 機械工学'},
+    {'sort': 'cf_{budget}'},
+    {'sort': '-cf_{deadline}'},
+])
+def test_cursors_round_trip(professors, filters):
+    filters = {key: value.format(**professors) for key, value in filters.items()}
+    names = _all_pages(filters)
+    assert sorted(names) == [f'山田 太郎{i}' for i in range(7)]
+    if filters.get('sort', '').startswith('-'):
+        assert names == [f'山田 太郎{i}' for i in reversed(range(7))]
+
+
+@pytest.mark.parametrize('values', [
+    [{'a': 1}, 'x'],
+    [1, {'a': 1}],
+    [True, '山田'],
+    ['1', '山田'],
+    [1],
+    'x',
+])
+def test_crafted_cursor_is_invalid(professors, values):
+    assert queries.decode_cursor(_cursor(values)) is None
+    query, keys = queries.professor_query({})
+    page, _after = queries.keyset_page(query, after=_cursor(values), size=3, keys=keys)
+    assert [p.name for p in page] == ['山田 太郎0', '山田 太郎1', '山田 太郎2']
+
+
+def test_cursor_values_are_typed(professors):
+    _query, keys = queries.professor_query({'sort': f'cf_{professors["deadline"]}'})
+    assert queries.decode_cursor(_cursor([0, '2025-01-02', 3]), keys) == [0, date(2025, 1, 2), 3]
+    assert queries.decode_cursor(_cursor([0, '2025-13-02', 3]), keys) is None
+    assert queries.decode_cursor(_cursor([0, 20250102, 3]), keys) is None
+
+
+def test_iter_batched_keeps_other_objects_attached(professors):
+    university = University.query.one()
+    budget = db.session.get(CustomField, professors['budget'])
+    query, keys = queries.professor_query({})
+    query = query.options(selectinload(Professor.custom_field_values))
+    names = []
+    for professor in queries.iter_batched(query, keys=keys, size=2):
+        names.append(professor.name)
+        assert len(professor.custom_field_values) == 2
+        assert professor.university.name == university.name
+    assert len(names) == 7
+    db.session.expire(university)
+    db.session.expire(budget)
+    assert university.name == '東京大学' and budget.name == '予算'
+    # The batches themselves do not stay in the session
+    assert sum(isinstance(obj, Professor) for obj in db.session) <= 2
@@ -0,0 +1,31 @@
+import dedup
+import scraper
+
+
+def _page(*professors):
+    return [dict({'title': '', 'email': '', 'phone': ''}, **p) for p in professors]
+
+
+def test_merge_professors_shared_name():
+    pages = [
+        _page({'name': '山田 太郎', 'title': '教授'}, {'name': '佐藤 花子'}),
+        _page({'name': '山田 太郎', 'email': 'yamada@example.ac.jp'}, {'name': '鈴木 一郎'}),
+        _page({'name': '佐藤 花子', 'phone': '03-0000-0000'}),
+    ]
+    merged = {p['name']: p for p in scraper.merge_professors(pages)}
+    assert list(merged) == ['山田 太郎', '佐藤 花子', '鈴木 一郎']
+    assert merged['山田 太郎']['title'] == '教授'
+    assert merged['山田 太郎']['email'] == 'yamada@example.ac.jp'
+    assert merged['佐藤 花子']['phone'] == '03-0000-0000'
+
+
+def test_merge_professors_keyed_by_name_key():
+    pages = [
+        _page({'name': '齋藤 太郎', 'title': '教授'}),
+        _page({'name': '斎藤　太郎', 'email': 'saito@example.ac.jp'}, {'name': '高橋 花子'}),
+        _page({'name': '髙橋 花子', 'phone': '03-0000-0000'}),
+    ]
+    merged = scraper.merge_professors(pages, key=dedup.name_key)
+    assert [p['name'] for p in merged] == ['齋藤 太郎', '高橋 花子']
+    assert merged[0]['email'] == 'saito@example.ac.jp'
+    assert merged[1]['phone'] == '03-0000-0000'
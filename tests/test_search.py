@@ -0,0 +1,63 @@
+import pytest
+
+from models import db, Professor, University
+import queries
+import search
+
+NAMES = ['山田 太郎', '山田 花子', '田中 太郎', 'Yamada Taro', '山本 一郎']
+SPECIALTIES = ['機械学習', '有機化学', '機械工学', 'Machine Learning', '応用数学']
+
+
+@pytest.fixture
+def professors(app_db):
+    university = University(name='東京大学')
+    db.session.add(university)
+    db.session.flush()
+    db.session.add_all([
+        Professor(university_id=university.id, name=name, specialty=specialty, email=f'p{i}@example.ac.jp')
+        for i, (name, specialty) in enumerate(zip(NAMES, SPECIALTIES))
+    ])
+    db.session.commit()
+
+
+def _names(q):
+    query, _keys = queries.apply_filters(Professor.query, {'q': q})
+    return sorted(p.name for p in query)
+
+
+@pytest.mark.parametrize('q, expected', [
+    ('山田 太郎', ['山田 太郎']),
+    ('山田', ['山田 太郎', '山田 花子']),
+    ('太郎 機械学習', ['山田 太郎']),
+    ('機械', ['山田 太郎', '田中 太郎']),
+    ('yamada', ['Yamada Taro']),
+    ('LEARNING', ['Yamada Taro']),
+    ('example.ac 山本', ['山本 一郎']),
+])
+def test_index_and_fallback_agree(professors, monkeypatch, q, expected):
+    assert search.available()
+    assert _names(q) == expected
+    monkeypatch.setattr(search, 'available', lambda: False)
+    assert _names(q) == expected
+    monkeypatch.setattr(search, 'bigrams_available', lambda: False)
+    assert _names(q) == expected
+
+
+def test_two_character_terms_use_bigram_index(professors):
+    query, _keys = queries.apply_filters(db.select(Professor.id), {'q': '山田 工学'})
+    plan = ' '.join(row[-1] for row in db.session.execute(db.text(
+        'EXPLAIN QUERY PLAN ' + str(query.compile(compile_kwargs={'literal_binds': True})))))
+    assert 'professor_bigrams' in plan
+    assert 'SCAN professors' not in plan
+    assert db.session.execute(query).scalars().all() == []
+
+
+def test_bigram_index_follows_writes(professors):
+    professor = Professor.query.filter_by(name='山本 一郎').one()
+    professor.name = '佐藤 一郎'
+    db.session.commit()
+    assert _names('佐藤') == ['佐藤 一郎']
+    assert _names('山本') == []
+    db.session.delete(professor)
+    db.session.commit()
+    assert _names('佐藤') == []
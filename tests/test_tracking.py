@@ -0,0 +1,33 @@
+import logging
+from datetime import timedelta
+
+from sqlalchemy import update
+
+from models import db, Professor, University
+import tracking
+
+
+def _warnings(caplog):
+    return [r for r in caplog.records if r.name == 'tracking' and r.levelno == logging.WARNING]
+
+
+def test_long_write_transaction_is_logged(app_db, monkeypatch, caplog):
+    university = University(name='東京大学')
+    db.session.add(university)
+    db.session.commit()
+
+    db.session.add(Professor(university_id=university.id, name='山田 太郎'))
+    db.session.commit()
+    assert _warnings(caplog) == []
+
+    monkeypatch.setattr(tracking, 'OVERLAP', timedelta(0))
+    professor_id = Professor.query.one().id
+    db.session.execute(update(Professor), [{'id': professor_id, 'title': '教授'}])
+    db.session.commit()
+    assert len(_warnings(caplog)) == 1
+
+    # Reads and other tables are not writes to the feed
+    University.query.all()
+    university.note = 'メモ'
+    db.session.commit()
+    assert len(_warnings(caplog)) == 1
@@ -0,0 +1,203 @@
+"""Row change tracking for delta sync.
+
+Professor, SalesInfo and CustomFieldValue carry an indexed ``updated_at``.
+Column defaults and ``onupdate`` cover inserts and updates, including the
+bulk statements. The ``before_flush`` hook below also bumps it when only a
+relationship changed, such as a SalesInfo whose tags were edited. Deleting
+one of these rows through the session records a Tombstone. Bulk deletes
+call ``record_deletes`` themselves.
+
+``changes_since`` serves the feed behind ``/api/v1/changes``. A sync round
+reads everything modified up to the moment it started. It does so in
+batches ordered by ``(updated_at, id)``, which are index range scans, so its
+cost follows the number of changed rows, not the table sizes. Tombstones
+come first so a deleted id that is reused is not lost. Each round starts
+``OVERLAP`` before the previous one ended, so rows from transactions that
+were still open are not missed. Clients must therefore apply items
+idempotently.
+
+``updated_at`` is stamped when a row is flushed, not when its transaction
+commits. A write transaction that stays open for longer than ``OVERLAP``
+after its first flush can commit rows older than the next round's start,
+and those rows are skipped for good. ``OVERLAP`` (``SYNC_OVERLAP_SECONDS``,
+default 60) must therefore exceed the longest write transaction, such as
+a scrape job's ``ingest.sync_pages`` or an importer chunk on a slow
+database. A larger value only makes rounds resend more rows. A commit of
+tracked rows whose first write is older than ``OVERLAP`` is logged as a
+warning.
+"""
+import base64
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, event, or_
+from sqlalchemy.orm import Session, selectinload
+
+from models import db, Professor, SalesInfo, CustomFieldValue, Tombstone
+
+logger = logging.getLogger(__name__)
+
+# entity name -> model, in the order a round returns them (parents first)
+ENTITIES = {
+    'professor': Professor,
+    'sales_info': SalesInfo,
+    'custom_field_value': CustomFieldValue,
+}
+TRACKED = tuple(ENTITIES.values())
+STAGES = ('tombstone',) + tuple(ENTITIES)
+
+OVERLAP = timedelta(seconds=int(os.environ.get('SYNC_OVERLAP_SECONDS', 60)))
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 2000
+
+
+def _entity_name(obj):
+    return next(name for name, model in ENTITIES.items() if isinstance(obj, model))
+
+
+def _professor_id(obj):
+    return obj.id if isinstance(obj, Professor) else obj.professor_id
+
+
+def _mark_write(session, now):
+    session.info.setdefault('tracking_first_write', now)
+
+
+@event.listens_for(Session, 'before_flush')
+def _before_flush(session, flush_context, instances):
+    now = datetime.utcnow()
+    for obj in session.dirty:
+        if isinstance(obj, TRACKED) and session.is_modified(obj):
+            obj.updated_at = now
+            _mark_write(session, now)
+    for obj in session.deleted:
+        if isinstance(obj, TRACKED):
+            session.add(Tombstone(entity=_entity_name(obj), entity_id=obj.id,
+                                  professor_id=_professor_id(obj), deleted_at=now))
+    if any(isinstance(obj, TRACKED) for obj in session.new):
+        _mark_write(session, now)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _on_execute(state):
+    if (state.is_insert or state.is_update) and \
+            state.bind_mapper is not None and issubclass(state.bind_mapper.class_, TRACKED):
+        _mark_write(state.session, datetime.utcnow())
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    first_write = session.info.pop('tracking_first_write', None)
+    if first_write is not None and datetime.utcnow() - first_write > OVERLAP:
+        logger.warning('transaction committed tracked rows %.0fs after its first write; delta sync '
+                       'clients may miss them (raise SYNC_OVERLAP_SECONDS above the longest write transaction)',
+                       (datetime.utcnow() - first_write).total_seconds())
+
+
+@event.listens_for(Session, 'after_rollback')
+def _after_rollback(session):
+    session.info.pop('tracking_first_write', None)
+
+
+def record_deletes(model, rows):
+    """Record tombstones for rows removed with a bulk DELETE.
+
+    ``rows`` are ``(id, professor_id)`` pairs. The caller commits.
+    """
+    if rows:
+        entity = next(name for name, m in ENTITIES.items() if m is model)
+        now = datetime.utcnow()
+        db.session.execute(Tombstone.__table__.insert(), [
+            {'entity': entity, 'entity_id': row_id, 'professor_id': professor_id, 'deleted_at': now}
+            for row_id, professor_id in rows
+        ])
+
+
+# ─── feed ───
+
+def _parse_time(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def decode_token(token):
+    """``(since, until, stage, after)`` from a feed token, or None if it is
+    invalid. An empty token starts a full sync."""
+    if not token:
+        return None, None, 0, None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        since, until, stage, after_time, after_id = json.loads(raw)
+        after = (_parse_time(after_time), int(after_id)) if after_time else None
+        if not 0 <= int(stage) < len(STAGES):
+            return None
+        return _parse_time(since), _parse_time(until), int(stage), after
+    except (TypeError, ValueError):
+        return None
+
+
+def encode_token(since, until, stage, after):
+    raw = json.dumps([
+        since.isoformat() if since else None,
+        until.isoformat() if until else None,
+        stage,
+        after[0].isoformat() if after else None,
+        after[1] if after else None,
+    ], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _batch(stage, since, until, after, limit):
+    if STAGES[stage] == 'tombstone':
+        model, time_col = Tombstone, Tombstone.deleted_at
+    else:
+        model = ENTITIES[STAGES[stage]]
+        time_col = model.updated_at
+    query = model.query.filter(time_col <= until)
+    if since is not None:
+        query = query.filter(time_col > since)
+    if after is not None:
+        query = query.filter(or_(time_col > after[0], and_(time_col == after[0], model.id > after[1])))
+    if model is SalesInfo:
+        query = query.options(selectinload(SalesInfo.tag_links))
+    return query.order_by(time_col, model.id).limit(limit).all()
+
+
+def changes_since(token, limit=DEFAULT_LIMIT):
+    """One page of the feed after ``token``.
+
+    Returns ``{'items': [...], 'next_token': str, 'has_more': bool}``, or
+    None for an invalid token. Items are ``{'type', 'op': 'upsert', 'data'}``
+    or ``{'type', 'op': 'delete', 'id', 'professor_id'}``. While ``has_more``
+    is true the client asks again with ``next_token``. Otherwise it stores
+    the token for its next sync.
+    """
+    decoded = decode_token(token)
+    if decoded is None:
+        return None
+    since, until, stage, after = decoded
+    if until is None:
+        # Start of a round: everything changed up to now
+        until = datetime.utcnow()
+        if since is None:
+            stage = STAGES.index('professor')  # a full sync has nothing to delete
+
+    items = []
+    while stage < len(STAGES) and len(items) < limit:
+        rows = _batch(stage, since, until, after, limit - len(items))
+        for row in rows:
+            if STAGES[stage] == 'tombstone':
+                items.append({'type': row.entity, 'op': 'delete', 'id': row.entity_id,
+                              'professor_id': row.professor_id})
+            else:
+                items.append({'type': STAGES[stage], 'op': 'upsert', 'data': row.to_dict()})
+        if len(items) < limit:
+            stage, after = stage + 1, None
+        else:
+            last = rows[-1]
+            after = (last.deleted_at if STAGES[stage] == 'tombstone' else last.updated_at, last.id)
+
+    if stage < len(STAGES):
+        return {'items': items, 'next_token': encode_token(since, until, stage, after), 'has_more': True}
+    return {'items': items, 'next_token': encode_token(until - OVERLAP, None, 0, None), 'has_more': False}
@@ -0,0 +1,13 @@
+"""ジョブワーカー: `python worker.py` でキューに積まれたスクレイピング等を処理する"""
+import logging
+
+from app import app
+from models import db
+import db_config
+import jobs
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    # Webと同じ statement_timeout・プール計測（CLIコマンドには付けない）
+    db_config.init_engine(app, db)
+    jobs.work(app)